@@ -0,0 +1,222 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Benchmarks of the stages of rendering a legend
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+Times each stage of rendering a legend, for a suite of synthetic specs
+made by MSSSyntheticSpec and for any MSS files given:
+
+    parse       XML text to ElementTree
+    compile     ElementTree to SymbolSpec
+    stream      XML file to SymbolSpec with the streaming loader
+    layout      the legend slots of all symbols
+    draw        the display list of each page
+    optimize    merging the pages and the peephole optimiser
+    save        the display list to PDF bytes
+
+Each stage is run <repeat> times and the minimum and median are recorded,
+together with the size of the PDF and the operator counts. The results are
+written as JSON, and can be compared with the results of another commit:
+
+    python MSSBenchmark.py -o before.json
+    ... change the code ...
+    python MSSBenchmark.py -o after.json --compare before.json
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from reportlab.lib.pagesizes import A4
+import mss2legend
+from MSSLegendDrawing import MSSLegendDrawer
+from MSSSymbolModel import ParseSpecFile, CompileSpec, IterSpecs
+from MSSDisplayList import DisplayList, OptimizeDisplayList
+from MSSSyntheticSpec import SyntheticSpecParams, GenerateSpec
+
+
+STAGES = ('parse', 'compile', 'stream', 'layout', 'draw', 'optimize', 'save')
+
+# The synthetic suite, name -> SyntheticSpecParams arguments
+SUITE = {
+    'small':        dict( symbols=100),
+    'medium':       dict( symbols=1000),
+    'large':        dict( symbols=5000, layers=16),
+    'complex-paths': dict( symbols=1000, pathComplexity=64),
+    'patterns':     dict( symbols=600, patternDensity=1.0, patternTile=0.4),
+    'hatches':      dict( symbols=600, hatchDensity=1.0, hatchSpacing=0.15),
+    'decorations':  dict( symbols=600, decorationDensity=1.0, decorationSpacing=0.3),
+}
+
+
+def _Time( function, repeat):
+    '''
+    Runs <function> <repeat> times, returns (last result, list of seconds)
+    '''
+    times = []
+    result = None
+    for _ in range( repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append( time.perf_counter() - start)
+    return result, times
+
+
+def BenchmarkFile( fileName, repeat=3):
+    '''
+    Runs all the stages on the MSS file <fileName>.
+
+    Returns
+    -------
+    dict
+        stages: stage -> {min, median} in seconds, and the size of the
+        result: symbols, pages, operators before and after optimising,
+        operator counts and PDF bytes
+    '''
+    timings = {}
+    (tree, lines), timings['parse'] = _Time( lambda: ParseSpecFile( fileName), repeat)
+    spec, timings['compile'] = _Time( lambda: CompileSpec( tree.getroot(), lines), repeat)
+    del tree, lines
+    _, timings['stream'] = _Time( lambda: next( IterSpecs( fileName)), repeat)
+
+    def Layout():
+        drawer = MSSLegendDrawer( DisplayList( A4), spec)
+        return drawer.GetSlots()
+    _, timings['layout'] = _Time( Layout, repeat)
+
+    def Draw():
+        pageCount = MSSLegendDrawer( DisplayList( A4), spec).PageCount()
+        return [mss2legend.RenderPage( spec, pageNo) for pageNo in range( pageCount)]
+    pages, timings['draw'] = _Time( Draw, repeat)
+
+    def Optimize():
+        return OptimizeDisplayList( mss2legend.MergePages( pages))
+    (displayList, removed), timings['optimize'] = _Time( Optimize, repeat)
+
+    pdf, timings['save'] = _Time( lambda: mss2legend.LegendBytes( displayList), repeat)
+
+    return {
+        'stages': { stage: { 'min': min( timings[stage]), 'median': statistics.median( timings[stage])}
+                    for stage in STAGES},
+        'total': sum( min( timings[stage]) for stage in STAGES if stage != 'stream'),
+        'symbols': len( spec.symbols),
+        'pages': len( pages),
+        'operators': len( displayList) + removed,
+        'operatorsRemoved': removed,
+        'opCounts': displayList.OpCounts(),
+        'pdfBytes': len( pdf),
+    }
+
+
+def RunSuite( names=None, files=(), repeat=3, progress=None):
+    '''
+    Benchmarks the synthetic specs <names> of SUITE, all if None, and the
+    MSS <files>. Returns the results as a dict ready for JSON.
+    '''
+    cases = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in (names if names is not None else SUITE):
+            params = SyntheticSpecParams( **SUITE[name])
+            fileName = os.path.join( tmp, name + ".xml")
+            with open( fileName, 'w', encoding='utf-8') as f:
+                f.write( GenerateSpec( params))
+            if progress:
+                progress( name)
+            result = BenchmarkFile( fileName, repeat)
+            result.update( name=name, params=params.AsDict(), xmlBytes=os.path.getsize( fileName))
+            cases.append( result)
+    for fileName in files:
+        if progress:
+            progress( fileName)
+        result = BenchmarkFile( fileName, repeat)
+        result.update( name=fileName, xmlBytes=os.path.getsize( fileName))
+        cases.append( result)
+
+    return {
+        'commit': _GitCommit(),
+        'time': time.strftime( '%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'cases': cases,
+    }
+
+
+def _GitCommit():
+    try:
+        return subprocess.run( ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname( os.path.abspath( __file__)),
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def Report( results, baseline=None):
+    '''
+    Returns the results as a text table, with the ratio to the <baseline>
+    results of the same cases when given
+    '''
+    old = { case['name']: case for case in baseline['cases']} if baseline else {}
+    columns = STAGES + ('total',)
+    lines = ["%-16s" % "case" + "".join( "%11s" % c for c in columns) + "%11s%11s" % ("ops", "PDF kB")]
+    for case in results['cases']:
+        values = [case['stages'][s]['min'] for s in STAGES] + [case['total']]
+        lines.append( "%-16s" % case['name'][-16:] + "".join( "%11.1f" % (v * 1000) for v in values) +
+                      "%11d%11.1f" % (case['operators'] - case['operatorsRemoved'], case['pdfBytes'] / 1024))
+        before = old.get( case['name'])
+        if before:
+            oldValues = [before['stages'][s]['min'] for s in STAGES] + [before['total']]
+            ratios = ["%10.2fx" % (v / o) if o else "%11s" % "-" for v, o in zip( values, oldValues)]
+            oldOps = before['operators'] - before['operatorsRemoved']
+            lines.append( "%-16s" % "  vs baseline" + "".join( ratios) +
+                          "%10.2fx%10.2fx" % ((case['operators'] - case['operatorsRemoved']) / max( oldOps, 1),
+                                              case['pdfBytes'] / max( before['pdfBytes'], 1)))
+    lines.append( "times are the minimum of %d runs in ms, commit %s" % (results['repeat'], results['commit']))
+    return "\n".join( lines)
+
+
+def main( argv=None):
+    parser = argparse.ArgumentParser(
+        prog='mss-benchmark', description="Times the stages of rendering legends.")
+    parser.add_argument( 'files', nargs='*', metavar='MSS', help="MSS files to benchmark besides the suite")
+    parser.add_argument( '--case', action='append', choices=sorted( SUITE),
+                         help="synthetic case to run, may be repeated (default: all)")
+    parser.add_argument( '--no-suite', action='store_true', help="only benchmark the files given")
+    parser.add_argument( '-r', '--repeat', type=int, default=3, help="runs of each stage (default: %(default)s)")
+    parser.add_argument( '-o', '--output', help="write the results to this JSON file")
+    parser.add_argument( '--compare', metavar='JSON', help="compare with the results in this JSON file")
+    args = parser.parse_args( argv)
+
+    names = [] if args.no_suite else args.case
+    results = RunSuite( names, args.files, args.repeat,
+                        progress=lambda name: print( "benchmarking", name, file=sys.stderr))
+    if args.output:
+        with open( args.output, 'w', encoding='utf-8') as f:
+            json.dump( results, f, indent=1, sort_keys=True)
+    baseline = None
+    if args.compare:
+        with open( args.compare, encoding='utf-8') as f:
+            baseline = json.load( f)
+    print( Report( results, baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit( main())
@@ -0,0 +1,114 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Resolved colours of the colour layers
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+from collections import namedtuple
+
+
+# The blend modes of the MSS DTD, which are the SVG blend modes
+BLEND_MODES = ('normal', 'multiply', 'screen', 'overlay', 'darken', 'lighten',
+               'color-dodge', 'color-burn', 'hard-light', 'soft-light',
+               'difference', 'exclusion', 'hue', 'saturation', 'color', 'luminosity')
+
+def PdfBlendMode( blend):
+    '''
+    Returns the PDF name of the blend mode <blend>, like ColorBurn for
+    color-burn, as used by canvas.setBlendMode()
+    '''
+    return "".join( word.capitalize() for word in blend.split( '-'))
+
+
+def CmykToRgb( c, m, y, k):
+    '''
+    Naive conversion of CMYK to RGB, all values in the range 0 to 1.
+    No colour management is applied.
+    '''
+    return ((1.0 - c) * (1.0 - k),
+            (1.0 - m) * (1.0 - k),
+            (1.0 - y) * (1.0 - k))
+
+
+class LayerColor(namedtuple( 'LayerColor', 'id cmyk opacity blend overprint rgb srgb')):
+    '''
+    The resolved colour of a colour layer.
+
+    id : string
+        The id of the colour layer
+    cmyk : tuple of 4 floats
+        The base colour with the tint of the layer applied, range 0 to 1
+    opacity : float
+        The opacity of the layer, range 0 to 1
+    blend : string
+        The blend mode of the layer, one of BLEND_MODES
+    overprint : bool
+        True if the layer is to be overprinted
+    rgb : tuple of 3 floats
+        The RGB equivalent of cmyk, range 0 to 1
+    srgb : tuple of 3 ints
+        The 8 bit sRGB equivalent of cmyk, range 0 to 255
+    '''
+    __slots__ = ()
+
+    @property
+    def hex( self):
+        '''
+        The sRGB colour on the form "#rrggbb"
+        '''
+        return "#%02x%02x%02x" % self.srgb
+
+
+def ResolveLayerColor( layer):
+    '''
+    Returns the LayerColor of a ColorLayer
+    '''
+    tint = layer.tint
+    c, m, y, k = [x * tint for x in layer.color.cmyk]
+    rgb = CmykToRgb( c, m, y, k)
+    srgb = tuple( int( round( min( max( x, 0.0), 1.0) * 255)) for x in rgb)
+    return LayerColor( layer.id, (c, m, y, k), layer.opacity, layer.blend,
+                       layer.overprint, rgb, srgb)
+
+
+class ColorTable(object):
+    '''
+    The resolved colours of all the colour layers of a spec. It is built
+    once when the spec is compiled, and is used by all the backends.
+    Lookup is by ColorLayer or by layer id:
+
+        color = spec.colors[layer]
+        color = spec.colors['black100']
+    '''
+
+    def __init__( self, colorLayers):
+        self._colors = {}
+        for layer in colorLayers:
+            self._colors[layer.id] = ResolveLayerColor( layer)
+
+    def __getitem__( self, layer):
+        if isinstance( layer, str):
+            return self._colors[layer]
+        return self._colors[layer.id]
+
+    def __contains__( self, layer):
+        if isinstance( layer, str):
+            return layer in self._colors
+        return layer.id in self._colors
+
+    def __iter__( self):
+        return iter( self._colors.values())
+
+    def __len__( self):
+        return len( self._colors)
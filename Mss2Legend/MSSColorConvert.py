@@ -0,0 +1,413 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Cached CMYK to RGB conversion for the screen backends
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+The SVG and PNG backends show CMYK colours as RGB. A ColorConverter does
+the conversion in one of two ways:
+
+    naive       MSSColor.CmykToRgb(), no colour management
+    profile     a 4D lookup table of <gridSize> points per ink, sampled
+                once from a CMYK ICC profile to sRGB by LittleCMS, and
+                interpolated quadrilinearly
+
+The profile is a local file, given explicitly or found in PROFILE_DIRS by
+the ICC and ISO <calibration> values of the base colours, matched against
+the file names and descriptions of the profiles. Building the table needs
+Pillow with ImageCms; without it the naive conversion is used. Tables are
+cached per profile file for the life of the process.
+
+The PMS, RAL and NCS <calibration> values can be given reference sRGB
+colours in a JSON file,
+
+    { "PMS": { "PANTONE 7608 CP": "#9c4e2e", ... }, "RAL": { ... } }
+
+The layers of the base colours found in it are shown with the reference
+colour, mixed with white by the tint of the layer, instead of a converted
+one.
+
+Single colours are converted through a cache, so each layer colour is
+converted once. Whole CMYK buffers are quantised to 8 bits per ink and
+only their distinct colours are converted, in one vectorised batch.
+'''
+
+import os
+import json
+import logging
+import numpy as np
+from MSSColor import CmykToRgb
+from MSSError import ColorError
+
+try:
+    from PIL import Image, ImageCms
+except ImportError:
+    ImageCms = None
+
+
+log = logging.getLogger( __name__)
+
+# Directories searched for profiles named by <calibration> values
+PROFILE_DIRS = ('/usr/share/color/icc', '/usr/local/share/color/icc',
+                os.path.expanduser( '~/.local/share/icc'), os.path.expanduser( '~/.color/icc'))
+
+PROFILE_EXTENSIONS = ('.icc', '.icm')
+
+# The calibration standards that name a profile, and those with reference colours
+PROFILE_STANDARDS = ('ICC', 'ISO')
+REFERENCE_STANDARDS = ('PMS', 'RAL', 'NCS')
+
+# The rendering intent of the lookup tables, relative colorimetric
+_INTENT = 1
+
+# Lookup tables by (path, mtime, size, gridSize), see BuildLut()
+_luts = {}
+
+# Profile file names and descriptions by directory list, see FindProfile()
+_profileIndex = {}
+
+# Converters by profile and reference colours, see ConverterForSpec()
+_converters = {}
+_MAX_CONVERTERS = 32
+
+
+def _Hex( rgb):
+    return "#%02x%02x%02x" % tuple( int( round( min( max( v, 0.0), 1.0) * 255)) for v in rgb)
+
+
+def _Pack( q):
+    '''
+    Returns the uint32 keys of the 8 bit CMYK values <q>, shape (..., 4)
+    '''
+    q = q.astype( np.uint32)
+    return (q[..., 0] << 24) | (q[..., 1] << 16) | (q[..., 2] << 8) | q[..., 3]
+
+
+def _Key( c, m, y, k):
+    '''
+    Returns the key of one colour, as _Pack() of the quantised colour
+    '''
+    q = [int( min( max( v, 0.0), 1.0) * 255 + 0.5) for v in (c, m, y, k)]
+    return (q[0] << 24) | (q[1] << 16) | (q[2] << 8) | q[3]
+
+
+def BuildLut( profileName, gridSize=17):
+    '''
+    Samples the conversion of the CMYK ICC profile <profileName> to sRGB
+    on a grid of <gridSize> points per ink, cached per profile file.
+
+    Returns
+    -------
+    numpy array
+        float32, shape (gridSize, gridSize, gridSize, gridSize, 3), the
+        RGB values 0 to 1 indexed by the C, M, Y and K grid points
+
+    Raises
+    ------
+    ColorError
+        ImageCms is not available, or the file is not a CMYK profile
+    '''
+    if ImageCms is None:
+        raise ColorError( "Pillow with ImageCms is needed for the ICC profile %s", profileName)
+    try:
+        path = os.path.realpath( profileName)
+        st = os.stat( path)
+    except OSError as e:
+        raise ColorError( "ICC profile %s: %s", (profileName, e.strerror)) from None
+    key = (path, st.st_mtime_ns, st.st_size, gridSize)
+    lut = _luts.get( key)
+    if lut is not None:
+        return lut
+
+    try:
+        profile = ImageCms.getOpenProfile( path)
+    except (OSError, ImageCms.PyCMSError) as e:
+        raise ColorError( "ICC profile %s can not be read: %s", (profileName, e)) from None
+    if profile.profile.xcolor_space.strip() != 'CMYK':
+        raise ColorError( "ICC profile %s is not a CMYK profile", profileName)
+    transform = ImageCms.buildTransform( profile, ImageCms.createProfile( 'sRGB'), 'CMYK', 'RGB',
+                                         renderingIntent=_INTENT)
+
+    axis = np.round( np.linspace( 0, 255, gridSize)).astype( np.uint8)
+    grid = np.stack( np.meshgrid( axis, axis, axis, axis, indexing='ij'), axis=-1).reshape( -1, 4)
+    image = Image.frombytes( 'CMYK', (len( grid), 1), grid.tobytes())
+    rgb = np.asarray( ImageCms.applyTransform( image, transform), dtype=np.float32)
+    lut = (rgb.reshape( (gridSize,) * 4 + (3,)) / 255.0)
+    log.info( "Built a %d^4 colour table from %s", gridSize, profileName)
+
+    for oldKey in [k for k in _luts if k[0] == path]:
+        del _luts[oldKey]
+    _luts[key] = lut
+    return lut
+
+
+def InterpolateLut( lut, cmyk):
+    '''
+    Returns the RGB values of the CMYK colours <cmyk>, shape (n, 4), by
+    quadrilinear interpolation of the lookup table <lut>, see BuildLut()
+    '''
+    last = lut.shape[0] - 1
+    position = np.clip( cmyk, 0.0, 1.0) * last
+    index = np.minimum( position.astype( np.intp), last - 1)
+    fraction = (position - index).astype( np.float32)
+    rgb = np.zeros( (len( cmyk), 3), dtype=np.float32)
+    for corner in range( 16):
+        weight = np.ones( len( cmyk), dtype=np.float32)
+        at = []
+        for ink in range( 4):
+            if (corner >> ink) & 1:
+                weight *= fraction[:, ink]
+                at.append( index[:, ink] + 1)
+            else:
+                weight *= 1.0 - fraction[:, ink]
+                at.append( index[:, ink])
+        rgb += weight[:, None] * lut[tuple( at)]
+    return rgb
+
+
+class ColorConverter(object):
+    '''
+    Converts CMYK colours to RGB with the CMYK ICC profile <profile>, a
+    file name, or with the naive formula if it is None. All values are in
+    the range 0 to 1.
+    '''
+
+    def __init__( self, profile=None, gridSize=17):
+        self.profile = profile
+        self._lut = BuildLut( profile, gridSize) if profile else None
+        self._references = {}   # _Key() -> (r, g, b) of the calibrated colours
+        self._colors = {}       # (c, m, y, k) -> (r, g, b)
+        self._hex = {}          # (c, m, y, k) -> "#rrggbb"
+
+    def SetReference( self, cmyk, rgb):
+        '''
+        Shows the CMYK colour <cmyk> as <rgb> instead of converting it
+        '''
+        self._references[_Key( *cmyk)] = tuple( rgb)
+        self._colors.clear()
+        self._hex.clear()
+
+    def Convert( self, c, m, y, k):
+        '''
+        Returns the (r, g, b) of one colour
+        '''
+        key = (c, m, y, k)
+        rgb = self._colors.get( key)
+        if rgb is None:
+            rgb = self._references.get( _Key( c, m, y, k)) if self._references else None
+            if rgb is None:
+                if self._lut is not None:
+                    rgb = tuple( float( v) for v in InterpolateLut( self._lut, np.array( [key], dtype=np.float32))[0])
+                else:
+                    rgb = CmykToRgb( c, m, y, k)
+            self._colors[key] = rgb
+        return rgb
+
+    def Hex( self, c, m, y, k):
+        '''
+        Returns one colour on the form "#rrggbb"
+        '''
+        key = (c, m, y, k)
+        text = self._hex.get( key)
+        if text is None:
+            text = self._hex[key] = _Hex( self.Convert( c, m, y, k))
+        return text
+
+    def ConvertArray( self, cmyk):
+        '''
+        Converts the CMYK buffer <cmyk>, shape (..., 4), to 8 bit RGB of
+        shape (..., 3). With a profile or reference colours, the buffer is
+        quantised to 8 bits per ink and each distinct colour is converted
+        once.
+        '''
+        if (self._lut is None) and not self._references:
+            rgb = np.stack( CmykToRgb( cmyk[..., 0], cmyk[..., 1], cmyk[..., 2], cmyk[..., 3]), axis=-1)
+            return (np.clip( rgb, 0.0, 1.0) * 255 + 0.5).astype( np.uint8)
+
+        keys = _Pack( (np.clip( cmyk, 0.0, 1.0) * 255 + 0.5).astype( np.uint8))
+        unique, inverse = np.unique( keys.ravel(), return_inverse=True)
+        colors = np.stack( [(unique >> shift) & 0xff for shift in (24, 16, 8, 0)], axis=-1).astype( np.float32) / 255
+        if self._lut is not None:
+            rgb = InterpolateLut( self._lut, colors)
+        else:
+            rgb = np.stack( CmykToRgb( colors[:, 0], colors[:, 1], colors[:, 2], colors[:, 3]), axis=-1)
+        for key, reference in self._references.items():
+            at = np.searchsorted( unique, key)
+            if (at < len( unique)) and (unique[at] == key):
+                rgb[at] = reference
+        table = (np.clip( rgb, 0.0, 1.0) * 255 + 0.5).astype( np.uint8)
+        return table[inverse].reshape( cmyk.shape[:-1] + (3,))
+
+
+_default = ColorConverter()
+
+def DefaultConverter():
+    '''
+    Returns the shared naive ColorConverter
+    '''
+    return _default
+
+
+def _ProfileIndex( directories):
+    '''
+    Returns a list of (path, name) of the profiles in <directories>, name
+    the lower case file name and description
+    '''
+    key = tuple( directories)
+    index = _profileIndex.get( key)
+    if index is not None:
+        return index
+    index = []
+    for directory in directories:
+        try:
+            fileNames = sorted( os.listdir( directory))
+        except OSError:
+            continue
+        for fileName in fileNames:
+            if not fileName.lower().endswith( PROFILE_EXTENSIONS):
+                continue
+            path = os.path.join( directory, fileName)
+            name = fileName
+            if ImageCms is not None:
+                try:
+                    name += "\n" + ImageCms.getProfileDescription( path)
+                except (OSError, ImageCms.PyCMSError):
+                    pass
+            index.append( (path, name.lower()))
+    _profileIndex[key] = index
+    return index
+
+
+def FindProfile( spec, directories=None):
+    '''
+    Returns the file name of the first profile in <directories>, by
+    default PROFILE_DIRS, whose file name or description contains an ICC
+    or ISO <calibration> value of the base colours of <spec>, or None
+    '''
+    values = [value.lower() for color in spec.baseColors
+              for standard, value in color.calibrations
+              if (standard in PROFILE_STANDARDS) and value]
+    if not values:
+        return None
+    index = _ProfileIndex( PROFILE_DIRS if directories is None else directories)
+    for value in dict.fromkeys( values):
+        for path, name in index:
+            if value in name:
+                return path
+    log.info( "No ICC profile found for %s", ", ".join( values))
+    return None
+
+
+def LoadReferenceColors( fileName):
+    '''
+    Reads a JSON file of reference colours, see the module documentation.
+
+    Returns
+    -------
+    dict
+        standard -> { value -> (r, g, b)}
+
+    Raises
+    ------
+    ColorError
+        The file can not be read, or a colour is not "#rrggbb"
+    '''
+    try:
+        with open( fileName, encoding='utf-8') as f:
+            table = json.load( f)
+    except OSError as e:
+        raise ColorError( "Reference colours %s: %s", (fileName, e.strerror)) from None
+    except ValueError as e:
+        raise ColorError( "Reference colours %s: %s", (fileName, e)) from None
+    if not isinstance( table, dict):
+        raise ColorError( "Reference colours %s: not a table of standards", fileName)
+
+    result = {}
+    for standard, colors in table.items():
+        if not isinstance( colors, dict):
+            raise ColorError( "Reference colours %s: %s is not a table of colours", (fileName, standard))
+        result[standard] = {}
+        for value, text in colors.items():
+            if not (isinstance( text, str) and (len( text) == 7) and text.startswith( '#')):
+                raise ColorError( "Reference colours %s: %s %s is not #rrggbb", (fileName, standard, value))
+            try:
+                result[standard][value] = tuple( int( text[i:i + 2], 16) / 255.0 for i in (1, 3, 5))
+            except ValueError:
+                raise ColorError( "Reference colours %s: %s %s is not #rrggbb", (fileName, standard, value)) from None
+    return result
+
+
+def ConverterForSpec( spec, profile=None, referenceColors=None):
+    '''
+    Returns the ColorConverter for showing the colour layers of <spec>.
+
+    Parameters
+    ----------
+    spec : SymbolSpec
+    profile : string, optional
+        The CMYK ICC profile to use. If None, the profile is looked for by
+        FindProfile(), and the naive conversion used if none is found or
+        the one found can not be used.
+    referenceColors : dict, optional
+        The reference colours of the calibrations, see LoadReferenceColors()
+
+    Raises
+    ------
+    ColorError
+        The <profile> given can not be used
+    '''
+    found = profile is None
+    if found:
+        profile = FindProfile( spec)
+        if (profile is not None) and (ImageCms is None):
+            log.warning( "Pillow with ImageCms is not installed, %s is not used", profile)
+            profile = None
+
+    references = []
+    if referenceColors:
+        for layer in spec.colorLayers:
+            for standard, value in layer.color.calibrations:
+                rgb = referenceColors.get( standard, {}).get( value) if standard in REFERENCE_STANDARDS else None
+                if rgb is not None:
+                    tint = layer.tint
+                    references.append( (spec.colors[layer].cmyk, tuple( 1.0 - tint * (1.0 - v) for v in rgb)))
+                    break
+    if (profile is None) and not references:
+        return _default
+
+    profileKey = None
+    if profile:
+        try:
+            st = os.stat( profile)
+            profileKey = (os.path.realpath( profile), st.st_mtime_ns, st.st_size)
+        except OSError:
+            profileKey = profile
+    key = (profileKey, tuple( references))
+    converter = _converters.get( key)
+    if converter is None:
+        try:
+            converter = ColorConverter( profile)
+        except ColorError as e:
+            if not found:
+                raise
+            # the fallback is cached too, so the warning is given once
+            log.warning( "%s, using the naive conversion", e)
+            converter = ColorConverter() if references else _default
+        for cmyk, rgb in references:
+            converter.SetReference( cmyk, rgb)
+        if len( _converters) >= _MAX_CONVERTERS:
+            _converters.clear()
+        _converters[key] = converter
+    return converter
@@ -0,0 +1,471 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Backend neutral display list of drawing operations
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+The legend is drawn once into a DisplayList, which records the drawing
+operations in compact arrays. The list is then replayed to any canvas
+with the reportlab canvas methods, like a reportlab canvas for PDF or an
+SvgCanvas, without walking the symbol specification again.
+
+The DisplayList itself has the subset of the reportlab canvas methods
+used by the drawing code, so the drawing code does not know whether it
+draws to a display list or directly to a canvas.
+'''
+
+import array
+import math
+import json
+import zlib
+from MSSPath import PathBuilder, SvgPathIR
+
+
+# Operators. The number of float arguments of each is in OP_ARG_COUNT.
+# Paths, dash arrays, names and strings are kept in the object table,
+# and referenced by their index.
+OP_SAVE = 0             # -
+OP_RESTORE = 1          # -
+OP_TRANSFORM = 2        # a b c d e f
+OP_STROKE_CMYK = 3      # c m y k
+OP_FILL_CMYK = 4        # c m y k
+OP_STROKE_OVERPRINT = 5 # flag
+OP_FILL_OVERPRINT = 6   # flag
+OP_STROKE_ALPHA = 7     # alpha
+OP_FILL_ALPHA = 8       # alpha
+OP_LINE_WIDTH = 9       # width
+OP_DASH = 10            # object(dash array) phase
+OP_LINE_CAP = 11        # cap
+OP_LINE_JOIN = 12       # join
+OP_MITER_LIMIT = 13     # limit
+OP_PATH = 14            # object(SvgPathIR) stroke fill
+OP_CLIP = 15            # object(SvgPathIR) stroke fill
+OP_CIRCLE = 16          # cx cy r stroke fill
+OP_RECT = 17            # x y width height stroke fill
+OP_BEGIN_FORM = 18      # object(name) llx lly urx ury
+OP_END_FORM = 19        # -
+OP_DO_FORM = 20         # object(name)
+OP_FONT = 21            # object(font name) size
+OP_TEXT = 22            # x y object(text)
+OP_SHOW_PAGE = 23       # -
+OP_BLEND_MODE = 24      # object(PDF name of the blend mode)
+
+# Version of the format written by DisplayList.ToBytes()
+_SERIAL_VERSION = 1
+
+OP_ARG_COUNT = (0, 0, 6, 4, 4, 1, 1, 1, 1, 1, 2, 1, 1, 1, 3, 3, 5, 6, 5, 0, 1, 2, 3, 0, 1)
+
+OP_NAMES = ('save', 'restore', 'transform', 'stroke-cmyk', 'fill-cmyk',
+            'stroke-overprint', 'fill-overprint', 'stroke-alpha', 'fill-alpha',
+            'line-width', 'dash', 'line-cap', 'line-join', 'miter-limit',
+            'path', 'clip', 'circle', 'rect', 'begin-form', 'end-form',
+            'do-form', 'font', 'text', 'show-page', 'blend-mode')
+
+
+class DisplayList(object):
+    '''
+    A recorded sequence of drawing operations. ops holds one operator per
+    operation, args the float arguments of all operations as one flat
+    array, and objects the paths, dash arrays and strings they refer to.
+    '''
+
+    def __init__( self, pagesize):
+        self._pagesize = pagesize
+        self.ops = array.array( 'B')
+        self.args = array.array( 'd')
+        self.objects = []
+
+    def __len__( self):
+        return len( self.ops)
+
+    def _Add( self, op, *args):
+        self.ops.append( op)
+        self.args.extend( args)
+
+    def _Object( self, obj):
+        self.objects.append( obj)
+        return len( self.objects) - 1
+
+    def ByteSize( self):
+        '''
+        Returns the number of bytes used by the operators and arguments
+        '''
+        return len( self.ops) * self.ops.itemsize + len( self.args) * self.args.itemsize
+
+    def OpCounts( self):
+        '''
+        Returns a dict from operator name to the number of operations
+        '''
+        counts = {}
+        for op in self.ops:
+            name = OP_NAMES[op]
+            counts[name] = counts.get( name, 0) + 1
+        return counts
+
+    def Operations( self):
+        '''
+        Yields (op, args) for each operation, args is a tuple of floats.
+        '''
+        args = self.args
+        i = 0
+        for op in self.ops:
+            n = OP_ARG_COUNT[op]
+            yield op, tuple( args[i:i+n])
+            i += n
+
+    #-----------------------------------------------------------------------
+    # Recording, same methods as a reportlab canvas
+    #-----------------------------------------------------------------------
+
+    def saveState( self):
+        self._Add( OP_SAVE)
+
+    def restoreState( self):
+        self._Add( OP_RESTORE)
+
+    def transform( self, a, b, c, d, e, f):
+        self._Add( OP_TRANSFORM, a, b, c, d, e, f)
+
+    def translate( self, dx, dy):
+        self._Add( OP_TRANSFORM, 1, 0, 0, 1, dx, dy)
+
+    def scale( self, x, y):
+        self._Add( OP_TRANSFORM, x, 0, 0, y, 0, 0)
+
+    def rotate( self, theta):
+        theta *= math.pi / 180
+        c = math.cos( theta)
+        s = math.sin( theta)
+        self._Add( OP_TRANSFORM, c, s, -s, c, 0, 0)
+
+    def setStrokeColorCMYK( self, c, m, y, k):
+        self._Add( OP_STROKE_CMYK, c, m, y, k)
+
+    def setFillColorCMYK( self, c, m, y, k):
+        self._Add( OP_FILL_CMYK, c, m, y, k)
+
+    def setStrokeOverprint( self, overprint):
+        self._Add( OP_STROKE_OVERPRINT, bool( overprint))
+
+    def setFillOverprint( self, overprint):
+        self._Add( OP_FILL_OVERPRINT, bool( overprint))
+
+    def setStrokeAlpha( self, alpha):
+        self._Add( OP_STROKE_ALPHA, alpha)
+
+    def setFillAlpha( self, alpha):
+        self._Add( OP_FILL_ALPHA, alpha)
+
+    def setBlendMode( self, mode):
+        self._Add( OP_BLEND_MODE, self._Object( mode))
+
+    def setLineWidth( self, width):
+        self._Add( OP_LINE_WIDTH, width)
+
+    def setDash( self, array=[], phase=0):
+        self._Add( OP_DASH, self._Object( tuple( array)), phase)
+
+    def setLineCap( self, mode):
+        self._Add( OP_LINE_CAP, mode)
+
+    def setLineJoin( self, mode):
+        self._Add( OP_LINE_JOIN, mode)
+
+    def setMiterLimit( self, limit):
+        self._Add( OP_MITER_LIMIT, limit)
+
+    def beginPath( self):
+        return PathBuilder()
+
+    def drawPath( self, aPath, stroke=1, fill=0):
+        self._Add( OP_PATH, self._Object( aPath.Compile()), stroke, fill)
+
+    def clipPath( self, aPath, stroke=1, fill=0):
+        self._Add( OP_CLIP, self._Object( aPath.Compile()), stroke, fill)
+
+    def circle( self, x_cen, y_cen, r, stroke=1, fill=0):
+        self._Add( OP_CIRCLE, x_cen, y_cen, r, stroke, fill)
+
+    def rect( self, x, y, width, height, stroke=1, fill=0):
+        self._Add( OP_RECT, x, y, width, height, stroke, fill)
+
+    def beginForm( self, name, lowerx=0, lowery=0, upperx=None, uppery=None):
+        if upperx is None:
+            upperx = self._pagesize[0]
+        if uppery is None:
+            uppery = self._pagesize[1]
+        self._Add( OP_BEGIN_FORM, self._Object( name), lowerx, lowery, upperx, uppery)
+
+    def endForm( self):
+        self._Add( OP_END_FORM)
+
+    def doForm( self, name):
+        self._Add( OP_DO_FORM, self._Object( name))
+
+    def setFont( self, psfontname, size):
+        self._Add( OP_FONT, self._Object( psfontname), size)
+
+    def drawString( self, x, y, text):
+        self._Add( OP_TEXT, x, y, self._Object( text))
+
+    def showPage( self):
+        self._Add( OP_SHOW_PAGE)
+
+    #-----------------------------------------------------------------------
+    # Serialisation
+    #-----------------------------------------------------------------------
+
+    def ToBytes( self):
+        '''
+        Returns the display list as compressed JSON, see FromBytes()
+        '''
+        objects = []
+        for obj in self.objects:
+            if isinstance( obj, str):
+                objects.append( obj)
+            elif isinstance( obj, tuple):
+                objects.append( { 'tuple': list( obj)})
+            else:
+                objects.append( { 'path': [list( obj.ops), obj.coords.tolist()]})
+        data = { 'version': _SERIAL_VERSION,
+                 'pagesize': list( self._pagesize),
+                 'ops': self.ops.tolist(),
+                 'args': self.args.tolist(),
+                 'objects': objects}
+        return zlib.compress( json.dumps( data, separators=(',', ':')).encode( 'utf-8'))
+
+    @classmethod
+    def FromBytes( cls, data):
+        '''
+        Recreates a display list saved with ToBytes(). Raises ValueError
+        if <data> is not a display list of this version.
+        '''
+        try:
+            data = json.loads( zlib.decompress( data).decode( 'utf-8'))
+        except (zlib.error, UnicodeDecodeError) as e:
+            raise ValueError( "not a display list: %s" % e)
+        if not isinstance( data, dict) or (data.get( 'version') != _SERIAL_VERSION):
+            raise ValueError( "not a display list of version %d" % _SERIAL_VERSION)
+        result = cls( tuple( data['pagesize']))
+        result.ops = array.array( 'B', data['ops'])
+        result.args = array.array( 'd', data['args'])
+        for obj in data['objects']:
+            if isinstance( obj, str):
+                result.objects.append( obj)
+            elif 'tuple' in obj:
+                result.objects.append( tuple( obj['tuple']))
+            else:
+                ops, coords = obj['path']
+                result.objects.append( SvgPathIR( bytes( ops), array.array( 'd', coords)))
+        return result
+
+    #-----------------------------------------------------------------------
+    # Replay
+    #-----------------------------------------------------------------------
+
+    def Replay( self, canvas, definedForms=None):
+        '''
+        Draws all the recorded operations onto <canvas>, which is a reportlab
+        canvas or any object with the same methods.
+
+        When splicing several display lists into one canvas, <definedForms>
+        is the set of the names of the forms already defined on the canvas.
+        Definitions of those forms are skipped, and the names of the forms
+        defined are added to the set.
+        '''
+        args = self.args
+        objects = self.objects
+        skipping = False
+        i = 0
+        for op in self.ops:
+            n = OP_ARG_COUNT[op]
+            a = args[i:i+n]
+            i += n
+            if skipping:
+                skipping = (op != OP_END_FORM)
+                continue
+            if op == OP_PATH or op == OP_CLIP:
+                p = canvas.beginPath()
+                objects[int(a[0])].Replay( p)
+                if op == OP_PATH:
+                    canvas.drawPath( p, stroke=int(a[1]), fill=int(a[2]))
+                else:
+                    canvas.clipPath( p, stroke=int(a[1]), fill=int(a[2]))
+            elif op == OP_SAVE:
+                canvas.saveState()
+            elif op == OP_RESTORE:
+                canvas.restoreState()
+            elif op == OP_TRANSFORM:
+                canvas.transform( *a)
+            elif op == OP_STROKE_CMYK:
+                canvas.setStrokeColorCMYK( *a)
+            elif op == OP_FILL_CMYK:
+                canvas.setFillColorCMYK( *a)
+            elif op == OP_STROKE_OVERPRINT:
+                canvas.setStrokeOverprint( bool( a[0]))
+            elif op == OP_FILL_OVERPRINT:
+                canvas.setFillOverprint( bool( a[0]))
+            elif op == OP_STROKE_ALPHA:
+                canvas.setStrokeAlpha( a[0])
+            elif op == OP_FILL_ALPHA:
+                canvas.setFillAlpha( a[0])
+            elif op == OP_BLEND_MODE:
+                canvas.setBlendMode( objects[int(a[0])])
+            elif op == OP_LINE_WIDTH:
+                canvas.setLineWidth( a[0])
+            elif op == OP_DASH:
+                canvas.setDash( list( objects[int(a[0])]), a[1])
+            elif op == OP_LINE_CAP:
+                canvas.setLineCap( int(a[0]))
+            elif op == OP_LINE_JOIN:
+                canvas.setLineJoin( int(a[0]))
+            elif op == OP_MITER_LIMIT:
+                canvas.setMiterLimit( a[0])
+            elif op == OP_CIRCLE:
+                canvas.circle( a[0], a[1], a[2], stroke=int(a[3]), fill=int(a[4]))
+            elif op == OP_RECT:
+                canvas.rect( a[0], a[1], a[2], a[3], stroke=int(a[4]), fill=int(a[5]))
+            elif op == OP_BEGIN_FORM:
+                name = objects[int(a[0])]
+                if definedForms is not None:
+                    if name in definedForms:
+                        skipping = True
+                        continue
+                    definedForms.add( name)
+                canvas.beginForm( name, a[1], a[2], a[3], a[4])
+            elif op == OP_END_FORM:
+                canvas.endForm()
+            elif op == OP_DO_FORM:
+                canvas.doForm( objects[int(a[0])])
+            elif op == OP_FONT:
+                canvas.setFont( objects[int(a[0])], a[1])
+            elif op == OP_TEXT:
+                canvas.drawString( a[0], a[1], objects[int(a[2])])
+            elif op == OP_SHOW_PAGE:
+                canvas.showPage()
+
+
+#---------------------------------------------------------------------------
+# Optimisation
+#---------------------------------------------------------------------------
+
+# Operators setting one part of the graphics state
+_STATE_OPS = frozenset( (OP_STROKE_CMYK, OP_FILL_CMYK, OP_STROKE_OVERPRINT, OP_FILL_OVERPRINT,
+                         OP_STROKE_ALPHA, OP_FILL_ALPHA, OP_LINE_WIDTH, OP_DASH, OP_LINE_CAP,
+                         OP_LINE_JOIN, OP_MITER_LIMIT, OP_FONT, OP_BLEND_MODE))
+
+# Operators producing output, or using the graphics state
+_CONTENT_OPS = frozenset( (OP_PATH, OP_CIRCLE, OP_RECT, OP_DO_FORM, OP_TEXT,
+                           OP_BEGIN_FORM, OP_END_FORM, OP_SHOW_PAGE))
+
+def _MultiplyTransforms( first, second):
+    '''
+    Returns the transform of the PDF operators "first cm second cm"
+    '''
+    a1, b1, c1, d1, e1, f1 = first
+    a2, b2, c2, d2, e2, f2 = second
+    return (a2*a1 + b2*c1, a2*b1 + b2*d1,
+            c2*a1 + d2*c1, c2*b1 + d2*d1,
+            e2*a1 + f2*c1 + e1, e2*b1 + f2*d1 + f1)
+
+def OptimizeDisplayList( displayList):
+    '''
+    Peephole optimisation of a display list. Tracks the graphics state
+    through save, restore, forms and pages, and
+        - drops state changes setting the value already in effect
+        - drops state changes overwritten before anything uses them
+        - merges adjacent transforms and drops identity transforms
+        - drops save/restore pairs with nothing painted in between
+
+    Returns
+    -------
+    DisplayList, int
+        The optimised display list, sharing the object table of
+        <displayList>, and the number of operators removed.
+
+    '''
+    objects = displayList.objects
+
+    def Value( op, args):
+        if op == OP_DASH:
+            return (objects[int(args[0])], args[1])
+        if op == OP_FONT:
+            return (objects[int(args[0])], args[1])
+        if op == OP_BLEND_MODE:
+            return objects[int(args[0])]
+        return args
+
+    out = []            # [op, args], args is None for removed operations
+    state = {}          # op -> value in effect, missing if unknown
+    pending = {}        # op -> index in out of a state change not yet used
+    stack = []          # (state, index in out of the save) for each save
+    forms = []          # state of the page while a form is being defined
+    lastLive = -1       # index in out of the last operation not removed
+
+    for op, args in displayList.Operations():
+        if op in _STATE_OPS:
+            value = Value( op, args)
+            if state.get( op) == value:
+                continue
+            state[op] = value
+            if op in pending:
+                out[pending[op]][1] = None
+            pending[op] = len( out)
+        elif op == OP_TRANSFORM:
+            if args == (1.0, 0.0, 0.0, 1.0, 0.0, 0.0):
+                continue
+            if (lastLive >= 0) and (out[lastLive][0] == OP_TRANSFORM):
+                out[lastLive][1] = _MultiplyTransforms( out[lastLive][1], args)
+                continue
+        elif op == OP_SAVE:
+            stack.append( (dict( state), len( out)))
+            pending = {}
+        elif op == OP_RESTORE:
+            saved, start = stack.pop()
+            state = saved
+            pending = {}
+            if not any( (entry[1] is not None) and (entry[0] in _CONTENT_OPS) for entry in out[start:]):
+                # nothing painted since the save
+                del out[start:]
+                lastLive = len( out) - 1
+                while (lastLive >= 0) and (out[lastLive][1] is None):
+                    lastLive -= 1
+                continue
+        elif op == OP_BEGIN_FORM:
+            forms.append( (state, stack))
+            state = {}
+            stack = []
+            pending = {}
+        elif op == OP_END_FORM:
+            state, stack = forms.pop()
+            pending = {}
+        elif op == OP_SHOW_PAGE:
+            # a new page starts with the default graphics state
+            state = {}
+            stack = []
+            pending = {}
+        else:
+            # painting and clipping use the state
+            pending = {}
+        out.append( [op, args])
+        lastLive = len( out) - 1
+
+    result = DisplayList( displayList._pagesize)
+    result.objects = objects
+    for op, args in out:
+        if args is not None:
+            result.ops.append( op)
+            result.args.extend( args)
+    return result, len( displayList) - len( result)
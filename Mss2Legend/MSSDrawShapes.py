@@ -5,139 +5,150 @@ Created on Sun Dec  7 19:10:25 2025
 @author: agnar
 """
 
-import re
-
-def DrawShape( canvas, xmlElement):
-    if (xmlElement.tag == 'path'):
-        DrawPath( canvas, xmlElement)
-    elif (xmlElement.tag == 'rect'):
-        DrawRect( canvas, xmlElement)
-    elif (xmlElement.tag == 'circle'):
-        DrawCircle( canvas, xmlElement)
-
+from MSSPath import ParseSvgPath, CompileSvgPath
+
+SHAPE_TAGS = ('path', 'rect', 'circle')
+
+def DrawShape( canvas, part, layer):
+    '''
+    Draws a path, rect or circle part, filled and/or stroked as far as
+    the fill and stroke are the colour <layer> being drawn.
+    '''
+    if (part.tag == 'path'):
+        DrawPath( canvas, part, layer)
+    elif (part.tag == 'rect'):
+        DrawRect( canvas, part, layer)
+    elif (part.tag == 'circle'):
+        DrawCircle( canvas, part, layer)
+
+def DrawShapes( canvas, parts, layer):
+    '''
+    Draws a batch of shapes made by BatchShapes() as one path, painted
+    with a single fill and/or stroke of the colour <layer>.
+    '''
+    if len(parts) == 1:
+        DrawShape( canvas, parts[0], layer)
+        return
+    p = canvas.beginPath()
+    for part in parts:
+        AddShapeToPath( p, part)
+
+    doFill = 1 if parts[0].fill is layer else 0
+    doStroke = 1 if parts[0].stroke is layer else 0
 
+    canvas.drawPath( p, fill = doFill, stroke=doStroke)
 
-def DrawPath( canvas, xmlPath):
+def AddShapeToPath( p, part):
+    '''
+    Adds the outline of a path, rect or circle part to the path object <p>
+    '''
+    if (part.tag == 'path'):
+        CompileSvgPath( part.d).Replay( p)
+    elif (part.tag == 'rect'):
+        p.rect( part.x, part.y, part.width, part.height)
+    elif (part.tag == 'circle'):
+        p.circle( part.cx, part.cy, part.r)
+
+def _BoundsOverlap( a, b):
+    return (a[0] < b[2]) and (b[0] < a[2]) and (a[1] < b[3]) and (b[1] < a[3])
+
+def BatchShapes( parts):
+    '''
+    Splits a sequence of shape parts into batches that can be painted as
+    one path. A batch holds consecutive parts with the same fill, stroke
+    and stroke style. Painting them together only gives the same result
+    as painting them one by one when they do not overlap: overlaps would
+    become holes with the even-odd rule, and translucent colours would
+    only be applied once. So a part overlapping a part already in the
+    batch starts a new batch. Parts that are not shapes get a batch of
+    their own.
+
+    Returns
+    -------
+    list of lists of parts, in paint order
+
+    '''
+    batches = []
+    batch = []
+    batchKey = None
+    batchBounds = []
+    for part in parts:
+        if part.tag not in SHAPE_TAGS:
+            if batch:
+                batches.append( batch)
+            batches.append( [part])
+            batch = []
+            batchKey = None
+            continue
+        key = (part.fill, part.stroke, part.style)
+        bounds = CalcShapeBounds( part)
+        if batch and (key == batchKey) and (bounds is not None) and \
+                not any( _BoundsOverlap( bounds, other) for other in batchBounds):
+            batch.append( part)
+            batchBounds.append( bounds)
+            continue
+        if batch:
+            batches.append( batch)
+        batch = [part]
+        batchKey = key
+        batchBounds = [bounds] if bounds is not None else []
+        if bounds is None:
+            # an empty path, nothing can be added to it
+            batches.append( batch)
+            batch = []
+            batchKey = None
+    if batch:
+        batches.append( batch)
+    return batches
+
+
+
+def CalcShapeBounds( part):
+    '''
+    Returns (xMin, yMin, xMax, yMax) enclosing everything painted by a
+    path, circle or rect part, or None if it paints nothing.
+    '''
+    if (part.tag == 'path'):
+        if not part.d:
+            return None
+        bounds = CompileSvgPath( part.d).Bounds()
+        if bounds is None:
+            return None
+    elif (part.tag == 'rect'):
+        bounds = (part.x, part.y, part.x + part.width, part.y + part.height)
+    elif (part.tag == 'circle'):
+        bounds = (part.cx - part.r, part.cy - part.r, part.cx + part.r, part.cy + part.r)
+    else:
+        return None
+
+    if (part.stroke is not None):
+        # half the stroke width, with room for miter joins and square caps
+        style = part.style
+        pad = style.width * 0.5 * max( style.miterLimit if style.lineJoin == 0 else 1.0, 1.5)
+        bounds = (bounds[0] - pad, bounds[1] - pad, bounds[2] + pad, bounds[3] + pad)
+    return bounds
+
+def DrawPath( canvas, path, layer):
     
-    p = _ParseSvgPath( canvas, xmlPath.attrib['d'])
+    p = ParseSvgPath( canvas, path.d)
 
-    doFill = 1 if "fill" in xmlPath.attrib else 0
-    doStroke = 1 if "stroke" in xmlPath.attrib else 0
+    doFill = 1 if path.fill is layer else 0
+    doStroke = 1 if path.stroke is layer else 0
 
     canvas.drawPath( p, fill = doFill, stroke=doStroke)
     
     
 
-def DrawCircle( canvas, xmlCircle):
+def DrawCircle( canvas, circle, layer):
     
-    cx = float( xmlCircle.attrib['cx'])
-    cy = float( xmlCircle.attrib['cy'])
-    r = float( xmlCircle.attrib['r'])
-
-    doFill = 1 if "fill" in  xmlCircle.attrib else 0
-    doStroke = 1 if "stroke" in  xmlCircle.attrib else 0
+    doFill = 1 if circle.fill is layer else 0
+    doStroke = 1 if circle.stroke is layer else 0
     
-    canvas.circle( cx, cy, r, fill=doFill, stroke=doStroke)
+    canvas.circle( circle.cx, circle.cy, circle.r, fill=doFill, stroke=doStroke)
     
-def DrawRect( canvas, xmlRect):
-
-    llx = float( xmlRect.attrib['x'])
-    lly = float( xmlRect.attrib['y'])
-    w = float( xmlRect.attrib['width'])
-    h = float( xmlRect.attrib['height'])
-
-    doFill = 1 if "fill" in xmlRect.attrib else 0
-    doStroke = 1 if "stroke" in xmlRect.attrib else 0
-    
-    canvas.rect( llx, lly, w, h, fill=doFill, stroke=doStroke)
-    
-
-def _ParseSvgPath(canvas,d):
-
-
-    thePath = canvas.beginPath()
-
-    # Tokenize: commands or numbers
-    token_re = re.compile(r"""
-        ([MLCZmlcz])              # SVG command
-        |([-+]?[0-9]*\.?[0-9]+)   # Number
-    """, re.VERBOSE)
-
-    tokens = token_re.findall(d)
-    # Flatten: each match gives (command, number)
-    tokens = [t[0] or t[1] for t in tokens]
-
-    i = 0
-
-    def get_number():
-        nonlocal i
-        val = float(tokens[i])
-        i += 1
-        return val
-
-    current_cmd = None
-
-    x = y = 0   # Current position
-
-    while i < len(tokens):
-        t = tokens[i]
-
-        # If token is a command letter, advance and set it
-        if re.match(r'[MLCZmlcz]', t):
-            current_cmd = t
-            i += 1
-        # Else the command repeats
-
-        cmd = current_cmd.upper()
-        is_rel = current_cmd.islower()
-
-        if cmd == 'M':  # moveto
-            # First pair is moveto, subsequent pairs are implicit lineto
-            while i < len(tokens) and not re.match(r'[MLCZmlcz]', tokens[i]):
-                nx = get_number()
-                ny = get_number()
-                if is_rel:
-                    nx += x
-                    ny += y
-
-                if cmd == "M" and i > 2:
-                    thePath.moveTo( nx, ny)
-                else:
-                    thePath.lineTo( nx, ny)
-
-                x, y = nx, ny
-
-        elif cmd == 'L':  # lineto
-            while i < len(tokens) and not re.match(r'[MLCZmlcz]', tokens[i]):
-                nx = get_number()
-                ny = get_number()
-                if is_rel:
-                    nx += x
-                    ny += y
-                thePath.lineTo( nx, ny)
-                x, y = nx, ny
-
-        elif cmd == 'C':  # cubic curveto
-            # groups of 6 numbers
-            while i < len(tokens) and not re.match(r'[MLCZmlcz]', tokens[i]):
-                x1 = get_number()
-                y1 = get_number()
-                x2 = get_number()
-                y2 = get_number()
-                nx = get_number()
-                ny = get_number()
-
-                if is_rel:
-                    x1 += x; y1 += y
-                    x2 += x; y2 += y
-                    nx += x; ny += y
-
-                thePath.curveTo( x1, y1, x2, y2, nx, ny)
-                x, y = nx, ny
-
-        elif cmd == 'Z':  # closepath
-            thePath.close()
-            # SVG closes back to subpath start; we could track it if needed
-    return thePath
+def DrawRect( canvas, rect, layer):
 
+    doFill = 1 if rect.fill is layer else 0
+    doStroke = 1 if rect.stroke is layer else 0
     
+    canvas.rect( rect.x, rect.y, rect.width, rect.height, fill=doFill, stroke=doStroke)
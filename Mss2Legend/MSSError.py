@@ -1,15 +1,154 @@
-import sys
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Errors in MSS files
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
 
-def BailOut( errorMessage, params=None):
+'''
+All problems found in an MSS file are raised as an MSSError subclass.
+The library never prints or exits; that is left to the command line.
+
+An error is raised where the problem is found, often without knowing
+where in the file it is. The callers add what they know with
+AddContext() as the error passes through them, so the error ends up
+with the symbol id, the element path and the source line of the
+innermost element that knows them.
+'''
+
+
+class MSSError(Exception):
+    '''
+    Base class of all errors in an MSS file.
+
+    Parameters
+    ----------
+    message : string
+        The problem. May contain %-place holders filled from <params>.
+    params : tuple, optional
+    symbolId : string, optional
+        The id of the symbol the error is in
+    path : string, optional
+        The element path, like "Symbols/symbol[@id='101']/path[2]"
+    line : int, optional
+        The line number in the source file
+    fileName : string, optional
+        The source file
+    '''
+
+    def __init__( self, message, params=None, symbolId=None, path=None, line=None, fileName=None):
+        if params:
+            message = message % params
+        super().__init__( message)
+        self.message = message
+        self.symbolId = symbolId
+        self.path = path
+        self.line = line
+        self.fileName = fileName
+
+    def AddContext( self, symbolId=None, path=None, line=None, fileName=None):
+        '''
+        Sets the location fields that are not known yet. Returns self.
+        '''
+        if self.symbolId is None:
+            self.symbolId = symbolId
+        if self.path is None:
+            self.path = path
+        if self.line is None:
+            self.line = line
+        if self.fileName is None:
+            self.fileName = fileName
+        return self
+
+    def Location( self):
+        '''
+        Returns the location of the error as "file:line: symbol id: path",
+        leaving out the unknown parts
+        '''
+        where = []
+        if self.fileName is not None:
+            where.append( self.fileName if self.line is None else "%s:%d" % (self.fileName, self.line))
+        elif self.line is not None:
+            where.append( "line %d" % self.line)
+        if self.symbolId is not None:
+            where.append( "symbol %s" % self.symbolId)
+        if self.path is not None:
+            where.append( self.path)
+        return ": ".join( where)
+
+    def __str__( self):
+        location = self.Location()
+        return "%s: %s" % (location, self.message) if location else self.message
+
+    def __reduce__( self):
+        # keeps the location when sent from a worker process
+        return (_RebuildError, (type(self), self.message, self.symbolId, self.path, self.line, self.fileName))
+
+
+def _RebuildError( cls, message, symbolId, path, line, fileName):
+    return cls( message, symbolId=symbolId, path=path, line=line, fileName=fileName)
+
+
+class SpecSyntaxError(MSSError):
+    '''
+    The file is not well-formed XML
+    '''
+
+class SpecStructureError(MSSError):
+    '''
+    A required section of the spec is missing
     '''
-    Prints an error message and exits the program.
-    The errorMessage may contain %-place holders, 
-    and the params is a tuple with entries to insert.
+
+class ColorError(MSSError):
+    '''
+    An error in a <color> or a colour <layer>
+    '''
+
+class SymbolError(MSSError):
+    '''
+    An error in the definition of a symbol
+    '''
+
+class PathDataError(SymbolError):
+    '''
+    An error in the "d" attribute of a <path>
+    '''
+
+class LayoutError(MSSError):
     '''
+    A symbol that can not be laid out in the legend
+    '''
+
+class PageError(MSSError):
+    '''
+    A page number outside the legend
+    '''
+
+
+class SpecErrors(MSSError):
+    '''
+    All the errors found in a spec in collect-all-errors mode, in the
+    order found. <errors> is the list of MSSError.
+    '''
+
+    def __init__( self, errors, fileName=None):
+        super().__init__( "%d errors" % len( errors), fileName=fileName)
+        self.errors = list( errors)
+        for error in self.errors:
+            error.AddContext( fileName=fileName)
 
-    if params:
-        errorMessage = errorMessage % params
-        
-    print( "ERROR:", errorMessage)
-    sys.exit( 1)
+    def __str__( self):
+        return "\n".join( str( error) for error in self.errors)
 
+    def __reduce__( self):
+        return (SpecErrors, (self.errors, self.fileName))
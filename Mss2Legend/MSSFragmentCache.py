@@ -0,0 +1,183 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   On-disk cache of rendered symbol fragments
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+A fragment is the display list of one symbol on one colour layer, drawn
+with the legend entry centered on the origin. Fragments are stored in a
+directory, one file per fragment, named by a content key: the digest of
+the canonical XML of the symbol, the layer, the resolved colours of all
+the layers the symbol refers to and the legend geometry. A changed symbol
+gets a new key, so stale fragments are never used; they are removed when
+the cache grows beyond its size limit, least recently used first.
+
+Several processes may share a cache directory. Files are written to a
+temporary name and renamed in place.
+'''
+
+import os
+import hashlib
+import tempfile
+from MSSDisplayList import DisplayList
+from MSSSymbolModel import GetPartLayers
+
+
+# Part of every key, change when the drawing code changes what a fragment holds
+FRAGMENT_VERSION = "1"
+
+_SUFFIX = ".frag"
+
+
+def DefaultCacheDir():
+    '''
+    Returns the directory of the fragment cache, $XDG_CACHE_HOME/mss2legend
+    or ~/.cache/mss2legend
+    '''
+    base = os.environ.get( 'XDG_CACHE_HOME') or os.path.join( os.path.expanduser( '~'), '.cache')
+    return os.path.join( base, 'mss2legend')
+
+
+def FragmentKey( spec, symbol, layer, legendGeometry):
+    '''
+    Returns the cache key of <symbol> drawn on <layer>.
+
+    Parameters
+    ----------
+    spec : SymbolSpec
+    symbol : Symbol
+    layer : ColorLayer
+    legendGeometry : tuple
+        Anything else the drawing depends on, like the legend size
+
+    '''
+    layers = {}
+    for part in symbol.parts:
+        for partLayer in GetPartLayers( part):
+            layers[partLayer.id] = spec.colors[partLayer]
+
+    h = hashlib.sha256()
+    h.update( repr( (FRAGMENT_VERSION, symbol.digest, layer.id, tuple( legendGeometry))).encode( 'utf-8'))
+    for layerId in sorted( layers):
+        color = layers[layerId]
+        h.update( repr( (layerId, color.cmyk, color.opacity, color.blend, color.overprint)).encode( 'utf-8'))
+    return h.hexdigest()
+
+
+class FragmentCache(object):
+    '''
+    A directory of fragments with a size limit of <maxBytes>. The least
+    recently used fragments are removed when the limit is exceeded; reading
+    a fragment updates its modification time.
+    '''
+
+    def __init__( self, directory, maxBytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None       # total size of the files, calculated when needed
+        os.makedirs( directory, exist_ok=True)
+
+    def _Path( self, key):
+        return os.path.join( self.directory, key[:2], key + _SUFFIX)
+
+    def Get( self, key):
+        '''
+        Returns the fragment stored under <key> as a DisplayList, or None
+        '''
+        path = self._Path( key)
+        try:
+            with open( path, 'rb') as f:
+                data = f.read()
+            fragment = DisplayList.FromBytes( data)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            os.utime( path)
+        except OSError:
+            pass
+        self.hits += 1
+        return fragment
+
+    def Put( self, key, fragment):
+        '''
+        Stores the DisplayList <fragment> under <key>
+        '''
+        data = fragment.ToBytes()
+        path = self._Path( key)
+        os.makedirs( os.path.dirname( path), exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp( dir=os.path.dirname( path), suffix='.tmp')
+        try:
+            with os.fdopen( fd, 'wb') as f:
+                f.write( data)
+            try:
+                oldSize = os.stat( path).st_size
+            except FileNotFoundError:
+                oldSize = 0
+            os.replace( tmpPath, path)
+        except OSError:
+            try:
+                os.remove( tmpPath)
+            except OSError:
+                pass
+            return
+        if self._size is not None:
+            self._size += len( data) - oldSize
+        if self.Size() > self.maxBytes:
+            self.Evict()
+
+    def _Files( self):
+        '''
+        Returns (mtime, size, path) of all fragment files
+        '''
+        result = []
+        for root, dirs, files in os.walk( self.directory):
+            for name in files:
+                if name.endswith( _SUFFIX):
+                    path = os.path.join( root, name)
+                    try:
+                        st = os.stat( path)
+                    except OSError:
+                        continue
+                    result.append( (st.st_mtime, st.st_size, path))
+        return result
+
+    def Size( self):
+        '''
+        Returns the total size of the cached fragments in bytes
+        '''
+        if self._size is None:
+            self._size = sum( size for _, size, _ in self._Files())
+        return self._size
+
+    def Evict( self):
+        '''
+        Removes the least recently used fragments until the cache is at
+        most 3/4 of its size limit
+        '''
+        files = sorted( self._Files())
+        size = sum( s for _, s, _ in files)
+        target = self.maxBytes * 3 // 4
+        for _, fileSize, path in files:
+            if size <= target:
+                break
+            try:
+                os.remove( path)
+            except OSError:
+                continue
+            size -= fileSize
+        self._size = size
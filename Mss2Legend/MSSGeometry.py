@@ -0,0 +1,665 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Vectorised geometry on (N, 2) coordinate arrays
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+Polygons and polylines are contiguous numpy arrays of shape (N, 2), one
+row (x, y) per vertex. Polygons are implicitly closed and are filled with
+the even-odd rule. Affine transforms are 3x3 matrices operating on column
+vectors (x, y, 1).
+
+All functions work on whole arrays, so the cost of a polygon with tens of
+thousands of vertices is dominated by numpy and not by the interpreter.
+'''
+
+import math
+import numpy as np
+
+
+# Largest number of elements of the temporary (rows x edges) arrays
+_CHUNK_ELEMENTS = 1 << 20
+
+
+def AsPoints( poly):
+    '''
+    Returns <poly> as a contiguous float array of shape (N, 2). Accepts a
+    list of (x, y) tuples or an array, which is returned as is if possible.
+    '''
+    return np.ascontiguousarray( poly, dtype=float).reshape( -1, 2)
+
+
+#---------------------------------------------------------------------------
+# Affine transforms
+#---------------------------------------------------------------------------
+
+def IdentityMatrix():
+    return np.eye( 3)
+
+def TranslationMatrix( dx, dy):
+    m = np.eye( 3)
+    m[0, 2] = dx
+    m[1, 2] = dy
+    return m
+
+def RotationMatrix( angle):
+    '''
+    Rotation of <angle> degrees counter-clockwise around the origin
+    '''
+    angle *= math.pi / 180
+    c = math.cos( angle)
+    s = math.sin( angle)
+    return np.array( [[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+def ScaleMatrix( sx, sy=None):
+    if sy is None:
+        sy = sx
+    return np.diag( (float(sx), float(sy), 1.0))
+
+def ComposeMatrices( *matrices):
+    '''
+    Returns the transform applying the <matrices> from left to right, i.e.
+    ComposeMatrices( a, b) first applies a, then b.
+    '''
+    result = np.eye( 3)
+    for m in matrices:
+        result = m @ result
+    return result
+
+def TransformPoints( points, matrix):
+    '''
+    Applies the affine <matrix> to all <points>, returns a new (N, 2) array.
+    '''
+    points = AsPoints( points)
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+def RotatePoints( points, angle):
+    '''
+    Rotates <points> <angle> degrees counter-clockwise around the origin
+    '''
+    return TransformPoints( points, RotationMatrix( angle))
+
+
+#---------------------------------------------------------------------------
+# Construction and bounds
+#---------------------------------------------------------------------------
+
+def RectPoints( llx, lly, urx, ury):
+    '''
+    Returns the polygon of a rectangle, counter-clockwise from the lower left corner
+    '''
+    return np.array( [[llx, lly], [urx, lly], [urx, ury], [llx, ury]], dtype=float)
+
+def Bounds( points):
+    '''
+    Returns (xMin, yMin, xMax, yMax) of <points> as python floats
+    '''
+    points = AsPoints( points)
+    xMin, yMin = points.min( axis=0).tolist()
+    xMax, yMax = points.max( axis=0).tolist()
+    return (xMin, yMin, xMax, yMax)
+
+def _Edges( poly):
+    '''
+    Returns the x0, y0, x1, y1 arrays of the edges of the closed polygon
+    '''
+    pts = AsPoints( poly)
+    x0 = pts[:, 0]
+    y0 = pts[:, 1]
+    return x0, y0, np.roll( x0, -1), np.roll( y0, -1)
+
+
+#---------------------------------------------------------------------------
+# Point in polygon
+#---------------------------------------------------------------------------
+
+def PointsInPolygon( points, poly):
+    '''
+    Even-odd test of many points against one polygon.
+
+    Returns
+    -------
+    numpy bool array of shape (N,)
+        True for each point inside <poly>
+
+    '''
+    points = AsPoints( points)
+    x0, y0, x1, y1 = _Edges( poly)
+    dy = y1 - y0
+    dySafe = np.where( dy == 0, 1.0, dy)
+
+    result = np.empty( len(points), dtype=bool)
+    chunk = max( 1, _CHUNK_ELEMENTS // max( len(x0), 1))
+    for first in range( 0, len(points), chunk):
+        px = points[first:first+chunk, 0, None]
+        py = points[first:first+chunk, 1, None]
+        crosses = (y0 > py) != (y1 > py)
+        xCross = x0 + (py - y0) / dySafe * (x1 - x0)
+        hits = crosses & (px < xCross)
+        result[first:first+chunk] = (np.count_nonzero( hits, axis=1) % 2) == 1
+    return result
+
+
+#---------------------------------------------------------------------------
+# Intervals along scanlines
+#---------------------------------------------------------------------------
+
+def MergeIntervals( starts, ends):
+    '''
+    Merges overlapping intervals [starts[i], ends[i]] into a sorted
+    (M, 2) array of disjoint intervals.
+    '''
+    starts = np.asarray( starts, dtype=float)
+    ends = np.asarray( ends, dtype=float)
+    if len(starts) == 0:
+        return np.empty( (0, 2))
+    order = np.argsort( starts, kind='stable')
+    starts = starts[order]
+    ends = ends[order]
+    reach = np.maximum.accumulate( ends)
+    newGroup = np.empty( len(starts), dtype=bool)
+    newGroup[0] = True
+    newGroup[1:] = starts[1:] > reach[:-1]
+    first = np.flatnonzero( newGroup)
+    return np.column_stack( (starts[first], np.maximum.reduceat( ends, first)))
+
+def SubtractIntervals( a, b):
+    '''
+    Returns the parts of the sorted, disjoint intervals <a> not covered by
+    the sorted, disjoint intervals <b>, both (M, 2) arrays.
+    '''
+    result = []
+    j = 0
+    for start, end in a.tolist():
+        while j < len(b) and b[j, 1] <= start:
+            j += 1
+        k = j
+        while k < len(b) and b[k, 0] < end:
+            if b[k, 0] > start:
+                result.append( (start, b[k, 0]))
+            start = max( start, b[k, 1])
+            k += 1
+        if start < end:
+            result.append( (start, end))
+    return np.array( result, dtype=float).reshape( -1, 2)
+
+def IntervalsOverlap( intervals, a, b):
+    '''
+    For sorted, disjoint <intervals>, returns a boolean array telling
+    for each range [a[i], b[i]] whether it overlaps any of the intervals.
+    '''
+    idx = np.searchsorted( intervals[:, 1], a, side='right')
+    ok = idx < len(intervals)
+    result = np.zeros( len(a), dtype=bool)
+    result[ok] = intervals[idx[ok], 0] < b[ok]
+    return result
+
+def IntervalsContain( intervals, a, b):
+    '''
+    For sorted, disjoint <intervals>, returns a boolean array telling
+    for each range [a[i], b[i]] whether it is inside one of the intervals.
+    '''
+    idx = np.searchsorted( intervals[:, 1], b, side='left')
+    ok = idx < len(intervals)
+    result = np.zeros( len(a), dtype=bool)
+    result[ok] = intervals[idx[ok], 0] <= a[ok]
+    return result
+
+def CalcBandIntervals( poly, yLow, yHigh):
+    '''
+    Scanline intersection of a polygon with horizontal bands.
+
+    Parameters
+    ----------
+    poly : numpy array of shape (N, 2)
+        A closed polygon, filled with the even-odd rule
+    yLow, yHigh : numpy arrays of shape (B,)
+        The lower and upper y of each band
+
+    Returns
+    -------
+    touching, inside : lists of B numpy arrays of shape (M, 2)
+        For each band, the sorted x-intervals where the band may touch
+        the polygon, and the x-intervals where the full height of the band
+        is inside the polygon.
+
+    '''
+    x0, y0, x1, y1 = _Edges( poly)
+    dx = x1 - x0
+    dy = y1 - y0
+    flat = (dy == 0)
+    dySafe = np.where( flat, 1.0, dy)
+    eyMin = np.minimum( y0, y1)
+    eyMax = np.maximum( y0, y1)
+
+    yLow = np.asarray( yLow, dtype=float)
+    yHigh = np.asarray( yHigh, dtype=float)
+
+    touching = []
+    inside = []
+    chunk = max( 1, _CHUNK_ELEMENTS // max( len(x0), 1))
+    for first in range( 0, len(yLow), chunk):
+        ya = yLow[first:first+chunk, None]
+        yb = yHigh[first:first+chunk, None]
+
+        # crossings of the lower band edge, half open so vertices count once
+        crosses = ((y0 <= ya) & (ya < y1)) | ((y1 <= ya) & (ya < y0))
+        xCross = x0 + (ya - y0) / dySafe * dx
+
+        # x-range of each edge within the band
+        inBand = (eyMax >= ya) & (eyMin <= yb)
+        ta = np.where( flat, 0.0, np.clip( (ya - y0) / dySafe, 0.0, 1.0))
+        tb = np.where( flat, 1.0, np.clip( (yb - y0) / dySafe, 0.0, 1.0))
+        xa = x0 + ta * dx
+        xb = x0 + tb * dx
+        lo = np.minimum( xa, xb)
+        hi = np.maximum( xa, xb)
+
+        for i in range( len(ya)):
+            spans = np.sort( xCross[i][crosses[i]]).reshape( -1, 2)
+            edges = MergeIntervals( lo[i][inBand[i]], hi[i][inBand[i]])
+            touching.append( MergeIntervals( np.concatenate( (spans[:, 0], edges[:, 0])),
+                                             np.concatenate( (spans[:, 1], edges[:, 1]))))
+            inside.append( SubtractIntervals( spans, edges))
+
+    return touching, inside
+
+
+#---------------------------------------------------------------------------
+# Flattening and arc length
+#---------------------------------------------------------------------------
+
+def FlattenCurve( p0, p1, p2, p3, tolerance):
+    '''
+    Flattens a cubic Bezier curve to a polyline deviating at most
+    <tolerance> from the curve. The number of segments follows from the
+    second differences of the control points (Wang's formula).
+
+    Returns
+    -------
+    numpy array of shape (N, 2)
+        The points of the polyline, excluding p0
+
+    '''
+    ctrl = np.array( (p0, p1, p2, p3), dtype=float)
+    dd = np.abs( ctrl[:2] - 2 * ctrl[1:3] + ctrl[2:])
+    m = float( np.sqrt( (dd * dd).sum( axis=1)).max())
+    n = max( 1, int( math.ceil( math.sqrt( 0.75 * m / tolerance))))
+    t = np.arange( 1, n + 1, dtype=float)[:, None] / n
+    s = 1.0 - t
+    return (s * s * s) * ctrl[0] + (3 * s * s * t) * ctrl[1] + (3 * s * t * t) * ctrl[2] + (t * t * t) * ctrl[3]
+
+def CumulativeLengths( points):
+    '''
+    Returns the distance along the polyline <points> to each of its
+    vertices, an (N,) array starting with 0.
+    '''
+    points = AsPoints( points)
+    result = np.zeros( len(points))
+    if len(points) > 1:
+        seg = np.diff( points, axis=0)
+        np.cumsum( np.hypot( seg[:, 0], seg[:, 1]), out=result[1:])
+    return result
+
+
+class ArcLengthTable(object):
+    '''
+    A polyline with a table of the cumulative length to each vertex, used
+    to find the point and direction at any distance along the line with a
+    binary search. The table is built once, and any number of positions can
+    then be looked up in one call.
+    '''
+    __slots__ = ('points', 'lengths', 'length')
+
+    def __init__( self, points):
+        points = AsPoints( points)
+        if len(points) > 1:
+            # zero length segments have no direction
+            moves = np.any( points[1:] != points[:-1], axis=1)
+            points = points[np.concatenate( ([True], moves))]
+        self.points = points
+        self.lengths = CumulativeLengths( points)
+        self.length = float( self.lengths[-1]) if len(points) else 0.0
+
+    @classmethod
+    def FromLine( cls, x0, y0, x1, y1):
+        return cls( ((x0, y0), (x1, y1)))
+
+    def PointsAt( self, distances):
+        '''
+        Returns the positions, an (K, 2) array, and the direction of the line
+        in degrees, an (K,) array, at the <distances> along the line.
+        Distances outside the line extrapolate the first or last segment.
+        '''
+        distances = np.asarray( distances, dtype=float).reshape( -1)
+        points = self.points
+        if len(points) < 2:
+            positions = np.repeat( points[:1], len(distances), axis=0)
+            return positions, np.zeros( len(distances))
+        seg = np.searchsorted( self.lengths, distances, side='right') - 1
+        np.clip( seg, 0, len(points) - 2, out=seg)
+        start = points[seg]
+        delta = points[seg + 1] - start
+        segLen = self.lengths[seg + 1] - self.lengths[seg]
+        t = (distances - self.lengths[seg]) / segLen
+        positions = start + t[:, None] * delta
+        angles = np.degrees( np.arctan2( delta[:, 1], delta[:, 0]))
+        return positions, angles
+
+    def Placements( self, distances):
+        '''
+        Returns the transforms placing a symbol at each of the <distances>
+        along the line, rotated to follow the line, as an (K, 6) array of
+        (a, b, c, d, e, f) rows, in the order of the PDF "cm" operator.
+        '''
+        positions, angles = self.PointsAt( distances)
+        rad = np.radians( angles)
+        c = np.cos( rad)
+        s = np.sin( rad)
+        return np.column_stack( (c, s, -s, c, positions[:, 0], positions[:, 1]))
+
+
+#---------------------------------------------------------------------------
+# Parallel offset
+#---------------------------------------------------------------------------
+
+# Line joins, same values as the stroke-linejoin codes of the symbol model
+JOIN_MITER = 0
+JOIN_ROUND = 1
+JOIN_BEVEL = 2
+
+def OffsetPolyline( points, distance, lineJoin=JOIN_MITER, miterLimit=4.0, closed=False, tolerance=0.01):
+    '''
+    Offsets a polyline sideways, positive <distance> to the left of the
+    direction of the line.
+
+    Each vertex becomes one point where the offset segments meet on the
+    inner side of a bend, and on the outer side a join following the SVG
+    rules: a miter point if lineJoin is miter and the miter ratio is within
+    miterLimit, otherwise a bevel, or an arc with the chord error below
+    <tolerance> for round joins. All vertices are processed at once.
+
+    Parameters
+    ----------
+    points : numpy array of shape (N, 2)
+    distance : float
+    lineJoin : int
+        JOIN_MITER, JOIN_ROUND or JOIN_BEVEL
+    miterLimit : float
+    closed : bool
+        True if the polyline is a closed ring. The last point shall not
+        repeat the first one.
+
+    Returns
+    -------
+    numpy array of shape (M, 2)
+
+    '''
+    points = AsPoints( points)
+    if len(points) > 1:
+        moves = np.any( points[1:] != points[:-1], axis=1)
+        points = points[np.concatenate( ([True], moves))]
+    if closed and len(points) > 2 and np.all( points[0] == points[-1]):
+        points = points[:-1]
+    if (distance == 0) or (len(points) < 2):
+        return points.copy()
+
+    ring = np.vstack( (points, points[:1])) if closed else points
+    seg = np.diff( ring, axis=0)
+    tangents = seg / np.hypot( seg[:, 0], seg[:, 1])[:, None]
+    normals = np.column_stack( (-tangents[:, 1], tangents[:, 0]))
+
+    # the tangents before and after each joined vertex
+    if closed:
+        joinPts = points
+        t0 = np.roll( tangents, 1, axis=0)
+        t1 = tangents
+    else:
+        joinPts = points[1:-1]
+        t0 = tangents[:-1]
+        t1 = tangents[1:]
+    n0 = np.column_stack( (-t0[:, 1], t0[:, 0]))
+    n1 = np.column_stack( (-t1[:, 1], t1[:, 0]))
+    cosT = np.einsum( 'ij,ij->i', t0, t1)
+    cross = t0[:, 0] * t1[:, 1] - t0[:, 1] * t1[:, 0]
+    sweep = np.arctan2( cross, cosT)
+
+    # number of points of each join; 1 is a miter or inner point
+    reversal = (1.0 + cosT) < 1e-9
+    inner = (cross * distance > 0) & ~reversal
+    straight = (np.abs( sweep) < 1e-9)
+    counts = np.ones( len(joinPts), dtype=int)
+    outer = ~inner & ~straight
+    if lineJoin == JOIN_ROUND:
+        step = 2 * math.acos( max( 1.0 - tolerance / abs( distance), -1.0))
+        counts[outer] = np.ceil( np.abs( sweep[outer]) / step).astype( int) + 1
+    else:
+        ratio = np.sqrt( 2.0 / np.maximum( 1.0 + cosT, 1e-12))
+        bevel = outer & (reversal | (lineJoin != JOIN_MITER) | (ratio > miterLimit))
+        counts[bevel] = 2
+
+    # miter points, also used on the inner side
+    denom = np.where( reversal, 1.0, 1.0 + cosT)[:, None]
+    miter = joinPts + distance * (n0 + n1) / denom
+
+    owner = np.repeat( np.arange( len(joinPts)), counts)
+    first = np.cumsum( counts) - counts
+    j = np.arange( len(owner)) - first[owner]
+    a0 = np.arctan2( n0[:, 1], n0[:, 0])
+    if distance < 0:
+        a0 += math.pi
+    frac = j / np.maximum( counts[owner] - 1, 1)
+    angle = a0[owner] + sweep[owner] * frac
+    joins = joinPts[owner] + abs( distance) * np.column_stack( (np.cos( angle), np.sin( angle)))
+    single = counts[owner] == 1
+    joins[single] = miter[owner[single]]
+
+    if closed:
+        return joins
+    return np.vstack( (points[:1] + distance * normals[:1], joins, points[-1:] + distance * normals[-1:]))
+
+
+#---------------------------------------------------------------------------
+# Clipping
+#---------------------------------------------------------------------------
+
+def ClipSegments( segments, poly):
+    '''
+    Clips line segments against a polygon.
+
+    Parameters
+    ----------
+    segments : numpy array of shape (N, 4)
+        One row (x0, y0, x1, y1) per segment
+    poly : numpy array of shape (M, 2)
+        The clip polygon, even-odd rule. It may be concave.
+
+    Returns
+    -------
+    numpy array of shape (K, 4)
+        The pieces of the segments inside the polygon, in segment order
+
+    '''
+    segments = np.asarray( segments, dtype=float).reshape( -1, 4)
+    ex0, ey0, ex1, ey1 = _Edges( poly)
+    edx = ex1 - ex0
+    edy = ey1 - ey0
+
+    pieces = []
+    chunk = max( 1, _CHUNK_ELEMENTS // max( len(ex0), 1))
+    for first in range( 0, len(segments), chunk):
+        seg = segments[first:first+chunk]
+        sx0 = seg[:, 0, None]
+        sy0 = seg[:, 1, None]
+        sdx = seg[:, 2, None] - sx0
+        sdy = seg[:, 3, None] - sy0
+
+        # parameters t along the segments and u along the edges of the crossings
+        denom = sdx * edy - sdy * edx
+        parallel = (denom == 0)
+        denom = np.where( parallel, 1.0, denom)
+        qx = ex0 - sx0
+        qy = ey0 - sy0
+        t = (qx * edy - qy * edx) / denom
+        u = (qx * sdy - qy * sdx) / denom
+        valid = ~parallel & (t > 0) & (t < 1) & (u >= 0) & (u <= 1)
+
+        ts = np.where( valid, t, np.nan)
+        ts = np.concatenate( (np.zeros( (len(seg), 1)), ts, np.ones( (len(seg), 1))), axis=1)
+        ts.sort( axis=1)            # nan sorts last
+
+        ta = ts[:, :-1]
+        tb = ts[:, 1:]
+        keep = ~np.isnan( tb) & (tb > ta)
+        row, col = np.nonzero( keep)
+        tm = (ta[row, col] + tb[row, col]) * 0.5
+        mid = np.column_stack( (sx0[row, 0] + tm * sdx[row, 0], sy0[row, 0] + tm * sdy[row, 0]))
+        inside = PointsInPolygon( mid, poly)
+        row = row[inside]
+        t0 = ta[row, col[inside]]
+        t1 = tb[row, col[inside]]
+        pieces.append( np.column_stack( (sx0[row, 0] + t0 * sdx[row, 0], sy0[row, 0] + t0 * sdy[row, 0],
+                                         sx0[row, 0] + t1 * sdx[row, 0], sy0[row, 0] + t1 * sdy[row, 0])))
+
+    if not pieces:
+        return np.empty( (0, 4))
+    return np.concatenate( pieces)
+
+def ClipPolygon( subject, clip):
+    '''
+    Clips the polygon <subject> against the convex polygon <clip>
+    (Sutherland-Hodgman). Each clip edge is processed for all subject
+    vertices at once.
+
+    Returns
+    -------
+    numpy array of shape (K, 2)
+        The clipped polygon, possibly empty.
+
+    '''
+    output = AsPoints( subject)
+    clip = AsPoints( clip)
+    # make sure the clip polygon is counter-clockwise
+    cx, cy = clip[:, 0], clip[:, 1]
+    if np.sum( cx * np.roll( cy, -1) - np.roll( cx, -1) * cy) < 0:
+        clip = clip[::-1]
+
+    for (ax, ay), (bx, by) in zip( clip.tolist(), np.roll( clip, -1, axis=0).tolist()):
+        if len(output) == 0:
+            break
+        nx = -(by - ay)
+        ny = bx - ax
+        side = (output[:, 0] - ax) * nx + (output[:, 1] - ay) * ny     # >= 0 is inside
+        nextPts = np.roll( output, -1, axis=0)
+        nextSide = np.roll( side, -1)
+
+        inside = side >= 0
+        nextInside = nextSide >= 0
+        crossing = inside != nextInside
+        denom = np.where( crossing, side - nextSide, 1.0)
+        t = (side / denom)[:, None]
+        xPts = output + t * (nextPts - output)
+
+        # each vertex emits itself if inside, and the crossing to the next if crossing
+        counts = inside.astype( int) + crossing.astype( int)
+        result = np.empty( (counts.sum(), 2))
+        pos = np.cumsum( counts) - counts
+        result[pos[inside]] = output[inside]
+        crossPos = pos + inside.astype( int)
+        result[crossPos[crossing]] = xPts[crossing]
+        output = result
+
+    return output
+
+
+#---------------------------------------------------------------------------
+# Conversion to reportlab paths
+#---------------------------------------------------------------------------
+
+# Public path method and number of operands of each PDF path operator
+_PATH_OPERATORS = {'m': ('moveTo', 2), 'l': ('lineTo', 2), 'c': ('curveTo', 6), 'h': ('close', 0)}
+
+def AppendPathCode( path, template, values):
+    '''
+    Appends the PDF path operators <template> % <values> to a reportlab
+    path. The path must already have been started with moveTo(). The
+    formatted code is appended in one go when the path has reportlab's
+    internal _code_append(); otherwise the operators of <template> are
+    replayed with the public moveTo(), lineTo(), curveTo() and close().
+    '''
+    codeAppend = getattr( path, '_code_append', None)
+    if codeAppend is not None:
+        codeAppend( template % values)
+        return
+    i = 0
+    for token in template.split():
+        if token in _PATH_OPERATORS:
+            method, count = _PATH_OPERATORS[token]
+            getattr( path, method)( *values[i - count:i])
+        else:
+            i += 1
+
+def IsReportlabPath( path):
+    return hasattr( path, 'getCode')
+
+def AddPolyToPath( path, poly, closePath):
+    '''
+    Adds the polygon or polyline <poly> to <path> as a new sub path.
+    For reportlab paths all the operators are formatted in one go, a
+    PathBuilder takes the array as it is, and other paths get a moveTo()
+    and lineTo() call per vertex.
+    '''
+    points = AsPoints( poly)
+    if len(points) == 0:
+        return path
+    if hasattr( path, 'AddPolyline'):
+        path.AddPolyline( points, closePath)
+        return path
+    x, y = points[0].tolist()
+    path.moveTo( x, y)
+    if IsReportlabPath( path):
+        if len(points) > 1:
+            AppendPathCode( path, " ".join( ["%.5f %.5f l"] * (len(points) - 1)), tuple( points[1:].ravel().tolist()))
+        if closePath:
+            path.close()
+    else:
+        for x, y in points[1:].tolist():
+            path.lineTo( x, y)
+        if closePath:
+            path.close()
+    return path
+
+def AddSegmentsToPath( path, segments):
+    '''
+    Adds the line <segments>, an (N, 4) array, to <path>, one sub path each.
+    '''
+    segments = np.asarray( segments, dtype=float).reshape( -1, 4)
+    if len(segments) == 0:
+        return path
+    if hasattr( path, 'AddSegments'):
+        path.AddSegments( segments)
+        return path
+    x0, y0, x1, y1 = segments[0].tolist()
+    path.moveTo( x0, y0)
+    path.lineTo( x1, y1)
+    if len(segments) == 1:
+        return path
+    if IsReportlabPath( path):
+        AppendPathCode( path, " ".join( ["%.5f %.5f m %.5f %.5f l"] * (len(segments) - 1)), tuple( segments[1:].ravel().tolist()))
+    else:
+        for x0, y0, x1, y1 in segments[1:].tolist():
+            path.moveTo( x0, y0)
+            path.lineTo( x1, y1)
+    return path
@@ -16,14 +16,40 @@
 #---------------------------------------------------------------------------
 
 
-from reportlab.lib.units import mm
+import logging
+import itertools
 from MSSPath import *
 from MSSPatternAndHatch import *
 from MSSDrawShapes import *
 from MSSStrokeDecoration import *
-from MSSError import BailOut
+from MSSSymbolModel import GetPartLayers
+from MSSColor import PdfBlendMode
+from MSSDisplayList import DisplayList
+from MSSFragmentCache import FragmentKey
+from MSSError import LayoutError
 
 
+log = logging.getLogger( __name__)
+
+# points per millimetre, the value of reportlab.lib.units.mm, defined here
+# so that drawing on canvases other than reportlab does not need reportlab
+mm = 72.0 / 2.54 * 0.1
+
+
+class LegendSlot(object):
+    '''
+    The position of a legend entry. x, y is the center of the graphical
+    legend element on page number <page>, counting from 0, lineLen the
+    precalculated length of line symbols.
+    '''
+    __slots__ = ('x', 'y', 'lineLen', 'page')
+
+    def __init__( self, x, y, lineLen=None, page=0):
+        self.x = x
+        self.y = y
+        self.lineLen = lineLen
+        self.page = page
+
 
 class MSSLegendDrawer(object):
     '''
@@ -39,40 +65,63 @@ class MSSLegendDrawer(object):
     legend_vspacing = 6.5 # mm
     legend_hspacing = 80
     
-    def __init__( self, theCanvas, xmlBaseColors, xmlColorLayers, xmlSymbols):
+    def __init__( self, theCanvas, spec, fragmentCache=None, errors=None, profiler=None):
         '''
    
         Parameters
         ----------
         theCanvas : reportlab.pdfgen.canvas
             a reportlab canvas element, shall be prepared to accept mm as unit
-        xmlBaseColors : xml.etree.ElementTree "BaseColors" element
-            Holds the base colours of the MSS file.
-        xmlColorLayers : xml.etree.ElementTree "ColorLayers" element
-            Holds the colour layers of the MMS file.
-        xmlSymbols : xml.etree.ElementTree "Symbols" element
-            Holds the symbol definitions of the MMS file.
+        spec : MSSSymbolModel.SymbolSpec
+            The compiled MSS file, see MSSSymbolModel.CompileSpec()
+        fragmentCache : MSSFragmentCache.FragmentCache, optional
+            Cache of the drawing of each symbol on each layer. Symbols found
+            in the cache are not drawn again.
+        errors : list, optional
+            If given, layout errors are appended to it instead of raised,
+            and the symbols are drawn as well as possible.
+        profiler : MSSProfile.Profiler, optional
+            Records the time and canvas operations of each layer and of each
+            symbol on each layer.
 
         Returns
         -------
         None.
 
         '''
-        self.canvas = theCanvas
-        self.baseColors = xmlBaseColors
-        self.colorLayers = xmlColorLayers
-        self.symbols = xmlSymbols
+        self.profiler = profiler
+        self.canvas = profiler.Wrap( theCanvas) if profiler is not None else theCanvas
+        self.spec = spec
+        self.fragmentCache = fragmentCache
+        self.errors = errors
+        self.colorLayers = spec.colorLayers
+        self.symbols = spec.symbols
+
+        # the pattern tile forms already defined on the canvas, name -> bounds
+        self.patternForms = {}
+
+        # the names of the forms of cached fragments defined on the canvas
+        self.splicedForms = set()
+
+        # the sample lines of line symbols, (x, y, lineLen) -> SvgPathIR
+        self.legendLines = {}
+
+        # the legend slot of each symbol, see GetSlots()
+        self.slots = None
         
         # convert into millimiter
         self.pageWidth, self.pageHeight = theCanvas._pagesize
         self.pageWidth /= mm
         self.pageHeight /= mm
 
-        print( "Page size", self.pageWidth, self.pageHeight)
+        log.debug( "Page size %s x %s mm", self.pageWidth, self.pageHeight)
+
+    # the page margin
+    legend_margin = 20  # mm
 
     def DrawSymbols( self):
         '''
-        Draws all the legend entries into its canvas.
+        Draws all the legend entries into its canvas, page by page.
         This is the main function of this class.
 
         Returns
@@ -80,106 +129,237 @@ class MSSLegendDrawer(object):
         None.
 
         '''
-        margin = 20
-        x0 = margin
-        y0 = self.pageHeight - margin
-        dy = self.legend_vspacing
+        for pageNo in range( self.PageCount()):
+            if pageNo > 0:
+                # a new page starts with the default coordinate system
+                self.canvas.showPage()
+                self.canvas.scale( mm, mm)
+            self.DrawPage( pageNo)
+
+    def GetSlots( self):
+        '''
+        Returns the legend slot of each symbol, see LayoutSymbols()
+        '''
+        if self.slots is None:
+            margin = self.legend_margin
+            self.slots = self.LayoutSymbols( margin, self.pageHeight - margin,
+                                             self.legend_vspacing, margin)
+        return self.slots
+
+    def PageCount( self):
+        '''
+        Returns the number of pages of the legend
+        '''
+        slots = self.GetSlots()
+        return slots[-1].page + 1 if slots else 1
+
+    def DrawPage( self, pageNo):
+        '''
+        Draws the legend entries of page <pageNo>, counting from 0, into
+        the canvas. The pages do not depend on each other and can be drawn
+        by different drawers, in any order.
+        '''
+        slots = self.GetSlots()
+        layerIndex = self.BuildLayerIndex( slots, pageNo)
+        profiler = self.profiler
 
         # draw symbols, color layer by color layer:
         for layer in reversed(self.colorLayers):
-            print( "LAYER:", layer.attrib['id'])
+            entries = layerIndex.get( layer.id)
+            if not entries:
+                continue
+            log.debug( "LAYER: %s", layer.id)
+            if profiler is not None:
+                layerToken = profiler.Start()
             self.SetLayerStyle( layer)
-            xs = x0
-            ys = y0
-            for symbol in self.symbols:
-                symbolType = symbol.attrib['type']
-
-                if (symbolType == 'point'):
-                    self.DrawPointSymbol( xs, ys, layer, symbol)
-                elif (symbolType == 'area'):
-                    self.DrawAreaSymbol( xs, ys, layer, symbol)
-                elif (symbolType == 'line'):
-                    self.DrawStrokeSymbol( xs, ys, layer, symbol)
-                ys -= dy
-                if ys < margin:
-                    ys = self.pageHeight  - margin
-                    xs += self.legend_hspacing
+            for (symbol, slot), group in itertools.groupby( entries, lambda entry: (entry[0], entry[2])):
+                if profiler is None:
+                    self.DrawEntry( slot, layer, symbol, [part for _, part, _ in group])
+                else:
+                    token = profiler.Start()
+                    self.DrawEntry( slot, layer, symbol, [part for _, part, _ in group])
+                    profiler.Stop( token, 'symbol', symbol.id, layer.id, pageNo)
+            if profiler is not None:
+                profiler.Stop( layerToken, 'layer', None, layer.id, pageNo)
+
+        if profiler is not None:
+            token = profiler.Start()
+        self.DrawNames( slots, pageNo)
+        if profiler is not None:
+            profiler.Stop( token, 'names', page=pageNo)
+
+    def DrawSymbol( self, symbol, x, y):
+        '''
+        Draws the graphical legend element of one <symbol>, centered on
+        x, y, without its name. Only the parts of <symbol> are visited, so
+        this is fast for thumbnails of single symbols.
+        '''
+        lineLen = self.CalcLineLength( symbol) if (symbol.type == 'line') else None
+        slot = LegendSlot( x, y, lineLen)
+        for layer in reversed(self.colorLayers):
+            parts = [part for part in symbol.parts if layer in GetPartLayers( part)]
+            if parts:
+                self.SetLayerStyle( layer)
+                self.DrawEntry( slot, layer, symbol, parts)
+
+    def DrawEntry( self, slot, layer, symbol, parts):
+        '''
+        Draws the <parts> of <symbol> painting on <layer> in its legend <slot>.
+        The layer style shall be set.
+        '''
+        # each symbol is drawn centered on the origin, so the
+        # drawing does not depend on where the symbol is placed
+        self.canvas.saveState()
+        self.canvas.translate( slot.x, slot.y)
+        origin = LegendSlot( 0, 0, slot.lineLen)
+        if self.fragmentCache is None:
+            self.DrawSymbolParts( origin, layer, symbol, parts)
+        else:
+            self.DrawCachedSymbolParts( origin, layer, symbol, parts)
+        self.canvas.restoreState()
 
+    def LayoutSymbols( self, x0, y0, dy, margin):
+        '''
+        Assigns a legend slot to each symbol, top down and column by column,
+        and page by page when the columns do not fit on the page.
 
-                    
-        self.DrawNames( x0+10, y0, dy)
+        Returns
+        -------
+        list of LegendSlot
+            One slot for each symbol, in the same order as the symbols.
+
+        '''
+        slots = []
+        xs = x0
+        ys = y0
+        page = 0
+        for symbol in self.symbols:
+            lineLen = None
+            if (symbol.type == 'line'):
+                lineLen = self.CalcLineLength( symbol)
+            slots.append( LegendSlot( xs, ys, lineLen, page))
+            ys -= dy
+            if ys < margin:
+                ys = y0
+                xs += self.legend_hspacing
+                if (xs + self.legend_hspacing - margin > self.pageWidth):
+                    xs = x0
+                    page += 1
+        return slots
+
+    def BuildLayerIndex( self, slots, pageNo=None):
+        '''
+        Builds an index from layer id to the parts painting on that layer.
+
+        Parameters
+        ----------
+        slots : list of LegendSlot
+            The legend slot of each symbol, see LayoutSymbols()
+        pageNo : int, optional
+            Only index the symbols on this page
+
+        Returns
+        -------
+        dict
+            Maps the layer id to a list of (symbol, part, slot) tuples, in
+            symbol order and part order.
+
+        '''
+        layerIndex = {}
+        for symbol, slot in zip( self.symbols, slots):
+            if (pageNo is not None) and (slot.page != pageNo):
+                continue
+            for part in symbol.parts:
+                for layer in GetPartLayers( part):
+                    layerIndex.setdefault( layer.id, []).append( (symbol, part, slot))
+        return layerIndex
+
+    def DrawSymbolParts( self, slot, layer, symbol, parts):
+        '''
+        Draws the <parts> of <symbol> that paint on <layer> in its legend <slot>
+        '''
+        if (symbol.type == 'point'):
+            self.DrawPointParts( slot.x, slot.y, layer, parts)
+            return
+        for part in parts:
+            self.DrawPart( slot, layer, symbol, part)
+
+    def DrawCachedSymbolParts( self, slot, layer, symbol, parts):
+        '''
+        Same as DrawSymbolParts(), but the drawing is taken from the fragment
+        cache if it is there, and else recorded and added to the cache.
+        '''
+        key = FragmentKey( self.spec, symbol, layer, (self.legend_width, self.legend_height, slot.lineLen))
+        fragment = self.fragmentCache.Get( key)
+        if fragment is None:
+            fragment = self.RecordSymbolParts( slot, layer, symbol, parts)
+            self.fragmentCache.Put( key, fragment)
+        fragment.Replay( self.canvas, self.splicedForms)
+
+    def RecordSymbolParts( self, slot, layer, symbol, parts):
+        '''
+        Draws the <parts> into a new DisplayList and returns it. The list
+        holds the definitions of all the forms it uses.
+        '''
+        canvas = self.canvas
+        patternForms = self.patternForms
+        self.canvas = DisplayList( canvas._pagesize)
+        self.patternForms = {}
+        try:
+            self.DrawSymbolParts( slot, layer, symbol, parts)
+            return self.canvas
+        finally:
+            self.canvas = canvas
+            self.patternForms = patternForms
+
+    def DrawPart( self, slot, layer, symbol, part):
+        '''
+        Draws the <part> of <symbol> that paints on <layer> in its legend <slot>
+        '''
+        symbolType = symbol.type
+
+        if (symbolType == 'point'):
+            self.DrawPointPart( slot.x, slot.y, layer, part)
+        elif (symbolType == 'area'):
+            self.DrawAreaPart( slot.x, slot.y, layer, part)
+        elif (symbolType == 'line'):
+            self.DrawStrokePart( slot.x, slot.y, layer, part, slot.lineLen)
         
 
-    def SetLayerStyle( self, xmlLayer):
+    def SetLayerStyle( self, layer):
         '''
             Sets the stroke color and fill color according to layer specification
             before drawing anything associated with this layers
-            The <layer> is an xml element.
+            The <layer> is a ColorLayer.
         '''
         
-        tint = 1.0
-        opacity = 1.0
-        blend = 'normal'
-        overprint = False
-
-        colorId = xmlLayer.attrib['color']
-        baseColor = self.baseColors.find(".//color[@id='%s']" % colorId)
-        cmyk = baseColor.attrib['cmyk']
-        c, m, y, k = cmyk.split(',')       
-        
-        if ('tint') in xmlLayer.attrib:
-            tint = float(xmlLayer.attrib['tint'])
-            
-        c = float(c) * tint
-        m = float(m) * tint
-        y = float(y) * tint
-        k = float(k) * tint
-        
-        if ('opacity' in xmlLayer.attrib):
-            opacity = float( xmlLayer.attrib['opacity'])
-            
-        if ('blend' in xmlLayer.attrib):
-            blend = xmlLayer.attrib['blend']
-            # not supported by reportlab?
-
-        if ('overprint' in xmlLayer.attrib):
-            if xmlLayer.attrib['overprint'] == "yes":
-                overprint = True
-            
+        color = self.spec.colors[layer]
+        c, m, y, k = color.cmyk
         
         self.canvas.setStrokeColorCMYK( c, m, y, k)
         self.canvas.setFillColorCMYK( c, m, y, k)
         
-        self.canvas.setStrokeOverprint( overprint)
-        self.canvas.setFillOverprint( overprint)
+        self.canvas.setStrokeOverprint( color.overprint)
+        self.canvas.setFillOverprint( color.overprint)
         
-        self.canvas.setStrokeAlpha( opacity)
-        self.canvas.setFillAlpha( opacity)
+        self.canvas.setStrokeAlpha( color.opacity)
+        self.canvas.setFillAlpha( color.opacity)
         
-        # self.canvas,setBlendMode( blend)
+        self.canvas.setBlendMode( PdfBlendMode( color.blend))
     
-    def SetStrokeStyle( self, xmlElement):
+    def SetStrokeStyle( self, part):
         '''
-        Provided an xmlElement containing a strok style, sets the style
+        Provided a part with a stroke style, sets the style
         before drawing any element
         '''
 
-        lineLen = self.legend_width
-       
-        sWidth = float( xmlElement.attrib['stroke-width'])
-        sCap = 0
-        sJoin = 0
-        sMiterLimit = 4
-        
-        
-
-        sDash, sDashOffset = ParseStrokeDash( xmlElement)
-        if ('stroke-linecap' in xmlElement.attrib):
-            sCap = ['but','round','square','pointed'].index( xmlElement.attrib['stroke-linecap'])
-        if ('stroke-linejoin' in xmlElement.attrib):
-            sJoin = ['miter','bevel','round'].index( xmlElement.attrib['stroke-linejoin'])
-        if ('stroke-miterlimit' in xmlElement.attrib):
-            sMiterLimit = float( xmlElement.attrib['stroke-miterlimit'])
+        style = part.style
+        sWidth = style.width
+        sCap = style.lineCap
+        sJoin = style.lineJoin
+        sMiterLimit = style.miterLimit
+        sDash = list( style.dashArray)
+        sDashOffset = style.dashOffset
 
         if (sCap == 3):
             sCap = 0    # pointed line caps is not legal in PDF and must be handled specially.
@@ -191,60 +371,76 @@ class MSSLegendDrawer(object):
         self.canvas.setMiterLimit( sMiterLimit)
            
                 
-    def DrawPointSymbol( self, xs, ys, layer, xmlSymbol):
+    def DrawPointSymbol( self, xs, ys, layer, symbol):
         '''
         Draws a point symbol based on its specification centered on xs, ys.
         Only draw if the fill or stroke attribute of the symbol matches the current <layer>
 
         '''
         
-        layerId = layer.attrib['id']
-        for part in xmlSymbol:
+        self.DrawPointParts( xs, ys, layer, symbol.parts)
+
+    def DrawPointParts( self, xs, ys, layer, parts):
+        '''
+        Draws the <parts> of a point symbol filled or stroked with <layer>,
+        centered on xs, ys. Consecutive parts with the same style are
+        painted together as one path, see BatchShapes().
+        '''
+        parts = [part for part in parts if (part.fill is layer) or (part.stroke is layer)]
+        for batch in BatchShapes( parts):
+            if (batch[0].stroke is layer):
+                self.SetStrokeStyle( batch[0])
+            self.canvas.saveState()
+            self.canvas.translate( xs, ys)
+
+            DrawShapes( self.canvas, batch, layer)
+
+            self.canvas.restoreState()
+
+    def DrawPointPart( self, xs, ys, layer, part):
+        '''
+        Draws one part of a point symbol centered on xs, ys, if it
+        is filled or stroked with <layer>.
+        '''
+
+        doThisLayer = False
+        if (part.fill is layer):
+            doThisLayer = True
             
-            fill = part.attrib.get('fill')
-            stroke = part.attrib.get('stroke')
+        if (part.stroke is layer):
+            self.SetStrokeStyle(part)
+            doThisLayer = True
             
-            doThisLayer = False
-            if (fill == layerId):
-                doThisLayer = True
-                
-            if (stroke == layerId):
-                self.SetStrokeStyle(part)
-                doThisLayer = True
-                
-            if doThisLayer:
-                self.canvas.saveState()
-                self.canvas.translate( xs, ys)
+        if doThisLayer:
+            self.canvas.saveState()
+            self.canvas.translate( xs, ys)
 
-                DrawShape( self.canvas, part)
+            DrawShape( self.canvas, part, layer)
 
-                self.canvas.restoreState()
+            self.canvas.restoreState()
                         
     def DrawAreaSymbol( self, xs, ys, layer, symbol):
         '''
         Draws a square and fills it accroding to the symbol specification
         '''
-        layerId = layer.attrib['id']
-        for part in symbol:
-            if (part.tag == 'path'):
-                if ('fill' in part.attrib):
-                    fill = part.attrib['fill']
-                    if (fill == layerId):
-                        self.DrawLegendArea( xs, ys)
-                if ('stroke' in part.attrib):
-                    stroke = part.attrib['stroke']
-                    if (stroke == layerId):
-                        self.SetStrokeStyle( part)
-                        self.DrawLegendAreaOutline(xs, ys)
-            if (part.tag == 'hatch'):
-                stroke = part.attrib['stroke']
-                if (stroke == layerId):
-                    self.DrawLegendHatch( xs, ys, part)
-            if (part.tag == 'pattern'):
-                self.DrawLegendPattern( xs, ys, layer, part)
-                
-            # TODO: add pattern
-            
+        for part in symbol.parts:
+            self.DrawAreaPart( xs, ys, layer, part)
+
+    def DrawAreaPart( self, xs, ys, layer, part):
+        '''
+        Draws one part of an area symbol onto the legend square centered on xs, ys
+        '''
+        if (part.tag == 'path'):
+            if (part.fill is layer):
+                self.DrawLegendArea( xs, ys)
+            if (part.stroke is layer):
+                self.SetStrokeStyle( part)
+                self.DrawLegendAreaOutline(xs, ys)
+        if (part.tag == 'hatch'):
+            if (part.stroke is layer):
+                self.DrawLegendHatch( xs, ys, part)
+        if (part.tag == 'pattern'):
+            self.DrawLegendPattern( xs, ys, layer, part)
 
                     
     def DrawStrokeSymbol( self, xs, ys, layer, symbol):
@@ -255,10 +451,10 @@ class MSSLegendDrawer(object):
         ----------
         xs, ys : float
             The center ot the legend symbol field.
-        layer : xml layer element
+        layer : ColorLayer
             The layer currently being drawn. Will only draw anything if the specific
             symbol has a color on this layer
-        symbol : xml symbol element
+        symbol : Symbol
             Contains the symbol specification
 
         Returns
@@ -266,57 +462,53 @@ class MSSLegendDrawer(object):
         None.
 
         '''
-        layerId = layer.attrib['id']
         lineLen = self.CalcLineLength( symbol)
-        for part in symbol:
-            # print( "LINE LEN = ", lineLen, "of", symbol.attrib['id'])
-            if (part.tag == 'path'):
-                stroke = part.attrib['stroke']
-                if (stroke == layerId):
-                    self.SetStrokeStyle( part)
-                    strokeOffset = 0.0
-                    if ('stroke-offset' in part.attrib):
-                        strokeOffset = float(part.attrib['stroke-offset'])
-                    self.DrawLegendLine( xs, ys+strokeOffset, lineLen)
-#                    if ('stroke-linecap' in part.attrib) and (part.attrib['stroke-linecap'] == 'pointed'):
-#                        self.DrawPointedLineCaps( xs, ys, lineLen, part)
-            if (part.tag == 'stroke-decoration'):
-                decorationType = part.attrib['type']
-                if (decorationType == 'regular'):
-                    DrawRegularStrokeDecoration( self, xs, ys, layerId, lineLen, part)
-                elif (decorationType == 'dash-point'):
-                    DrawDashPointStrokeDecoration( self, xs, ys, layerId, lineLen, part)
-                elif (decorationType == 'start-point'):
-                    DrawStartPointStrokeDecoration( self, xs, ys, layerId, lineLen, part)
-                elif (decorationType == 'end-point'):
-                    DrawEndPointStrokeDecoration( self, xs, ys, layerId, lineLen, part)
-
-            # TODO: Add stroke decaration
+        for part in symbol.parts:
+            self.DrawStrokePart( xs, ys, layer, part, lineLen)
+
+    def DrawStrokePart( self, xs, ys, layer, part, lineLen):
+        '''
+        Draws one part of a line symbol, a line of length <lineLen> centered on xs, ys.
+        lineLen is precalculated by CalcLineLength()
+        '''
+        line = self.GetLegendLine( xs, ys, lineLen)
+        if (part.tag == 'path'):
+            if (part.stroke is layer):
+                self.SetStrokeStyle( part)
+                self.DrawLegendLine( line, part.style)
+#                if (part.style.lineCap == 3):
+#                    self.DrawPointedLineCaps( xs, ys, lineLen, part)
+        if (part.tag == 'stroke-decoration'):
+            DrawStrokeDecoration( self, line.Flatten()[0], layer, part)
 
   
 
-    def CalcLineLength( self, xmlSymbol):
+    def CalcLineLength( self, symbol):
         # Calculates the length of the line so that dash pattern and/or stroke decoration
         # matches exactly.
         lineLen = self.legend_width
         decorLen = lineLen
         dashLen = lineLen
  #       capLen = 0
-        for part in xmlSymbol:
+        for part in symbol.parts:
             if (part.tag == 'stroke-decoration'):
-                if (part.attrib['type'] == 'regular'):
+                if (part.type == 'regular'):
                     decorLen = CalcLineLengthFromDecoration( part, lineLen)
-            if (part.tag == 'path'):
-                if ('stroke-dasharray' in part.attrib):
-                    dashLen = CalcLineLengthFromDash( part, lineLen)
-#                if ('stroke-linecap' in part.attrib) and part.attrib['stroke-linecap'] == 'pointed':
-#                    if ('stroke-caplength' in part.attrib):
-#                        capLen = float(part.attrib['stroke-caplength'])
+            if (part.tag == 'path') and (part.style is not None):
+                if (part.style.dashArray):
+                    dashLen = CalcLineLengthFromDash( part.style, lineLen)
+#                if (part.style.lineCap == 3):
+#                    if (part.style.capLength is not None):
+#                        capLen = part.style.capLength
 #                    else:
-#                        capLen = float(part.attrib['stroke-width'])
+#                        capLen = part.style.width
 #                    lineLen -= (capLen * 2)
             if (decorLen != lineLen) and (dashLen != lineLen) and (dashLen != decorLen):
-                BailOut( "Error in symbol %s. Dash array do not match stroke decoration spacing", xmlSymbol.attrib['id'])
+                error = LayoutError( "Dash array do not match stroke decoration spacing", symbolId=symbol.id)
+                if self.errors is None:
+                    raise error
+                self.errors.append( error)
+                break
 
         if (decorLen < lineLen):
             return decorLen
@@ -330,8 +522,8 @@ class MSSLegendDrawer(object):
 
         Parameters
         ----------
-        layer : layer
-            an xml color layer element.
+        layer : ColorLayer
+            a compiled color layer.
 
         Returns
         -------
@@ -340,34 +532,13 @@ class MSSLegendDrawer(object):
         opacity : float
             The opacity of the layer. Will be in the range 0.1
         blend : string
-            Any blending mode accepted in the SVG file format
+            One of MSSColor.BLEND_MODES
 
         '''
         
-        tint = 1.0
-        opacity = 1.0
-        blend = 'normal'
-
-        colorId = layer.attrib['color']
-        baseColor = self.baseColors.find(".//color[@id='%s']" % colorId)
-        cmyk = baseColor.attrib['cmyk']
-        c, m, y, k = cmyk.split(',')       
-        
-        if ('tint') in layer.attrib:
-            tint = float(layer.attrib['tint'])
-            
-        c = float(c) * tint
-        m = float(m) * tint
-        y = float(y) * tint
-        k = float(k) * tint
-        
-        if ('opacity' in layer.attrib):
-            opacity = float( layer.attrib['opacity'])
-            
-        if ('blend' in layer.attrib):
-            blend = layer.attrib['blend']
-            
-        return c, m, y, k, opacity, blend
+        color = self.spec.colors[layer]
+        c, m, y, k = color.cmyk
+        return c, m, y, k, color.opacity, color.blend
 
        
         
@@ -403,37 +574,45 @@ class MSSLegendDrawer(object):
         self.canvas.restoreState()
 
     def DrawLegendPattern(self, xs, ys, layer, pattern):
-        self.canvas.saveState()
-
+        '''
+        Draws a pattern filled area centered at x, y. DrawPattern() takes
+        care of clipping.
+        '''
         rectPoly = CreatePolyFromRect( xs, ys, self.legend_width, self.legend_height)
-        path = CreatePathFromPoly( self.canvas, rectPoly, True)
-        self.canvas.clipPath( path, stroke=0, fill=0)
-        
         DrawPattern( self, layer, pattern, rectPoly)
         
-        self.canvas.restoreState()
-        
         
 
-    def DrawLegendLine( self, x, y, lineLen):
+    def GetLegendLine( self, x, y, lineLen):
         '''
-        Draws a line using the current line style centered at x, y
-        In order to draw a complete number of dashes, a <lineLen> is precalculated
-        so we do not end up with half a dash at the end.
+        Returns the sample line of a line symbol centered at x, y as an
+        SvgPathIR. In order to draw a complete number of dashes, a <lineLen>
+        is precalculated so we do not end up with half a dash at the end.
+        The line is shared by all the layer passes, so its offsets are only
+        calculated once.
         '''
-        
-        p = self.canvas.beginPath()
-        p.moveTo( x - lineLen*0.5, y)
-        p.lineTo( x + lineLen*0.5, y)
-        self.canvas.drawPath( p)
+        key = (x, y, lineLen)
+        line = self.legendLines.get( key)
+        if line is None:
+            line = SvgPathIR.FromPolyline( ((x - lineLen*0.5, y), (x + lineLen*0.5, y)))
+            self.legendLines[key] = line
+        return line
+
+    def DrawLegendLine( self, line, style):
+        '''
+        Strokes <line> using the current line style, offset sideways by the
+        stroke-offset of <style>
+        '''
+        for poly, closed in line.Offset( style.offset, style.lineJoin, style.miterLimit):
+            self.canvas.drawPath( CreatePathFromPoly( self.canvas, poly, closed))
         
         # TODO: This is just a straght line. Draw a more complex line to better
         # test stroke decorations.
         
-    def DrawPointedLineCaps( self, xs, ys, lineLen, xmlPath):
-        strokeWidth = float( xmlPath.attrib['stroke-width'])
-        if ('stroke-caplength' in xmlPath.attrib):
-            capLen = float( xmlPath.attrib['stroke-caplength'])
+    def DrawPointedLineCaps( self, xs, ys, lineLen, part):
+        strokeWidth = part.style.width
+        if (part.style.capLength is not None):
+            capLen = part.style.capLength
         else:
             capLen = strokeWidth
         self._DrawPointedCap( xs - lineLen*0.5, ys, -1, capLen, strokeWidth)
@@ -450,36 +629,36 @@ class MSSLegendDrawer(object):
         self.canvas.drawPath(p, stroke=0, fill=1)
 
 
-    def DrawNames( self, x, starty, dy):
+    def DrawNames( self, slots, pageNo):
         '''
-        Draw all the symbol names
+        Draw the names of the symbols on page <pageNo>, to the right of
+        their legend slots
 
         Parameters
         ----------
-        x : float
-            the x coordinate of all name texts
-        starty : flaot
-            The y coordiante of the first entry
-        dy : float
-            The line spacing between each entry
+        slots : list of LegendSlot
+            The legend slot of each symbol
+        pageNo : int
+            The page being drawn
 
         Returns
         -------
         None.
 
         '''
-        y = starty - 1.0
-        
+        # the names are opaque black, whatever the style of the last layer
         self.canvas.setFillColorCMYK(0,0,0,1)
+        self.canvas.setFillOverprint( False)
+        self.canvas.setFillAlpha( 1)
+        self.canvas.setBlendMode( 'Normal')
         self.canvas.setFont( "Helvetica", 3)
         
-        for symbol in self.symbols:
-            symbolName = symbol.attrib['id'] + " " + symbol.attrib['name'] 
-            (  symbolName)
-            self.canvas.drawString( x, y, symbolName)
-            print( symbolName)
-
-            y -= dy
+        for symbol, slot in zip( self.symbols, slots):
+            if (slot.page != pageNo):
+                continue
+            symbolName = symbol.id + " " + symbol.name
+            self.canvas.drawString( slot.x + 10, slot.y - 1.0, symbolName)
+            log.debug( "%s", symbolName)
 
         
                                
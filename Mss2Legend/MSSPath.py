@@ -7,6 +7,12 @@ Created on Sat Nov 22 07:57:07 2025
 
 import re
 import math
+import array
+import functools
+import numpy as np
+from MSSError import PathDataError
+from MSSGeometry import RectPoints, RotatePoints, Bounds, AddPolyToPath, \
+                        IsReportlabPath, AppendPathCode, FlattenCurve, OffsetPolyline
 
 def ParseStrokeDash( xmlPath):
     sDash = []
@@ -18,105 +24,341 @@ def ParseStrokeDash( xmlPath):
     return sDash, sDashOffset
 
 
-def ParseSvgPath(canvas,d):
+# Tokens of the SVG path syntax: a command letter, a number, or any
+# other letter, which is an unsupported command. Numbers follow the full
+# SVG syntax, including exponents and packed numbers like "1.5.5" (1.5, .5)
+_SVG_TOKEN_RE = re.compile(r"""
+    ([MmLlHhVvCcZz])                                    # supported command
+    |([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)    # number
+    |([A-Za-z])                                         # unsupported command
+""", re.VERBOSE)
+
+# Operators of the compiled path, see CompileSvgPath()
+PATH_MOVETO = 0
+PATH_LINETO = 1
+PATH_CURVETO = 2
+PATH_CLOSE = 3
+
+# Number of coordinates used by each operator
+PATH_COORD_COUNT = (2, 2, 6, 0)
+
+
+class SvgPathIR(object):
     '''
-    Creates a reportlab path object from an SVG path element
+    A compiled SVG path. ops holds one operator (PATH_MOVETO, PATH_LINETO,
+    PATH_CURVETO or PATH_CLOSE) per segment, and coords the absolute
+    coordinates used by the operators as one flat array.
+    Instances are shared through the cache of CompileSvgPath() and shall
+    not be modified.
+    '''
+    __slots__ = ('ops', 'coords', '_bounds', '_flat', '_offsets')
+
+    def __init__( self, ops, coords):
+        self.ops = ops
+        self.coords = coords
+        self._bounds = None
+        self._flat = {}
+        self._offsets = {}
+
+    @classmethod
+    def FromPolyline( cls, points):
+        '''
+        Creates a path of straight lines through <points>
+        '''
+        points = np.asarray( points, dtype=float).reshape( -1, 2)
+        ops = bytes( (PATH_MOVETO,)) + bytes( (PATH_LINETO,)) * (len(points) - 1)
+        return cls( ops, array.array( 'd', points.ravel().tolist()))
+
+    def Bounds( self):
+        '''
+        Returns (xMin, yMin, xMax, yMax) of all points, including the Bezier
+        control points. This encloses the path, or is None for an empty path.
+        '''
+        if (self._bounds is None) and (len(self.coords) > 0):
+            xs = self.coords[0::2]
+            ys = self.coords[1::2]
+            self._bounds = (min(xs), min(ys), max(xs), max(ys))
+        return self._bounds
+
+    def Flatten( self, tolerance=0.01):
+        '''
+        Returns the path as a list of polylines, one (N, 2) array per sub
+        path, with the Bezier curves replaced by line segments deviating at
+        most <tolerance> from the curve. Closed sub paths end with their
+        first point. The result is cached per tolerance.
+        '''
+        if tolerance in self._flat:
+            return self._flat[tolerance]
+        coords = self.coords
+        result = []
+        current = []
+        i = 0
+        for op in self.ops:
+            if op == PATH_MOVETO:
+                if len(current) > 1:
+                    result.append( np.vstack( current))
+                current = [np.array( [coords[i:i+2]])]
+                i += 2
+            elif op == PATH_LINETO:
+                current.append( np.array( [coords[i:i+2]]))
+                i += 2
+            elif op == PATH_CURVETO:
+                p0 = current[-1][-1]
+                current.append( FlattenCurve( p0, coords[i:i+2], coords[i+2:i+4], coords[i+4:i+6], tolerance))
+                i += 6
+            elif current:
+                current.append( current[0][:1])
+                result.append( np.vstack( current))
+                # a new sub path starts at the same point unless there is a moveto
+                current = [current[0][:1]]
+        if len(current) > 1:
+            result.append( np.vstack( current))
+        self._flat[tolerance] = result
+        return result
+
+    def Offset( self, distance, lineJoin=0, miterLimit=4.0, tolerance=0.01):
+        '''
+        Returns the path offset sideways by <distance>, see OffsetPolyline(),
+        as a list of (polyline, closed) tuples, one for each sub path.
+        The result is cached, so a path drawn with the same offset on several
+        layers is only offset once.
+        '''
+        key = (distance, lineJoin, miterLimit, tolerance)
+        if key in self._offsets:
+            return self._offsets[key]
+        result = []
+        for poly in self.Flatten( tolerance):
+            closed = (len(poly) > 2) and bool( np.all( poly[0] == poly[-1]))
+            result.append( (OffsetPolyline( poly, distance, lineJoin, miterLimit, closed, tolerance), closed))
+        self._offsets[key] = result
+        return result
+
+    def Replay( self, path):
+        '''
+        Draws the path onto <path>, which can be any object with the methods
+        moveTo(), lineTo(), curveTo() and close(), like a reportlab path.
+        A PathBuilder gets the whole path at once, and long paths are
+        formatted in one go into reportlab paths.
+        '''
+        if hasattr( path, 'AddPath'):
+            path.AddPath( self)
+            return
+        coords = self.coords
+        if (len(self.ops) > _BULK_REPLAY_MIN) and (self.ops[0] == PATH_MOVETO) and IsReportlabPath( path):
+            path.moveTo( coords[0], coords[1])
+            template = " ".join( [_PDF_OP_FORMAT[op] for op in self.ops[1:]])
+            AppendPathCode( path, template, tuple( coords[2:]))
+            return
+        moveTo = path.moveTo
+        lineTo = path.lineTo
+        curveTo = path.curveTo
+        i = 0
+        for op in self.ops:
+            if op == PATH_LINETO:
+                lineTo( coords[i], coords[i+1])
+                i += 2
+            elif op == PATH_CURVETO:
+                curveTo( coords[i], coords[i+1], coords[i+2], coords[i+3], coords[i+4], coords[i+5])
+                i += 6
+            elif op == PATH_MOVETO:
+                moveTo( coords[i], coords[i+1])
+                i += 2
+            else:
+                path.close()
+
+
+# PDF path operators of each path operator, see SvgPathIR.Replay()
+_PDF_OP_FORMAT = ("%.5f %.5f m", "%.5f %.5f l", "%.5f %.5f %.5f %.5f %.5f %.5f c", "h")
+
+# Shorter paths are replayed with one call per operator
+_BULK_REPLAY_MIN = 32
+
+# Distance of the Bezier control points of a quarter circle of radius 1
+_KAPPA = 4 * (math.sqrt( 2) - 1) / 3
+
+
+class PathBuilder(object):
+    '''
+    Collects a path with the same methods as a reportlab path, and
+    compiles it into an SvgPathIR. Used by the canvases that are not
+    reportlab canvases, like the display list.
+    '''
+    __slots__ = ('ops', 'coords')
+
+    def __init__( self):
+        self.ops = bytearray()
+        self.coords = array.array( 'd')
+
+    def moveTo( self, x, y):
+        self.ops.append( PATH_MOVETO)
+        self.coords.extend( (x, y))
+
+    def lineTo( self, x, y):
+        self.ops.append( PATH_LINETO)
+        self.coords.extend( (x, y))
+
+    def curveTo( self, x1, y1, x2, y2, x3, y3):
+        self.ops.append( PATH_CURVETO)
+        self.coords.extend( (x1, y1, x2, y2, x3, y3))
+
+    def close( self):
+        self.ops.append( PATH_CLOSE)
+
+    def rect( self, x, y, width, height):
+        self.ops.extend( (PATH_MOVETO, PATH_LINETO, PATH_LINETO, PATH_LINETO, PATH_CLOSE))
+        self.coords.extend( (x, y, x + width, y, x + width, y + height, x, y + height))
+
+    def circle( self, x_cen, y_cen, r):
+        '''
+        Adds a circle as four Bezier curves, counter-clockwise from the
+        rightmost point like a reportlab path
+        '''
+        k = r * _KAPPA
+        self.ops.extend( (PATH_MOVETO, PATH_CURVETO, PATH_CURVETO, PATH_CURVETO, PATH_CURVETO))
+        self.coords.extend( (x_cen + r, y_cen,
+                             x_cen + r, y_cen + k, x_cen + k, y_cen + r, x_cen, y_cen + r,
+                             x_cen - k, y_cen + r, x_cen - r, y_cen + k, x_cen - r, y_cen,
+                             x_cen - r, y_cen - k, x_cen - k, y_cen - r, x_cen, y_cen - r,
+                             x_cen + k, y_cen - r, x_cen + r, y_cen - k, x_cen + r, y_cen))
+
+    def AddPath( self, ir):
+        '''
+        Appends all of the compiled path <ir>
+        '''
+        self.ops.extend( ir.ops)
+        self.coords.extend( ir.coords)
+
+    def AddPolyline( self, points, closePath):
+        '''
+        Appends the (N, 2) array <points> as a sub path
+        '''
+        if len(points) == 0:
+            return
+        self.ops.append( PATH_MOVETO)
+        self.ops.extend( bytes( (PATH_LINETO,)) * (len(points) - 1))
+        if closePath:
+            self.ops.append( PATH_CLOSE)
+        self.coords.frombytes( np.ascontiguousarray( points, dtype=float).tobytes())
+
+    def AddSegments( self, segments):
+        '''
+        Appends the (N, 4) array <segments> as one sub path each
+        '''
+        self.ops.extend( bytes( (PATH_MOVETO, PATH_LINETO)) * len(segments))
+        self.coords.frombytes( np.ascontiguousarray( segments, dtype=float).tobytes())
+
+    def Compile( self):
+        return SvgPathIR( bytes( self.ops), array.array( 'd', self.coords))
+
+
+@functools.lru_cache( maxsize=4096)
+def CompileSvgPath( d):
+    '''
+    Compiles the "d" attribute of an SVG path element into an SvgPathIR.
+    The commands M, L, H, V, C and Z are supported, both absolute and
+    relative. The result is cached, so identical paths are only parsed once.
 
     Parameters
     ----------
-    canvas : reportlab canvas
     d : string
         holds the "d" attribute of an SVG path element.
 
     Returns
     -------
-    canvas path object.
+    SvgPathIR
 
     '''
-
-    thePath = canvas.beginPath()
-
-    # Tokenize: commands or numbers
-    token_re = re.compile(r"""
-        ([MLCZmlcz])              # SVG command
-        |([-+]?[0-9]*\.?[0-9]+)   # Number
-    """, re.VERBOSE)
-
-    tokens = token_re.findall(d)
-    # Flatten: each match gives (command, number)
-    tokens = [t[0] or t[1] for t in tokens]
-
-    i = 0
-
-    def get_number():
-        nonlocal i
-        val = float(tokens[i])
-        i += 1
-        return val
-
-    current_cmd = None
-
-    x = y = 0   # Current position
-
-    while i < len(tokens):
-        t = tokens[i]
-
-        # If token is a command letter, advance and set it
-        if re.match(r'[MLCZmlcz]', t):
-            current_cmd = t
-            i += 1
-        # Else the command repeats
-
-        cmd = current_cmd.upper()
-        is_rel = current_cmd.islower()
-
-        if cmd == 'M':  # moveto
-            # First pair is moveto, subsequent pairs are implicit lineto
-            while i < len(tokens) and not re.match(r'[MLCZmlcz]', tokens[i]):
-                nx = get_number()
-                ny = get_number()
-                if is_rel:
+    ops = bytearray()
+    coords = array.array( 'd')
+
+    numbers = []
+    commands = []       # (command, index of its first number)
+    for command, number, unsupported in _SVG_TOKEN_RE.findall( d):
+        if number:
+            numbers.append( float( number))
+        elif command:
+            commands.append( (command, len(numbers)))
+        else:
+            raise PathDataError( "Unsupported SVG path command '%s' in \"%s\"", (unsupported, d))
+    if (commands[0][1] if commands else len(numbers)) > 0:
+        raise PathDataError( "Coordinates before the first command in SVG path \"%s\"", d)
+    commands.append( (None, len(numbers)))
+
+    x = y = 0.0         # current point
+    startX = startY = 0.0   # start of current sub path
+
+    for (command, first), (_, last) in zip( commands, commands[1:]):
+        cmd = command.upper()
+        isRel = command.islower()
+        args = numbers[first:last]
+
+        if cmd == 'Z':
+            ops.append( PATH_CLOSE)
+            x, y = startX, startY
+            continue
+
+        if cmd == 'M' or cmd == 'L':
+            step = 2
+        elif cmd == 'C':
+            step = 6
+        else:
+            step = 1
+        if (len(args) == 0) or (len(args) % step != 0):
+            raise PathDataError( "Wrong number of coordinates for '%s' in SVG path \"%s\"", (command, d))
+
+        for i in range( 0, len(args), step):
+            if cmd == 'H':
+                nx = args[i] + x if isRel else args[i]
+                ny = y
+            elif cmd == 'V':
+                nx = x
+                ny = args[i] + y if isRel else args[i]
+            elif cmd == 'C':
+                x1, y1, x2, y2, nx, ny = args[i:i+6]
+                if isRel:
+                    x1 += x; y1 += y
+                    x2 += x; y2 += y
+                    nx += x; ny += y
+                ops.append( PATH_CURVETO)
+                coords.extend( (x1, y1, x2, y2, nx, ny))
+                x, y = nx, ny
+                continue
+            else:
+                nx, ny = args[i], args[i+1]
+                if isRel:
                     nx += x
                     ny += y
 
-                if cmd == "M" and i > 2:
-                    thePath.moveTo( nx, ny)
-                else:
-                    thePath.lineTo( nx, ny)
+            # the first pair of a moveto is a moveto, subsequent pairs are implicit linetos
+            if cmd == 'M' and i == 0:
+                ops.append( PATH_MOVETO)
+                startX, startY = nx, ny
+            else:
+                ops.append( PATH_LINETO)
+            coords.extend( (nx, ny))
+            x, y = nx, ny
 
-                x, y = nx, ny
+    return SvgPathIR( bytes( ops), coords)
 
-        elif cmd == 'L':  # lineto
-            while i < len(tokens) and not re.match(r'[MLCZmlcz]', tokens[i]):
-                nx = get_number()
-                ny = get_number()
-                if is_rel:
-                    nx += x
-                    ny += y
-                thePath.lineTo( nx, ny)
-                x, y = nx, ny
 
-        elif cmd == 'C':  # cubic curveto
-            # groups of 6 numbers
-            while i < len(tokens) and not re.match(r'[MLCZmlcz]', tokens[i]):
-                x1 = get_number()
-                y1 = get_number()
-                x2 = get_number()
-                y2 = get_number()
-                nx = get_number()
-                ny = get_number()
-
-                if is_rel:
-                    x1 += x; y1 += y
-                    x2 += x; y2 += y
-                    nx += x; ny += y
+def ParseSvgPath(canvas,d):
+    '''
+    Creates a reportlab path object from an SVG path element
 
-                thePath.curveTo( x1, y1, x2, y2, nx, ny)
-                x, y = nx, ny
+    Parameters
+    ----------
+    canvas : reportlab canvas
+    d : string
+        holds the "d" attribute of an SVG path element.
+
+    Returns
+    -------
+    canvas path object.
+
+    '''
 
-        elif cmd == 'Z':  # closepath
-            thePath.close()
-            # SVG closes back to subpath start; we could track it if needed
+    thePath = canvas.beginPath()
+    CompileSvgPath( d).Replay( thePath)
     return thePath
 
 def AdjustDashArray( dashArray, dashOffset, lineLength):
@@ -147,14 +389,14 @@ def AdjustDashArray( dashArray, dashOffset, lineLength):
     
     return outArray, outOffset
 
-def CalcLineLengthFromDash( xmlPath, maxLen):
+def CalcLineLengthFromDash( style, maxLen):
     '''
     Calulate the longest line length that will fit a complete number of
     dashes, <dashOffset> taken into account on a line shorter than <maxLen>
 
     '''
-    if ('stroke-dasharray' in xmlPath.attrib):
-        dashArray, dashOffset = ParseStrokeDash( xmlPath)
+    if (style.dashArray):
+        dashArray, dashOffset = style.dashArray, style.dashOffset
     else:
         return maxLen
     
@@ -167,76 +409,50 @@ def CalcLineLengthFromDash( xmlPath, maxLen):
 
 def CreatePolyFromRect( xc, yc, w, h):
     '''
-    Returns an array on the form [(x,y),(x,y),...]
+    Returns the polygon of a rectangle centered on (xc, yc) as an (4, 2) array
     '''
 
     llx = xc - w/2
     lly = yc - h/2
-    urx = llx + w
-    ury = lly + h
-
-    return CreatePolyFromBounds( llx, lly, urx, ury)
+    return RectPoints( llx, lly, llx + w, lly + h)
 
 def CreatePolyFromBounds( llx, lly, urx, ury):
     '''
-    Returns an array on the form [(x,y),(x,y),...]
+    Returns the polygon of a rectangle as an (4, 2) array
     '''
 
-    return [(llx, lly),(urx, lly),(urx,ury),(llx,ury)]
+    return RectPoints( llx, lly, urx, ury)
 
 
 def RotatePoly( poly, angle):
     '''
-    Takes a <poly> on the form [(x,y),(x,y),...]
-    and returns a polygon rotated <angle> degrees around the origin.
+    Takes a <poly> as an (N, 2) array or a list [(x,y),(x,y),...]
+    and returns an (N, 2) array rotated <angle> degrees around the origin.
     '''
 
-    angle *= math.pi / 180
-
-    result = []
-    for (x,y) in poly:
-        x0 = x * math.cos(angle) - y * math.sin(angle)
-        y0 = x * math.sin(angle) + y * math.cos(angle)
+    return RotatePoints( poly, angle)
 
-        result.append( (x0, y0))
-
-    return result
+def UnionBounds( a, b):
+    '''
+    Returns the union of two (xMin, yMin, xMax, yMax) bounds. Either may be None.
+    '''
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
 
 def CalcPolyBounds( poly):
     '''
     Returns a tuple on the form (xmin, ymin, xmax, ymax) holding the 
     outer bounds of the provided polygon
     '''
-    
-    (x,y) = poly[0]
-    xMin = x
-    xMax = x
-    yMin = y
-    yMax = y
 
-    for (x,y) in poly:
-        xMin = min( x, xMin)
-        xMax = max( x, xMax)
-        yMin = min( y, yMin)
-        yMax = max( y, yMax)
-
-    return (xMin, yMin, xMax, yMax)
+    return Bounds( poly)
 
 def CreatePathFromPoly( canvas, poly, closePath):
     '''
-    Given a polygon, creatas and returns a canvas path from it.    
+    Given a polygon, creates and returns a canvas path from it.    
     '''
 
-    p = canvas.beginPath()
-
-    firstPoint = True
-    for (x,y) in poly:
-        if firstPoint:
-            p.moveTo( x, y)
-            firstPoint = False
-        else:
-            p.lineTo( x, y)
-    if (closePath):
-        p.close()
-    return p
-
+    return AddPolyToPath( canvas.beginPath(), poly, closePath)
@@ -6,84 +6,207 @@ Created on Sat Nov 22 07:57:07 2025
 """
 
 import math
+import numpy as np
 from  MSSPath import *
 from MSSLegendDrawing import *
+from MSSDrawShapes import CalcShapeBounds
+from MSSGeometry import AddSegmentsToPath, MergeIntervals, CalcBandIntervals, \
+                        IntervalsOverlap, IntervalsContain
+
+def CalcHatchLines( hatch, poly):
+    '''
+    Calculates all the hatch lines covering <poly> in one go.
+
+    Parameters
+    ----------
+    hatch : Hatch
+        The hatch specification
+    poly : list of (x, y)
+        The area to hatch.
+
+    Returns
+    -------
+    numpy array of shape (N, 4)
+        One row (x0, y0, x1, y1) for each line segment, in the coordinate
+        system rotated by the hatch rotation. Segments completely outside
+        the polygon are left out. All segments start at a multiple of the
+        dash length, so dashes are aligned across the whole area.
+
+    '''
+    sWidth = hatch.style.width
+    halfWidth = sWidth * 0.5
+    spacing = hatch.spacing
+
+    rotatedPoly = RotatePoly( poly, -hatch.rotation)
+    (xMin, yMin, xMax, yMax) = CalcPolyBounds( rotatedPoly)
+
+    yMin -= sWidth
+    yMax += sWidth
+
+    yStart = math.floor(yMin / spacing) * spacing - hatch.offset
+    ys = yStart + spacing * np.arange( max( math.ceil( (yMax - yStart) / spacing), 0))
+
+    # the part of each line touching the polygon, widened by the line caps
+    touching, inside = CalcBandIntervals( rotatedPoly, ys - halfWidth, ys + halfWidth)
+
+    dashTotal = sum( hatch.style.dashArray)
+    segments = []
+    for y, intervals in zip( ys.tolist(), touching):
+        if len(intervals) == 0:
+            continue
+        starts = intervals[:, 0] - halfWidth
+        ends = intervals[:, 1] + halfWidth
+        if (dashTotal > 0):
+            # adjust left start so dashes will align across the map
+            starts = np.floor( starts / dashTotal) * dashTotal
+            intervals = MergeIntervals( starts, ends)
+            starts = intervals[:, 0]
+            ends = intervals[:, 1]
+        rows = np.empty( (len(starts), 4))
+        rows[:, 0] = starts
+        rows[:, 1] = y
+        rows[:, 2] = ends
+        rows[:, 3] = y
+        segments.append( rows)
+
+    if not segments:
+        return np.empty( (0, 4))
+    return np.concatenate( segments)
 
 def DrawHatch( canvas, hatch, poly):
     # This method relies that the canvase have saved its state before calling
     # this function, and will resore it aftewards
 
-    sWidth = float(hatch.attrib['stroke-width'])
-    spacing = float(hatch.attrib['spacing'])    
-    angle = 0
-    if ('rotation' in hatch.attrib):
-        angle = float(hatch.attrib['rotation'])
-        
-    offset = 0.0
-    if ('offset' in hatch.attrib):
-        offset = float(hatch.attrib['offset'])
-        
-
-
-    canvas.rotate(angle)
-
-    rotatedPoly = RotatePoly( poly, -angle)
-    (xMin, yMin, xMax, yMax) = CalcPolyBounds( rotatedPoly)
-
-    if ('stroke-dasharray' in hatch.attrib):
-        # adjust left start so dashes will align across the map
-        dashArray = [float(x) for x in hatch.attrib['stroke-dasharray'].split(',')]
-        dashTotal = sum( dashArray)
-        xMin = math.floor( xMin / dashTotal) * dashTotal
+    lines = CalcHatchLines( hatch, poly)
+    if len(lines) == 0:
+        return
 
+    canvas.rotate( hatch.rotation)
 
-    yMin -= sWidth
-    yMax += sWidth
-
-
-    y = math.floor(yMin / spacing) * spacing - offset
-    while y < yMax:
-        p = canvas.beginPath()
-        p.moveTo( xMin, y)
-        p.lineTo( xMax, y)
-        canvas.drawPath( p, stroke=1, fill=0)
-        y += spacing
+    # all lines in one path, painted with a single stroke
+    p = AddSegmentsToPath( canvas.beginPath(), lines)
+    canvas.drawPath( p, stroke=1, fill=0)
     
+def GetPatternForm( legend, layer, pattern):
+    '''
+    Returns the name and the bounds of the form XObject holding one tile of
+    <pattern> on <layer>. The form is created the first time it is asked for
+    and is then reused for every tile, in any legend entry. The colours are
+    not part of the form, they are inherited from the layer style when the
+    form is drawn.
+    '''
+    formName = "MSSPattern_%s_%s" % (pattern.key[:16], layer.id)
+    if formName in legend.patternForms:
+        return formName, legend.patternForms[formName]
+
+    x0 = pattern.x
+    y0 = pattern.y
+    bounds = (x0, y0, x0 + pattern.width, y0 + pattern.height)
+    if (pattern.clip != 'yes'):
+        # the bounding box of a form clips its content, so it must
+        # include all of the tile content when not clipping
+        for part in pattern.parts:
+            bounds = UnionBounds( bounds, CalcShapeBounds( part))
+
+    canvas = legend.canvas
+    canvas.beginForm( formName, *bounds)
+    legend.DrawPointSymbol( 0, 0, layer, pattern)
+    canvas.endForm()
+
+    legend.patternForms[formName] = bounds
+    return formName, bounds
+
+def CalcPatternTiles( pattern, bounds, poly):
+    '''
+    Finds the pattern tiles needed to cover <poly>.
+
+    Parameters
+    ----------
+    pattern : Pattern
+        The pattern specification. The tiling may be "regular" or "brick",
+        where every other row is shifted half a tile.
+    bounds : (xMin, yMin, xMax, yMax)
+        The extent of the content of one tile, relative to the tile origin
+    poly : list of (x, y)
+        The area to fill, in the rotated coordinate system of the pattern
+
+    Returns
+    -------
+    interior, boundary : numpy arrays of shape (N, 2)
+        The origins of the tiles to draw. Interior tiles are completely
+        inside the polygon and need no clipping, boundary tiles cross the
+        edge of the polygon and must be clipped. Tiles outside the polygon
+        are left out.
+        If the pattern clip is "inside" only tiles completely inside are
+        returned, and if it is "center" the tiles with the origin inside.
+        Neither needs clipping.
+
+    '''
+    tileWidth = pattern.width
+    tileHeight = pattern.height
+    bx0, by0, bx1, by1 = bounds
+    (xMin, yMin, xMax, yMax) = CalcPolyBounds( poly)
+
+    rows = np.arange( math.floor( (yMin - by1) / tileHeight), math.ceil( (yMax - by0) / tileHeight) + 1)
+    ys = rows * tileHeight
+    if (pattern.tiling == 'brick'):
+        shifts = np.where( rows % 2 == 1, tileWidth * 0.5, 0.0)
+    else:
+        shifts = np.zeros( len(rows))
+
+    centerOnly = (pattern.clip == 'center')
+    if centerOnly:
+        touching, inside = CalcBandIntervals( poly, ys, ys)
+    else:
+        touching, inside = CalcBandIntervals( poly, ys + by0, ys + by1)
+
+    interior = []
+    boundary = []
+    for y, shift, rowTouching, rowInside in zip( ys.tolist(), shifts.tolist(), touching, inside):
+        cols = np.arange( math.floor( (xMin - bx1 - shift) / tileWidth), math.ceil( (xMax - bx0 - shift) / tileWidth) + 1)
+        xs = shift + cols * tileWidth
+        if centerOnly:
+            isInside = IntervalsContain( rowInside, xs, xs)
+        else:
+            isInside = IntervalsContain( rowInside, xs + bx0, xs + bx1)
+            if (pattern.clip != 'inside'):
+                isBoundary = IntervalsOverlap( rowTouching, xs + bx0, xs + bx1) & ~isInside
+                boundary.append( np.column_stack( (xs[isBoundary], np.full( isBoundary.sum(), y))))
+        interior.append( np.column_stack( (xs[isInside], np.full( isInside.sum(), y))))
+
+    empty = np.empty( (0, 2))
+    return (np.concatenate( interior) if interior else empty,
+            np.concatenate( boundary) if boundary else empty)
+
 def DrawPattern( legend, layer, pattern, poly):
-    x0 = float(pattern.attrib['x'])
-    y0 = float(pattern.attrib['y'])
-    tileWidth = float(pattern.attrib['width'])
-    tileHeight = float(pattern.attrib['height'])
-    noClip = ('clip' in pattern.attrib and pattern.attrib['clip'] != 'yes')
-    
-    angle = 0
-            
-    if ('rotation' in pattern.attrib):
-        angle = float(pattern.attrib['rotation'])
+    '''
+    Fills <poly> with <pattern>. Tiles inside the polygon are drawn
+    as they are, only tiles crossing its edge are clipped.
+    '''
+    canvas = legend.canvas
+    angle = pattern.rotation
     
-    legend.canvas.rotate( angle)
+    formName, bounds = GetPatternForm( legend, layer, pattern)
+
+    canvas.saveState()
+    canvas.rotate( angle)
     rotatedPoly = RotatePoly( poly, -angle)
-    (xMin, yMin, xMax, yMax) = CalcPolyBounds( rotatedPoly)
 
+    interior, boundary = CalcPatternTiles( pattern, bounds, rotatedPoly)
 
-    y = math.floor(yMin / tileHeight) * tileHeight
-    xMin = math.floor(xMin / tileWidth) * tileWidth
-    while y < yMax:
-        x = xMin
-        while x < xMax:
-            legend.canvas.saveState()
-            legend.canvas.translate( x, y)
-
-            clipPoly = CreatePolyFromBounds( x0, y0, x0+tileWidth, y+tileHeight)
-            clipPath = CreatePathFromPoly( legend.canvas, clipPoly, True)
-
-            if (not noClip):
-                legend.canvas.clipPath( clipPath, fill=0, stroke=0)
-            legend.DrawPointSymbol(0,0,layer,pattern)
-            legend.canvas.restoreState()
-            
-            x += tileWidth
-        y+= tileHeight
-    
-                      
-        
+    for x, y in interior.tolist():
+        canvas.saveState()
+        canvas.translate( x, y)
+        canvas.doForm( formName)
+        canvas.restoreState()
+
+    if len(boundary):
+        clipPath = CreatePathFromPoly( canvas, rotatedPoly, True)
+        canvas.clipPath( clipPath, fill=0, stroke=0)
+        for x, y in boundary.tolist():
+            canvas.saveState()
+            canvas.translate( x, y)
+            canvas.doForm( formName)
+            canvas.restoreState()
+
+    canvas.restoreState()
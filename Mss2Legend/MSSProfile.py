@@ -0,0 +1,218 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Per-symbol and per-layer profiling of the legend drawing
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+Profiling is off unless a Profiler is given to the MSSLegendDrawer; the
+drawer then only tests for None once per legend entry. With a profiler,
+the canvas is wrapped in a CountingCanvas, and each layer of a page and
+each symbol on a layer is recorded as a span with
+
+    the wall time
+    the canvas operations: paths, saveState/restoreState, clips,
+        tiles (pattern tiles placed with doForm) and strings
+    the bytes added to the canvas output: the storage of a DisplayList,
+        or the content stream of a reportlab canvas
+
+The spans can be written as a ranked text report, or as a Chrome trace
+JSON file for chrome://tracing or https://ui.perfetto.dev.
+'''
+
+import os
+import json
+import time
+
+
+# The operation counters, in report order
+COUNTERS = ('paths', 'saves', 'restores', 'clips', 'tiles', 'strings', 'bytes')
+
+
+class CountingCanvas(object):
+    '''
+    Wraps a canvas and counts the operations drawn on it into <counts>, a
+    list in the order of COUNTERS. All other methods and attributes are
+    those of the wrapped canvas.
+    '''
+
+    def __init__( self, canvas, counts):
+        self._canvas = canvas
+        self._counts = counts
+
+    def __getattr__( self, name):
+        return getattr( self._canvas, name)
+
+    def drawPath( self, path, *args, **kwargs):
+        self._counts[0] += 1
+        return self._canvas.drawPath( path, *args, **kwargs)
+
+    def saveState( self):
+        self._counts[1] += 1
+        self._canvas.saveState()
+
+    def restoreState( self):
+        self._counts[2] += 1
+        self._canvas.restoreState()
+
+    def clipPath( self, path, *args, **kwargs):
+        self._counts[3] += 1
+        return self._canvas.clipPath( path, *args, **kwargs)
+
+    def doForm( self, name):
+        self._counts[4] += 1
+        self._canvas.doForm( name)
+
+    def drawString( self, *args, **kwargs):
+        self._counts[5] += 1
+        return self._canvas.drawString( *args, **kwargs)
+
+
+class Span(object):
+    '''
+    One recorded span: <kind> is 'layer', 'symbol' or 'names', page the
+    page number, start and duration in seconds, counts in the order of
+    COUNTERS.
+    '''
+    __slots__ = ('kind', 'symbolId', 'layerId', 'page', 'start', 'duration', 'counts')
+
+    def __init__( self, kind, symbolId, layerId, page, start, duration, counts):
+        self.kind = kind
+        self.symbolId = symbolId
+        self.layerId = layerId
+        self.page = page
+        self.start = start
+        self.duration = duration
+        self.counts = counts
+
+
+class Profiler(object):
+    '''
+    Collects the spans of the drawing of a legend. One profiler may be
+    used for all the pages of a legend.
+    '''
+
+    def __init__( self):
+        self.spans = []
+        self.counts = [0] * len( COUNTERS)
+        self.origin = time.perf_counter()
+        self._canvas = None
+        self._codeLength = 0    # entries of a reportlab canvas counted so far
+        self._codeBytes = 0
+
+    def Wrap( self, canvas):
+        '''
+        Returns <canvas> wrapped for counting
+        '''
+        self._canvas = canvas
+        self._codeLength = self._codeBytes = 0
+        return CountingCanvas( canvas, self.counts)
+
+    def _OutputBytes( self):
+        canvas = self._canvas
+        if hasattr( canvas, 'ByteSize'):
+            return canvas.ByteSize()
+        code = getattr( canvas, '_code', None)
+        if code is None:
+            return 0
+        if len( code) < self._codeLength:
+            # a new page
+            self._codeLength = 0
+        self._codeBytes += sum( len( entry) + 1 for entry in code[self._codeLength:])
+        self._codeLength = len( code)
+        return self._codeBytes
+
+    def Start( self):
+        '''
+        Starts a span, returns the token to give to Stop()
+        '''
+        self.counts[-1] = self._OutputBytes()
+        return (time.perf_counter(), list( self.counts))
+
+    def Stop( self, token, kind, symbolId=None, layerId=None, page=0):
+        '''
+        Ends the span started by Start() and records it
+        '''
+        end = time.perf_counter()
+        self.counts[-1] = self._OutputBytes()
+        start, counts = token
+        self.spans.append( Span( kind, symbolId, layerId, page, start - self.origin, end - start,
+                                 [now - before for now, before in zip( self.counts, counts)]))
+
+    def Totals( self, kind, key):
+        '''
+        Sums the spans of <kind> by <key>, a function of the span.
+        Returns a list of (key, seconds, counts, number of spans), the
+        slowest first.
+        '''
+        totals = {}
+        for span in self.spans:
+            if span.kind != kind:
+                continue
+            k = key( span)
+            entry = totals.get( k)
+            if entry is None:
+                totals[k] = [span.duration, list( span.counts), 1]
+            else:
+                entry[0] += span.duration
+                entry[1] = [a + b for a, b in zip( entry[1], span.counts)]
+                entry[2] += 1
+        return sorted( ((k, d, c, n) for k, (d, c, n) in totals.items()), key=lambda t: -t[1])
+
+    def Report( self, top=20):
+        '''
+        Returns a text report of the <top> slowest symbols and layers
+        '''
+        header = "%-24s%10s%6s" % ("", "ms", "n") + "".join( "%9s" % c for c in COUNTERS)
+        lines = []
+        for title, kind, key in (("symbols", 'symbol', lambda s: s.symbolId),
+                                 ("symbols on layers", 'symbol', lambda s: "%s on %s" % (s.symbolId, s.layerId)),
+                                 ("layers", 'layer', lambda s: s.layerId)):
+            totals = self.Totals( kind, key)
+            lines.append( "%s, %d of %d, slowest first" % (title, min( top, len( totals)), len( totals)))
+            lines.append( header)
+            for k, seconds, counts, n in totals[:top]:
+                lines.append( "%-24s%10.2f%6d" % (str( k)[:24], seconds * 1000, n) + "".join( "%9d" % c for c in counts))
+            lines.append( "")
+        total = sum( span.duration for span in self.spans if span.kind != 'symbol')
+        lines.append( "total %.1f ms in %d spans" % (total * 1000, len( self.spans)))
+        return "\n".join( lines)
+
+    def ChromeTrace( self):
+        '''
+        Returns the spans in the Chrome trace event format, one thread per page
+        '''
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            if span.kind == 'symbol':
+                name = "%s on %s" % (span.symbolId, span.layerId)
+            elif span.kind == 'layer':
+                name = "layer %s" % span.layerId
+            else:
+                name = span.kind
+            events.append( { 'name': name, 'cat': span.kind, 'ph': 'X', 'pid': pid, 'tid': span.page,
+                             'ts': round( span.start * 1e6, 3), 'dur': round( span.duration * 1e6, 3),
+                             'args': dict( zip( COUNTERS, span.counts))})
+        return { 'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def Save( self, fileName):
+        '''
+        Writes a Chrome trace if <fileName> ends with .json, else the report
+        '''
+        with open( fileName, 'w', encoding='utf-8') as f:
+            if fileName.lower().endswith( '.json'):
+                json.dump( self.ChromeTrace(), f)
+            else:
+                f.write( self.Report() + "\n")
@@ -0,0 +1,1050 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Raster canvas compositing the colour layers in CMYK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+RasterCanvas has the subset of the reportlab canvas methods used by the
+drawing code and the display list, and renders the pages into NumPy
+arrays, written as RGB PNG files. It is meant for print-proof previews
+and thumbnails, and does not depend on reportlab.
+
+The legend is drawn colour layer by colour layer, bottom layer first. Each
+run of drawing with the same paint, which is a colour layer, is rendered
+into a coverage buffer of its own: the union of all its shapes, with
+anti-aliased edges. When the paint changes, the buffer is composited onto
+the CMYK page, as one ink film:
+
+    the layer colour has its tint applied, see MSSColor
+    the blend mode is applied to the complements of the CMYK values, like
+        PDF does for subtractive colour spaces. Hue, saturation, color and
+        luminosity blend the CMY components, and take K from the backdrop,
+        or from the layer for luminosity
+    the opacity scales the coverage
+    overprinting layers leave the inks of the backdrop where the layer
+        colour has none, like PDF overprint mode 1, while other layers
+        knock out the inks below them
+
+All of it is done with whole array operations on the bounding box of the
+layer. The page is converted to RGB when it is finished, in one batch by
+a MSSColorConvert.ColorConverter.
+
+Paths are flattened and filled by a scanline rasteriser with <SUBSAMPLES>
+sample rows per pixel and exact horizontal coverage; fills and clips use
+the even-odd rule like the PDF canvas, strokes are turned into polygons.
+Text is rasterised with Pillow when it is installed, and left out if not.
+'''
+
+import math
+import zlib
+import struct
+import logging
+import numpy as np
+from MSSPath import PathBuilder, PATH_MOVETO, PATH_LINETO, PATH_CURVETO
+from MSSDisplayList import DisplayList
+from MSSColor import BLEND_MODES, PdfBlendMode
+from MSSColorConvert import DefaultConverter
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    ImageFont = None
+
+
+log = logging.getLogger( __name__)
+
+# Sample rows per pixel of the rasteriser
+SUBSAMPLES = 4
+
+# Largest distance in pixels between a curve and its flattened polyline
+_TOLERANCE = 0.2
+
+# The blend mode of each PDF blend mode given to setBlendMode()
+_DTD_BLEND_MODES = { PdfBlendMode( blend): blend for blend in BLEND_MODES}
+
+# Fonts tried for text, the first found is used
+_FONT_FILES = ('DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'Arial.ttf', 'Helvetica.ttc')
+
+
+#---------------------------------------------------------------------------
+# Blend modes, on additive values in the range 0 to 1: b the backdrop and
+# s the source, broadcast against each other
+#---------------------------------------------------------------------------
+
+def _HardLight( b, s):
+    return np.where( s <= 0.5, b * (2 * s), b + (2 * s - 1) - b * (2 * s - 1))
+
+def _SoftLight( b, s):
+    d = np.where( b <= 0.25, ((16 * b - 12) * b + 4) * b, np.sqrt( b))
+    return np.where( s <= 0.5, b - (1 - 2 * s) * b * (1 - b), b + (2 * s - 1) * (d - b))
+
+def _ColorDodge( b, s):
+    with np.errstate( divide='ignore', invalid='ignore'):
+        r = np.minimum( 1.0, b / (1 - s))
+    return np.where( b <= 0, 0.0, np.where( s >= 1, 1.0, r))
+
+def _ColorBurn( b, s):
+    with np.errstate( divide='ignore', invalid='ignore'):
+        r = 1 - np.minimum( 1.0, (1 - b) / s)
+    return np.where( b >= 1, 1.0, np.where( s <= 0, 0.0, r))
+
+_SEPARABLE_BLENDS = {
+    'normal':       lambda b, s: s + 0 * b,
+    'multiply':     lambda b, s: b * s,
+    'screen':       lambda b, s: b + s - b * s,
+    'overlay':      lambda b, s: _HardLight( s, b),
+    'darken':       np.minimum,
+    'lighten':      np.maximum,
+    'color-dodge':  _ColorDodge,
+    'color-burn':   _ColorBurn,
+    'hard-light':   _HardLight,
+    'soft-light':   _SoftLight,
+    'difference':   lambda b, s: np.abs( b - s),
+    'exclusion':    lambda b, s: b + s - 2 * b * s,
+}
+
+def _Lum( c):
+    return c[..., 0:1] * 0.3 + c[..., 1:2] * 0.59 + c[..., 2:3] * 0.11
+
+def _ClipColor( c):
+    lum = _Lum( c)
+    low = c.min( axis=-1, keepdims=True)
+    high = c.max( axis=-1, keepdims=True)
+    with np.errstate( divide='ignore', invalid='ignore'):
+        c = np.where( low < 0, lum + (c - lum) * lum / (lum - low), c)
+        c = np.where( high > 1, lum + (c - lum) * (1 - lum) / (high - lum), c)
+    return np.nan_to_num( c)
+
+def _SetLum( c, lum):
+    return _ClipColor( c + (lum - _Lum( c)))
+
+def _Sat( c):
+    return c.max( axis=-1, keepdims=True) - c.min( axis=-1, keepdims=True)
+
+def _SetSat( c, sat):
+    low = c.min( axis=-1, keepdims=True)
+    span = c.max( axis=-1, keepdims=True) - low
+    with np.errstate( divide='ignore', invalid='ignore'):
+        return np.where( span > 0, (c - low) * sat / span, 0.0)
+
+_NON_SEPARABLE_BLENDS = {
+    'hue':          lambda b, s: _SetLum( _SetSat( s, _Sat( b)), _Lum( b)),
+    'saturation':   lambda b, s: _SetLum( _SetSat( b, _Sat( s)), _Lum( b)),
+    'color':        lambda b, s: _SetLum( s, _Lum( b)),
+    'luminosity':   lambda b, s: _SetLum( b, _Lum( s)),
+}
+
+def BlendCmyk( backdrop, source, blend):
+    '''
+    Returns the colour of <source> blended onto <backdrop> with the blend
+    mode <blend>, one of MSSColor.BLEND_MODES, before opacity and coverage
+    are applied. <backdrop> is an array of CMYK values with the components
+    in the last axis, <source> one CMYK colour.
+    '''
+    b = 1.0 - backdrop
+    s = 1.0 - np.asarray( source, dtype=backdrop.dtype)
+    if blend in _SEPARABLE_BLENDS:
+        return 1.0 - _SEPARABLE_BLENDS[blend]( b, s)
+    s = np.broadcast_to( s, b.shape)
+    result = np.empty_like( backdrop)
+    result[..., :3] = 1.0 - _NON_SEPARABLE_BLENDS[blend]( b[..., :3], s[..., :3])
+    result[..., 3] = backdrop[..., 3] if blend != 'luminosity' else source[3]
+    return result
+
+
+#---------------------------------------------------------------------------
+# Rasterising
+#---------------------------------------------------------------------------
+
+def _Concat( m, ctm):
+    '''
+    Returns the transform of drawing with <m> in the coordinate system <ctm>
+    '''
+    a, b, c, d, e, f = m
+    A, B, C, D, E, F = ctm
+    return (a*A + b*C, a*B + b*D, c*A + d*C, c*B + d*D, e*A + f*C + E, e*B + f*D + F)
+
+def _Apply( ctm, points):
+    '''
+    Returns the (..., 2) array <points> transformed by <ctm>
+    '''
+    a, b, c, d, e, f = ctm
+    x = points[..., 0]
+    y = points[..., 1]
+    return np.stack( (a*x + c*y + e, b*x + d*y + f), axis=-1)
+
+def _Scale( ctm):
+    '''
+    Returns the mean scale factor of <ctm>
+    '''
+    return math.sqrt( abs( ctm[0] * ctm[3] - ctm[1] * ctm[2])) or 1e-9
+
+def FlattenPath( ir, tolerance):
+    '''
+    Returns the compiled path <ir> as a list of polylines like
+    SvgPathIR.Flatten(), with the Bezier curves of the path flattened all
+    at once: each to the number of segments of Wang's formula, like
+    MSSGeometry.FlattenCurve().
+    '''
+    coords = ir.coords
+    pieces = []         # the points of each subpath, as arrays or curve numbers
+    current = []
+    curves = []         # (p0, p1, p2, p3) of each curve
+    last = None
+    i = 0
+    for op in ir.ops:
+        if op == PATH_MOVETO:
+            if len( current) > 1:
+                pieces.append( current)
+            last = (coords[i], coords[i+1])
+            current = [last]
+            i += 2
+        elif op == PATH_LINETO:
+            last = (coords[i], coords[i+1])
+            current.append( last)
+            i += 2
+        elif op == PATH_CURVETO:
+            current.append( len( curves))
+            curves.append( (last, (coords[i], coords[i+1]), (coords[i+2], coords[i+3]), (coords[i+4], coords[i+5])))
+            last = curves[-1][3]
+            i += 6
+        elif current:
+            first = current[0]
+            current.append( first)
+            pieces.append( current)
+            current = [first]
+            last = first
+    if len( current) > 1:
+        pieces.append( current)
+
+    flat = []
+    if curves:
+        ctrl = np.array( curves, dtype=float)
+        dd = np.abs( ctrl[:, :2] - 2 * ctrl[:, 1:3] + ctrl[:, 2:])
+        m = np.sqrt( (dd * dd).sum( axis=2)).max( axis=1)
+        n = np.maximum( 1, np.ceil( np.sqrt( 0.75 * m / tolerance))).astype( np.int64)
+        curve = np.repeat( np.arange( len( curves)), n)
+        t = ((np.arange( len( curve)) - np.repeat( np.cumsum( n) - n, n) + 1) / n[curve])[:, None]
+        s = 1.0 - t
+        c = ctrl[curve]
+        points = (s * s * s) * c[:, 0] + (3 * s * s * t) * c[:, 1] + (3 * s * t * t) * c[:, 2] + (t * t * t) * c[:, 3]
+        flat = np.split( points, np.cumsum( n)[:-1])
+
+    result = []
+    for piece in pieces:
+        parts = []
+        run = []
+        for p in piece:
+            if isinstance( p, tuple):
+                run.append( p)
+            else:
+                if run:
+                    parts.append( np.array( run, dtype=float))
+                    run = []
+                parts.append( flat[p])
+        if run:
+            parts.append( np.array( run, dtype=float))
+        result.append( np.vstack( parts) if len( parts) > 1 else parts[0])
+    return result
+
+def _RingEdges( points, lengths):
+    '''
+    Returns the (N, 4) edges of the closed rings through the (N, 2) array
+    <points>, made of runs of <lengths> points
+    '''
+    ends = np.cumsum( lengths)
+    following = np.arange( 1, len( points) + 1)
+    following[ends - 1] = ends - lengths
+    return np.hstack( (points, points[following]))
+
+def _PolygonEdges( polygons):
+    '''
+    Returns the (N, 4) edges of the (count, K, 2) array of closed <polygons>
+    '''
+    following = np.concatenate( (polygons[:, 1:], polygons[:, :1]), axis=1)
+    return np.concatenate( (polygons, following), axis=2).reshape( -1, 4)
+
+def Coverage( edges, window, evenOdd=True):
+    '''
+    Rasterises the closed polygons made of <edges>, an (N, 4) array of
+    x0 y0 x1 y1 in pixels, within <window> (x0, y0, x1, y1), in whole
+    pixels. The polygons are filled with the even-odd rule, or the
+    non-zero rule when <evenOdd> is False.
+
+    Returns
+    -------
+    numpy array of shape (y1 - y0, x1 - x0), float32
+        The fraction of each pixel covered, or None if nothing is covered
+    '''
+    wx0, wy0, wx1, wy1 = window
+    width = wx1 - wx0
+    height = wy1 - wy0
+    if (width <= 0) or (height <= 0) or (len( edges) == 0):
+        return None
+    ex0, ey0, ex1, ey1 = edges.T
+    direction = np.where( ey1 > ey0, 1, -1)
+    ya = np.minimum( ey0, ey1)
+    yb = np.maximum( ey0, ey1)
+
+    # the sample rows crossed by each edge, sample row j is at (j + 0.5) / SUBSAMPLES
+    ja = np.clip( np.ceil( ya * SUBSAMPLES - 0.5), wy0 * SUBSAMPLES, wy1 * SUBSAMPLES).astype( np.int64)
+    jb = np.clip( np.ceil( yb * SUBSAMPLES - 0.5), wy0 * SUBSAMPLES, wy1 * SUBSAMPLES).astype( np.int64)
+    counts = jb - ja
+    crossing = counts > 0
+    if not crossing.any():
+        return None
+    counts = counts[crossing]
+    edge = np.repeat( np.flatnonzero( crossing), counts)
+    starts = np.cumsum( counts) - counts
+    j = ja[edge] + (np.arange( len( edge)) - np.repeat( starts, counts))
+    ys = (j + 0.5) / SUBSAMPLES
+    xs = ex0[edge] + (ys - ey0[edge]) * ((ex1 - ex0) / np.where( ey1 != ey0, ey1 - ey0, 1))[edge]
+
+    # the spans between the crossings of each sample row that are inside
+    order = np.lexsort( (xs, j))
+    j = j[order]
+    xs = np.clip( xs[order], wx0, wx1) - wx0
+    winding = np.cumsum( direction[edge][order])
+    inside = (winding & 1) != 0 if evenOdd else winding != 0
+    inside[-1] = False
+    spans = np.flatnonzero( inside)
+    if len( spans) == 0:
+        return None
+    rows = j[spans] - wy0 * SUBSAMPLES
+    xa = xs[spans]
+    xb = xs[spans + 1]
+
+    # each span adds 1 from xa to xb, partial pixels at both ends: summed
+    # as differences along the row, then integrated
+    stride = width + 2
+    ia = np.floor( xa).astype( np.int64)
+    ib = np.floor( xb).astype( np.int64)
+    fa = xa - ia
+    fb = xb - ib
+    base = rows * stride
+    index = np.concatenate( (base + ia, base + ia + 1, base + ib, base + ib + 1))
+    weights = np.concatenate( (1 - fa, fa, fb - 1, -fb))
+    diff = np.bincount( index, weights, minlength=height * SUBSAMPLES * stride)
+    rowCoverage = np.cumsum( diff.reshape( height * SUBSAMPLES, stride), axis=1)[:, :width]
+    result = rowCoverage.reshape( height, SUBSAMPLES, width).sum( axis=1) * (1.0 / SUBSAMPLES)
+    return np.clip( result, 0.0, 1.0).astype( np.float32)
+
+def BoxCoverage( box, window):
+    '''
+    Returns the coverage of the axis aligned rectangle <box> (x0, y0, x1,
+    y1) in pixels within <window>, like Coverage(), computed exactly as the
+    product of its coverage of the columns and of the rows
+    '''
+    wx0, wy0, wx1, wy1 = window
+    if (wx1 <= wx0) or (wy1 <= wy0):
+        return None
+    x0, x1 = sorted( (box[0], box[2]))
+    y0, y1 = sorted( (box[1], box[3]))
+    columns = np.arange( wx0, wx1, dtype=np.float32)
+    rows = np.arange( wy0, wy1, dtype=np.float32)
+    xCoverage = np.clip( np.minimum( columns + 1, x1) - np.maximum( columns, x0), 0.0, 1.0)
+    yCoverage = np.clip( np.minimum( rows + 1, y1) - np.maximum( rows, y0), 0.0, 1.0)
+    return np.outer( yCoverage, xCoverage)
+
+def _CirclePolygons( centres, radius, scale):
+    '''
+    Returns (count, K, 2) polygons of circles of <radius> around <centres>,
+    counter-clockwise, with K enough for the <scale> in pixels per unit
+    '''
+    r = radius * scale
+    k = 8 if r < 1 else min( 64, max( 8, int( math.ceil( math.pi / math.acos( max( 1 - _TOLERANCE / r, -1.0))))))
+    angles = np.arange( k) * (2 * math.pi / k)
+    ring = np.stack( (np.cos( angles), np.sin( angles)), axis=-1) * radius
+    return centres[:, None, :] + ring[None, :, :]
+
+def _Orient( polygons):
+    '''
+    Reverses the (count, K, 2) <polygons> that are clockwise
+    '''
+    x = polygons[..., 0]
+    y = polygons[..., 1]
+    area = (x * np.roll( y, -1, axis=1) - np.roll( x, -1, axis=1) * y).sum( axis=1)
+    polygons[area < 0] = polygons[area < 0, ::-1]
+    return polygons
+
+def _Dash( poly, dash, phase):
+    '''
+    Splits the polyline <poly> into the pieces of the dash pattern <dash>
+    starting at <phase>. Returns a list of polylines.
+    '''
+    seg = np.diff( poly, axis=0)
+    lengths = np.concatenate( ((0.0,), np.cumsum( np.hypot( seg[:, 0], seg[:, 1]))))
+    total = lengths[-1]
+    period = sum( dash)
+    if (period <= 0) or (total <= 0):
+        return [poly]
+    pieces = []
+    position = -(phase % period)
+    i = 0
+    while position < total:
+        length = dash[i % len( dash)]
+        if (i % 2 == 0) and (position + length > 0):
+            start = max( position, 0.0)
+            end = min( position + length, total)
+            inner = (lengths > start) & (lengths < end)
+            distances = np.concatenate( ((start,), lengths[inner], (end,)))
+            pieces.append( np.stack( (np.interp( distances, lengths, poly[:, 0]),
+                                      np.interp( distances, lengths, poly[:, 1])), axis=-1))
+        position += length
+        i += 1
+    return pieces
+
+def StrokePolygons( polylines, width, lineCap=0, lineJoin=0, miterLimit=10.0, dash=(), phase=0, scale=1.0):
+    '''
+    Returns the outline of the stroke of <polylines>, a list of (N, 2)
+    arrays where closed ones end with their first point, as a list of
+    (count, K, 2) arrays of counter-clockwise polygons whose union is the
+    stroke. <scale> is the number of pixels per unit.
+    '''
+    half = width / 2
+    pieces = []
+    for poly in polylines:
+        closed = (len( poly) > 2) and bool( np.all( poly[0] == poly[-1]))
+        if dash and any( dash):
+            pieces.extend( (piece, False) for piece in _Dash( poly, dash, phase))
+        else:
+            pieces.append( (poly, closed))
+
+    result = []
+    for poly, closed in pieces:
+        keep = np.concatenate( ((True,), np.any( np.diff( poly, axis=0) != 0, axis=1)))
+        poly = poly[keep]
+        if len( poly) < 2:
+            if (lineCap == 1) and len( poly):
+                result.append( _CirclePolygons( poly[:1], half, scale))
+            continue
+        d = np.diff( poly, axis=0)
+        u = d / np.hypot( d[:, 0], d[:, 1])[:, None]
+        n = np.stack( (-u[:, 1], u[:, 0]), axis=-1) * half
+        p0 = poly[:-1].copy()
+        p1 = poly[1:].copy()
+        if (lineCap == 2) and not closed:
+            p0[0] -= u[0] * half
+            p1[-1] += u[-1] * half
+        result.append( np.stack( (p0 - n, p1 - n, p1 + n, p0 + n), axis=1))
+
+        # joins at the inner vertices, and where a closed line meets itself
+        if closed:
+            vertices = poly[:-1]
+            n1 = np.roll( n, 1, axis=0)
+            u1 = np.roll( u, 1, axis=0)
+            n2 = n
+            u2 = u
+        else:
+            vertices = poly[1:-1]
+            n1, u1 = n[:-1], u[:-1]
+            n2, u2 = n[1:], u[1:]
+        if len( vertices):
+            if lineJoin == 1:
+                result.append( _CirclePolygons( vertices, half, scale))
+            else:
+                turn = u1[:, 0] * u2[:, 1] - u1[:, 1] * u2[:, 0]
+                side = np.where( turn > 0, -1.0, 1.0)[:, None]
+                o1 = n1 * side
+                o2 = n2 * side
+                tip = o2
+                if lineJoin == 0:
+                    cos = (u1 * u2).sum( axis=1)
+                    with np.errstate( divide='ignore', invalid='ignore'):
+                        ratio = np.sqrt( 2 / (1 + cos))
+                        miter = (o1 + o2) / (1 + cos)[:, None]
+                    tip = np.where( ((ratio <= miterLimit) & (1 + cos > 1e-9))[:, None], miter, o2)
+                result.append( _Orient( np.stack( (vertices, vertices + o1, vertices + tip, vertices + o2), axis=1)))
+        if (lineCap == 1) and not closed:
+            result.append( _CirclePolygons( poly[[0, -1]], half, scale))
+    return result
+
+
+#---------------------------------------------------------------------------
+# PNG
+#---------------------------------------------------------------------------
+
+def _PngChunk( kind, data):
+    return struct.pack( '>I', len( data)) + kind + data + struct.pack( '>I', zlib.crc32( kind + data) & 0xffffffff)
+
+def PngBytes( rgb, dpi=None):
+    '''
+    Returns the PNG file of the (height, width, 3) uint8 array <rgb>
+    '''
+    height, width, _ = rgb.shape
+    rows = np.zeros( (height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = rgb.reshape( height, -1)
+    png = [b'\x89PNG\r\n\x1a\n',
+           _PngChunk( b'IHDR', struct.pack( '>IIBBBBB', width, height, 8, 2, 0, 0, 0))]
+    if dpi:
+        perMetre = int( round( dpi / 0.0254))
+        png.append( _PngChunk( b'pHYs', struct.pack( '>IIB', perMetre, perMetre, 1)))
+    png.append( _PngChunk( b'IDAT', zlib.compress( rows.tobytes(), 6)))
+    png.append( _PngChunk( b'IEND', b''))
+    return b''.join( png)
+
+
+#---------------------------------------------------------------------------
+# The canvas
+#---------------------------------------------------------------------------
+
+class _RasterState(object):
+    '''
+    The graphics state between saveState() and restoreState()
+    '''
+    __slots__ = ('ctm', 'clip', 'fill', 'stroke', 'fillAlpha', 'strokeAlpha',
+                 'fillOverprint', 'strokeOverprint', 'blend', 'lineWidth',
+                 'dash', 'dashPhase', 'lineCap', 'lineJoin', 'miterLimit',
+                 'font', 'fontSize')
+
+    def __init__( self, ctm):
+        self.ctm = ctm
+        self.clip = None        # (x0, y0, coverage) in pixels, None for no clip
+        self.fill = (0.0, 0.0, 0.0, 1.0)
+        self.stroke = (0.0, 0.0, 0.0, 1.0)
+        self.fillAlpha = 1.0
+        self.strokeAlpha = 1.0
+        self.fillOverprint = False
+        self.strokeOverprint = False
+        self.blend = 'normal'
+        self.lineWidth = 1.0
+        self.dash = ()
+        self.dashPhase = 0
+        self.lineCap = 0
+        self.lineJoin = 0
+        self.miterLimit = 10.0
+        self.font = 'Helvetica'
+        self.fontSize = 12
+
+    def Copy( self):
+        other = _RasterState( self.ctm)
+        for name in self.__slots__:
+            setattr( other, name, getattr( self, name))
+        return other
+
+
+class _RasterPage(object):
+    '''
+    The CMYK page being drawn by a RasterCanvas, with its graphics state,
+    layer buffers and rasteriser. <forms> are the forms of the canvas,
+    name -> (DisplayList, bounds), replayed onto the page by doForm().
+    '''
+
+    def __init__( self, width, height, pagesize, dpi, forms, fonts):
+        self.width = width
+        self.height = height
+        self._pagesize = pagesize
+        self.dpi = dpi
+        self._forms = forms
+        self._fonts = fonts
+        self._NewPage()
+
+    def _NewPage( self):
+        s = self.dpi / 72.0
+        self._stack = [_RasterState( (s, 0.0, 0.0, -s, 0.0, self._pagesize[1] * s))]
+        self._cmyk = np.zeros( (self.height, self.width, 4), dtype=np.float32)
+        self._coverage = np.zeros( (self.height, self.width), dtype=np.float32)
+        self._layer = None      # the paint of the coverage, see _Paint()
+        self._dirty = None      # (x0, y0, x1, y1) of the coverage drawn on
+
+    @property
+    def _state( self):
+        return self._stack[-1]
+
+    #-----------------------------------------------------------------------
+    # Graphics state
+    #-----------------------------------------------------------------------
+
+    def saveState( self):
+        self._stack.append( self._state.Copy())
+
+    def restoreState( self):
+        self._stack.pop()
+
+    def transform( self, a, b, c, d, e, f):
+        self._state.ctm = _Concat( (a, b, c, d, e, f), self._state.ctm)
+
+    def translate( self, dx, dy):
+        self.transform( 1, 0, 0, 1, dx, dy)
+
+    def scale( self, x, y):
+        self.transform( x, 0, 0, y, 0, 0)
+
+    def rotate( self, theta):
+        theta *= math.pi / 180
+        c = math.cos( theta)
+        s = math.sin( theta)
+        self.transform( c, s, -s, c, 0, 0)
+
+    def setStrokeColorCMYK( self, c, m, y, k):
+        self._state.stroke = (c, m, y, k)
+
+    def setFillColorCMYK( self, c, m, y, k):
+        self._state.fill = (c, m, y, k)
+
+    def setStrokeOverprint( self, overprint):
+        self._state.strokeOverprint = bool( overprint)
+
+    def setFillOverprint( self, overprint):
+        self._state.fillOverprint = bool( overprint)
+
+    def setStrokeAlpha( self, alpha):
+        self._state.strokeAlpha = alpha
+
+    def setFillAlpha( self, alpha):
+        self._state.fillAlpha = alpha
+
+    def setBlendMode( self, mode):
+        self._state.blend = _DTD_BLEND_MODES[mode]
+
+    def setLineWidth( self, width):
+        self._state.lineWidth = width
+
+    def setDash( self, array=[], phase=0):
+        self._state.dash = tuple( array)
+        self._state.dashPhase = phase
+
+    def setLineCap( self, mode):
+        self._state.lineCap = int( mode)
+
+    def setLineJoin( self, mode):
+        self._state.lineJoin = int( mode)
+
+    def setMiterLimit( self, limit):
+        self._state.miterLimit = limit
+
+    def setFont( self, psfontname, size):
+        self._state.font = psfontname
+        self._state.fontSize = size
+
+    #-----------------------------------------------------------------------
+    # Layers
+    #-----------------------------------------------------------------------
+
+    def _Paint( self, fill):
+        '''
+        Makes the coverage buffer that of the fill or stroke paint of the
+        state, compositing the previous layer if the paint has changed
+        '''
+        state = self._state
+        if fill:
+            paint = (state.fill, state.fillAlpha, state.fillOverprint, state.blend)
+        else:
+            paint = (state.stroke, state.strokeAlpha, state.strokeOverprint, state.blend)
+        if paint != self._layer:
+            self._CompositeLayer()
+            self._layer = paint
+
+    def _CompositeLayer( self):
+        '''
+        Composites the coverage buffer onto the CMYK page and clears it
+        '''
+        if self._dirty is None:
+            return
+        x0, y0, x1, y1 = self._dirty
+        self._dirty = None
+        coverage = self._coverage[y0:y1, x0:x1]
+        cmyk, alpha, overprint, blend = self._layer
+        source = np.asarray( cmyk, dtype=np.float32)
+
+        # only the pixels covered, as an (N, 4) array
+        covered = coverage > 0
+        page = self._cmyk[y0:y1, x0:x1]
+        backdrop = page[covered]
+        if blend == 'normal':
+            blended = source
+        else:
+            blended = BlendCmyk( backdrop, source, blend)
+        result = backdrop + (coverage[covered] * alpha)[:, None] * (blended - backdrop)
+        if overprint:
+            # the inks the layer does not use are left as they are
+            unused = source == 0
+            result[:, unused] = backdrop[:, unused]
+        page[covered] = np.clip( result, 0.0, 1.0)
+        coverage.fill( 0)
+
+    def _AddCoverage( self, window, coverage):
+        '''
+        Adds <coverage> at <window> to the coverage buffer, within the clip
+        '''
+        if coverage is None:
+            return
+        x0, y0, x1, y1 = window
+        clip = self._state.clip
+        if clip is not None:
+            cx0, cy0, clipCoverage = clip
+            ix0 = max( x0, cx0)
+            iy0 = max( y0, cy0)
+            ix1 = min( x1, cx0 + clipCoverage.shape[1])
+            iy1 = min( y1, cy0 + clipCoverage.shape[0])
+            if (ix1 <= ix0) or (iy1 <= iy0):
+                return
+            coverage = coverage[iy0-y0:iy1-y0, ix0-x0:ix1-x0] * clipCoverage[iy0-cy0:iy1-cy0, ix0-cx0:ix1-cx0]
+            x0, y0, x1, y1 = ix0, iy0, ix1, iy1
+        target = self._coverage[y0:y1, x0:x1]
+        np.maximum( target, coverage, out=target)
+        if self._dirty is None:
+            self._dirty = (x0, y0, x1, y1)
+        else:
+            dx0, dy0, dx1, dy1 = self._dirty
+            self._dirty = (min( dx0, x0), min( dy0, y0), max( dx1, x1), max( dy1, y1))
+
+    def _Window( self, points):
+        '''
+        Returns the pixels (x0, y0, x1, y1) of the page, and of the clip,
+        enclosing the (..., 2) array of pixel coordinates <points>
+        '''
+        if points.size == 0:
+            return (0, 0, 0, 0)
+        xs = points[..., 0]
+        ys = points[..., 1]
+        x0 = max( 0, int( math.floor( xs.min())))
+        y0 = max( 0, int( math.floor( ys.min())))
+        x1 = min( self.width, int( math.ceil( xs.max())) + 1)
+        y1 = min( self.height, int( math.ceil( ys.max())) + 1)
+        clip = self._state.clip
+        if clip is not None:
+            cx0, cy0, clipCoverage = clip
+            x0 = max( x0, cx0)
+            y0 = max( y0, cy0)
+            x1 = min( x1, cx0 + clipCoverage.shape[1])
+            y1 = min( y1, cy0 + clipCoverage.shape[0])
+        return (x0, y0, x1, y1)
+
+    #-----------------------------------------------------------------------
+    # Painting
+    #-----------------------------------------------------------------------
+
+    def _Polylines( self, aPath):
+        return FlattenPath( aPath.Compile(), _TOLERANCE / _Scale( self._state.ctm))
+
+    def _FillCoverage( self, polylines):
+        if not polylines:
+            return None, None
+        points = _Apply( self._state.ctm, np.vstack( polylines) if len( polylines) > 1 else polylines[0])
+        window = self._Window( points)
+        return window, Coverage( _RingEdges( points, np.array( [len( poly) for poly in polylines])), window)
+
+    def _Fill( self, polylines):
+        self._Paint( True)
+        window, coverage = self._FillCoverage( polylines)
+        self._AddCoverage( window, coverage)
+
+    def _Stroke( self, polylines):
+        self._Paint( False)
+        state = self._state
+        ctm = state.ctm
+        scale = _Scale( ctm)
+        width = state.lineWidth if state.lineWidth * scale >= 1 else 1.0 / scale
+        polygons = StrokePolygons( polylines, width, state.lineCap, state.lineJoin, state.miterLimit,
+                                   state.dash, state.dashPhase, scale)
+        if not polygons:
+            return
+        edges = np.vstack( [_PolygonEdges( _Apply( ctm, p)) for p in polygons])
+        window = self._Window( edges.reshape( -1, 2))
+        self._AddCoverage( window, Coverage( edges, window, evenOdd=False))
+
+    def beginPath( self):
+        return PathBuilder()
+
+    def drawPath( self, aPath, stroke=1, fill=0):
+        if not (stroke or fill):
+            return
+        polylines = self._Polylines( aPath)
+        if fill:
+            self._Fill( polylines)
+        if stroke:
+            self._Stroke( polylines)
+
+    def clipPath( self, aPath, stroke=1, fill=0):
+        self.drawPath( aPath, stroke, fill)
+        window, coverage = self._FillCoverage( self._Polylines( aPath))
+        self._Clip( window, coverage)
+
+    def _Clip( self, window, coverage):
+        '''
+        Intersects the clip with <coverage> at <window>, which is within the clip
+        '''
+        if coverage is None:
+            coverage = np.zeros( (0, 0), dtype=np.float32)
+            window = (0, 0, 0, 0)
+        clip = self._state.clip
+        if clip is not None:
+            cx0, cy0, clipCoverage = clip
+            x0, y0, x1, y1 = window
+            coverage = coverage * clipCoverage[y0-cy0:y1-cy0, x0-cx0:x1-cx0]
+        self._state.clip = (window[0], window[1], coverage)
+
+    def circle( self, x_cen, y_cen, r, stroke=1, fill=0):
+        if not (stroke or fill):
+            return
+        ring = _CirclePolygons( np.array( ((x_cen, y_cen),), dtype=float), r, _Scale( self._state.ctm))[0]
+        if fill:
+            self._Fill( [ring])
+        if stroke:
+            self._Stroke( [np.vstack( (ring, ring[:1]))])
+
+    def rect( self, x, y, width, height, stroke=1, fill=0):
+        p = PathBuilder()
+        p.rect( x, y, width, height)
+        self.drawPath( p, stroke, fill)
+
+    def _Font( self, name, size):
+        key = (name, size)
+        font = self._fonts.get( key)
+        if font is None:
+            for fileName in _FONT_FILES:
+                try:
+                    font = ImageFont.truetype( fileName, size)
+                    break
+                except OSError:
+                    continue
+            else:
+                font = ImageFont.load_default( size)
+            self._fonts[key] = font
+        return font
+
+    def drawString( self, x, y, text):
+        if ImageFont is None:
+            if not self._fonts:
+                log.warning( "Pillow is not installed, text is left out of raster images")
+                self._fonts[None] = None
+            return
+        self._Paint( True)
+        state = self._state
+        px, py = _Apply( state.ctm, np.array( (x, y), dtype=float))
+        size = max( 1, int( round( state.fontSize * _Scale( state.ctm))))
+        font = self._Font( state.font, size)
+        left, top, right, bottom = font.getbbox( text, anchor='ls')
+        if (right <= left) or (bottom <= top):
+            return
+        image = Image.new( 'L', (right - left, bottom - top))
+        ImageDraw.Draw( image).text( (-left, -top), text, fill=255, font=font, anchor='ls')
+        x0 = int( round( px)) + left
+        y0 = int( round( py)) + top
+        coverage = np.asarray( image, dtype=np.float32) * (1.0 / 255)
+        window = self._Window( np.array( ((x0, y0), (x0 + coverage.shape[1] - 1, y0 + coverage.shape[0] - 1)), dtype=float))
+        wx0, wy0, wx1, wy1 = window
+        if (wx1 > wx0) and (wy1 > wy0):
+            self._AddCoverage( window, coverage[wy0-y0:wy1-y0, wx0-x0:wx1-x0])
+
+    #-----------------------------------------------------------------------
+    # Forms, recorded by RasterCanvas and replayed here
+    #-----------------------------------------------------------------------
+
+    def doForm( self, name):
+        form, (llx, lly, urx, ury) = self._forms[name]
+        self.saveState()
+        ctm = self._state.ctm
+        if (ctm[1] == 0) and (ctm[2] == 0):
+            corners = _Apply( ctm, np.array( ((llx, lly), (urx, ury)), dtype=float))
+            window = self._Window( corners)
+            self._Clip( window, BoxCoverage( corners.ravel(), window))
+        else:
+            p = PathBuilder()
+            p.rect( llx, lly, urx - llx, ury - lly)
+            self.clipPath( p, stroke=0, fill=0)
+        form.Replay( self)
+        self.restoreState()
+
+    #-----------------------------------------------------------------------
+    # Output
+    #-----------------------------------------------------------------------
+
+    def PageCmyk( self):
+        '''
+        Returns the CMYK values of the current page, composited so far, as
+        a (height, width, 4) float32 array
+        '''
+        self._CompositeLayer()
+        return self._cmyk
+
+
+class RasterCanvas(object):
+    '''
+    A canvas rendering pages of <pagesize> points at <dpi> pixels per
+    inch, written as PNG files when saved. The pages are converted to RGB
+    with <converter>, a ColorConverter.
+
+    All drawing goes to the current target: the page, or the DisplayList
+    of the form being defined between beginForm() and endForm(). Forms
+    may be defined inside the definition of another form.
+    '''
+
+    def __init__( self, filename, pagesize, dpi=150, converter=None):
+        self.filename = filename
+        self._pagesize = pagesize
+        self.dpi = dpi
+        self._converter = converter or DefaultConverter()
+        self.width = max( 1, int( math.ceil( pagesize[0] * dpi / 72.0 - 1e-6)))
+        self.height = max( 1, int( math.ceil( pagesize[1] * dpi / 72.0 - 1e-6)))
+        self._pages = []
+        self._forms = {}        # name -> (DisplayList, bounds)
+        self._defining = []     # (name, DisplayList, bounds) of the forms being defined
+        self._fonts = {}
+        self._page = self._NewPage()
+        self._target = self._page
+
+    def _NewPage( self):
+        return _RasterPage( self.width, self.height, self._pagesize, self.dpi, self._forms, self._fonts)
+
+    #-----------------------------------------------------------------------
+    # Drawing, on the current target
+    #-----------------------------------------------------------------------
+
+    def saveState( self):
+        self._target.saveState()
+
+    def restoreState( self):
+        self._target.restoreState()
+
+    def transform( self, a, b, c, d, e, f):
+        self._target.transform( a, b, c, d, e, f)
+
+    def translate( self, dx, dy):
+        self._target.translate( dx, dy)
+
+    def scale( self, x, y):
+        self._target.scale( x, y)
+
+    def rotate( self, theta):
+        self._target.rotate( theta)
+
+    def setStrokeColorCMYK( self, c, m, y, k):
+        self._target.setStrokeColorCMYK( c, m, y, k)
+
+    def setFillColorCMYK( self, c, m, y, k):
+        self._target.setFillColorCMYK( c, m, y, k)
+
+    def setStrokeOverprint( self, overprint):
+        self._target.setStrokeOverprint( overprint)
+
+    def setFillOverprint( self, overprint):
+        self._target.setFillOverprint( overprint)
+
+    def setStrokeAlpha( self, alpha):
+        self._target.setStrokeAlpha( alpha)
+
+    def setFillAlpha( self, alpha):
+        self._target.setFillAlpha( alpha)
+
+    def setBlendMode( self, mode):
+        self._target.setBlendMode( mode)
+
+    def setLineWidth( self, width):
+        self._target.setLineWidth( width)
+
+    def setDash( self, array=[], phase=0):
+        self._target.setDash( array, phase)
+
+    def setLineCap( self, mode):
+        self._target.setLineCap( mode)
+
+    def setLineJoin( self, mode):
+        self._target.setLineJoin( mode)
+
+    def setMiterLimit( self, limit):
+        self._target.setMiterLimit( limit)
+
+    def setFont( self, psfontname, size):
+        self._target.setFont( psfontname, size)
+
+    def beginPath( self):
+        return PathBuilder()
+
+    def drawPath( self, aPath, stroke=1, fill=0):
+        self._target.drawPath( aPath, stroke, fill)
+
+    def clipPath( self, aPath, stroke=1, fill=0):
+        self._target.clipPath( aPath, stroke, fill)
+
+    def circle( self, x_cen, y_cen, r, stroke=1, fill=0):
+        self._target.circle( x_cen, y_cen, r, stroke, fill)
+
+    def rect( self, x, y, width, height, stroke=1, fill=0):
+        self._target.rect( x, y, width, height, stroke, fill)
+
+    def drawString( self, x, y, text):
+        self._target.drawString( x, y, text)
+
+    def doForm( self, name):
+        self._target.doForm( name)
+
+    #-----------------------------------------------------------------------
+    # Forms, recorded into display lists and replayed by doForm()
+    #-----------------------------------------------------------------------
+
+    def beginForm( self, name, lowerx=0, lowery=0, upperx=None, uppery=None):
+        if upperx is None:
+            upperx = self._pagesize[0]
+        if uppery is None:
+            uppery = self._pagesize[1]
+        form = DisplayList( self._pagesize)
+        self._defining.append( (name, form, (lowerx, lowery, upperx, uppery)))
+        self._target = form
+
+    def endForm( self):
+        name, form, bounds = self._defining.pop()
+        self._forms[name] = (form, bounds)
+        self._target = self._defining[-1][1] if self._defining else self._page
+
+    #-----------------------------------------------------------------------
+    # Pages and output
+    #-----------------------------------------------------------------------
+
+    def showPage( self):
+        self._pages.append( self.PageRgb())
+        self._page = self._NewPage()
+        if not self._defining:
+            self._target = self._page
+
+    def PageCmyk( self):
+        '''
+        Returns the CMYK values of the current page, composited so far, as
+        a (height, width, 4) float32 array
+        '''
+        return self._page.PageCmyk()
+
+    def PageRgb( self):
+        '''
+        Returns the current page as a (height, width, 3) uint8 RGB array
+        '''
+        return self._converter.ConvertArray( self.PageCmyk())
+
+    def _PageFileName( self, pageNo):
+        if pageNo == 0:
+            return self.filename
+        base, dot, ext = self.filename.rpartition( '.')
+        if not dot:
+            return "%s-%d" % (self.filename, pageNo + 1)
+        return "%s-%d.%s" % (base, pageNo + 1, ext)
+
+    def Pages( self):
+        '''
+        Ends the current page if anything is drawn on it and returns the
+        PNG file of each page as bytes
+        '''
+        if self.PageCmyk().any() or not self._pages:
+            self.showPage()
+        return [PngBytes( rgb, self.dpi) for rgb in self._pages]
+
+    def save( self):
+        '''
+        Writes the PNG files. Any pages after the first are written to
+        files with the page number added to the name.
+        '''
+        for pageNo, png in enumerate( self.Pages()):
+            with open( self._PageFileName( pageNo), 'wb') as f:
+                f.write( png)
@@ -0,0 +1,331 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Resident render service keeping compiled specs in memory
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+A small HTTP server rendering legends on request, for editors and other
+tools that need many previews. It listens on a localhost port or on a Unix
+socket:
+
+    python MSSRenderService.py --port 8765
+    python MSSRenderService.py --socket /tmp/mss2legend.sock
+
+    curl "http://localhost:8765/render?spec=/path/file.xml&symbols=101,102&format=svg"
+    curl --unix-socket /tmp/mss2legend.sock "http://x/render?spec=/path/file.xml"
+
+GET /render takes the parameters
+    spec        the MSS file, required
+    symbols     comma separated symbol ids
+    first, last the range of symbol ids, both included
+    type        comma separated symbol types
+    layer       comma separated layer ids, the symbols painting on them
+    format      pdf, svg or png, default pdf
+    page        the page of an SVG or PNG legend, counting from 0, default 0
+    thumbnail   yes for only the graphics of the single symbol in symbols=,
+                on a page of its own size
+Without symbols, first, last, type and layer the full legend is rendered.
+GET /status returns the statistics of the service as JSON.
+
+Requests are read by asyncio and rendered by a pool of worker processes.
+Each worker keeps the compiled specs it has used in an LRU cache, keyed by
+file path and modification time, so an edited file is compiled again on
+its next request while unchanged files are never parsed twice.
+'''
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import urllib.parse
+import mss2legend
+from MSSError import MSSError, PageError
+from MSSFragmentCache import FragmentCache, DefaultCacheDir
+
+
+_CONTENT_TYPES = {'pdf': 'application/pdf', 'svg': 'image/svg+xml', 'png': 'image/png'}
+
+
+class SpecCache(object):
+    '''
+    The <maxEntries> most recently used compiled specs, keyed by the real
+    path, modification time and size of their file.
+    '''
+
+    def __init__( self, maxEntries=16):
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def Get( self, fileName):
+        '''
+        Returns the compiled spec of <fileName>, compiling it if the file
+        is new or has changed since last time.
+        '''
+        path = os.path.realpath( fileName)
+        st = os.stat( path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        spec = self._entries.get( key)
+        if spec is not None:
+            self._entries.move_to_end( key)
+            self.hits += 1
+            return spec
+
+        self.misses += 1
+        spec = mss2legend.LoadSpec( path)
+        for oldKey in [k for k in self._entries if k[0] == path]:
+            del self._entries[oldKey]
+        self._entries[key] = spec
+        while len( self._entries) > self.maxEntries:
+            self._entries.popitem( last=False)
+        return spec
+
+
+def RenderRequest( specCache, fragmentCache, fileName, selection, fileFormat='pdf', pageNo=0, thumbnail=False):
+    '''
+    Renders the legend of the symbols of the MSS file <fileName> selected
+    by <selection>, the keyword arguments of SymbolSpec.Select(), and
+    returns the document as bytes. With <thumbnail>, the selection is one
+    symbol id, rendered by mss2legend.RenderSymbol().
+
+    Raises
+    ------
+    PageError
+        <pageNo> is not a page of the legend
+    MSSError
+        The file has errors, or the selection is wrong
+    '''
+    spec = specCache.Get( fileName)
+    try:
+        if thumbnail:
+            ids = selection.get( 'ids') or []
+            if (len( ids) != 1) or (len( selection) != 1):
+                raise MSSError( "A thumbnail needs exactly one symbol")
+            return mss2legend.RenderSymbol( spec, ids[0], fileFormat, fragmentCache)
+        return mss2legend.RenderSymbols( spec, fileFormat=fileFormat, fragmentCache=fragmentCache,
+                                         pageNo=pageNo, **selection)
+    except MSSError as e:
+        raise e.AddContext( fileName=fileName)
+
+
+# the state of a worker, see _InitWorker()
+_worker = {}
+
+def _InitWorker( cacheDir, maxSpecs):
+    _worker['specs'] = SpecCache( maxSpecs)
+    _worker['fragments'] = FragmentCache( cacheDir) if cacheDir else None
+
+def _RenderJob( fileName, selection, fileFormat, pageNo, thumbnail):
+    '''
+    Runs RenderRequest() in a worker
+    '''
+    return RenderRequest( _worker['specs'], _worker['fragments'],
+                          fileName, selection, fileFormat, pageNo, thumbnail)
+
+
+class _HttpError(Exception):
+    def __init__( self, status, message):
+        super().__init__( message)
+        self.status = status
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            422: "Unprocessable Entity", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class RenderService(object):
+    '''
+    The asyncio front end of the service. With <workers> 0 the legends are
+    rendered by one thread of this process, else by that many processes.
+    '''
+
+    def __init__( self, workers=0, cacheDir=None, maxSpecs=16):
+        self.workers = workers
+        self.cacheDir = cacheDir
+        self.maxSpecs = maxSpecs
+        self.executor = self.NewExecutor()
+        self.started = time.time()
+        self.requests = 0
+        self.failures = 0
+
+    def NewExecutor( self):
+        '''
+        Returns a new pool of workers for the legends
+        '''
+        if self.workers > 0:
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_InitWorker, initargs=(self.cacheDir, self.maxSpecs))
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, initializer=_InitWorker, initargs=(self.cacheDir, self.maxSpecs))
+
+    def ReplaceExecutor( self, broken):
+        '''
+        Replaces the pool <broken>, whose worker processes died, by a new
+        one. Requests that failed on the same pool replace it only once.
+        '''
+        if self.executor is broken:
+            self.executor = self.NewExecutor()
+            broken.shutdown( wait=False)
+
+    async def HandleConnection( self, reader, writer):
+        '''
+        Serves one HTTP request on a connection, then closes it
+        '''
+        try:
+            status, contentType, body = await self.HandleRequest( reader)
+        except _HttpError as e:
+            status, contentType, body = e.status, 'text/plain; charset=utf-8', (str( e) + "\n").encode( 'utf-8')
+        if status != 200:
+            self.failures += 1
+        header = ("HTTP/1.1 %d %s\r\n"
+                  "Content-Type: %s\r\n"
+                  "Content-Length: %d\r\n"
+                  "Connection: close\r\n\r\n" % (status, _REASONS.get( status, ""), contentType, len( body)))
+        try:
+            writer.write( header.encode( 'ascii') + body)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def HandleRequest( self, reader):
+        '''
+        Reads and serves a request, returns (status, content type, body)
+        '''
+        try:
+            requestLine = (await reader.readline()).decode( 'latin-1').split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+        except (ConnectionError, ValueError):
+            raise _HttpError( 400, "Bad request") from None
+        if len( requestLine) != 3:
+            raise _HttpError( 400, "Bad request")
+        method, target, _ = requestLine
+        if method != 'GET':
+            raise _HttpError( 405, "Only GET is supported")
+        self.requests += 1
+
+        url = urllib.parse.urlsplit( target)
+        query = urllib.parse.parse_qs( url.query)
+        if url.path == '/status':
+            return 200, 'application/json', json.dumps( self.Status()).encode( 'utf-8')
+        if url.path != '/render':
+            raise _HttpError( 404, "Unknown path %s" % url.path)
+
+        fileName = query.get( 'spec', [None])[0]
+        if not fileName:
+            raise _HttpError( 400, "Parameter spec is required")
+        selection = {}
+        for name, argument in (('symbols', 'ids'), ('type', 'types'), ('layer', 'layers')):
+            if name in query:
+                selection[argument] = [s for s in ",".join( query[name]).split( ',') if s]
+        for name in ('first', 'last'):
+            if name in query:
+                selection[name] = query[name][0]
+        thumbnail = query.get( 'thumbnail', ['no'])[0] in ('yes', '1', 'true')
+        fileFormat = query.get( 'format', ['pdf'])[0]
+        if fileFormat not in _CONTENT_TYPES:
+            raise _HttpError( 400, "Unknown format %s" % fileFormat)
+        try:
+            pageNo = int( query.get( 'page', ['0'])[0])
+        except ValueError:
+            raise _HttpError( 400, "Parameter page is not a number") from None
+
+        loop = asyncio.get_running_loop()
+        for attempt in (1, 2):
+            executor = self.executor
+            try:
+                body = await loop.run_in_executor( executor, _RenderJob, fileName, selection, fileFormat, pageNo, thumbnail)
+                break
+            except concurrent.futures.process.BrokenProcessPool:
+                # a worker process died, e.g. killed for running out of memory:
+                # start a new pool and try once more
+                self.ReplaceExecutor( executor)
+                if attempt == 2:
+                    raise _HttpError( 503, "The render workers failed, try again later") from None
+            except OSError as e:
+                raise _HttpError( 404, "%s: %s" % (fileName, e.strerror)) from None
+            except PageError as e:
+                raise _HttpError( 400, str( e)) from None
+            except MSSError as e:
+                raise _HttpError( 422, str( e)) from None
+            except Exception as e:
+                raise _HttpError( 500, "%s: %s" % (type(e).__name__, e)) from None
+        return 200, _CONTENT_TYPES[fileFormat], body
+
+    def Status( self):
+        return { 'uptime': round( time.time() - self.started, 1),
+                 'workers': self.workers,
+                 'requests': self.requests,
+                 'failures': self.failures }
+
+    async def Serve( self, host='127.0.0.1', port=8765, socketPath=None):
+        '''
+        Serves requests until cancelled, on <socketPath> if given, else on
+        <host>:<port>
+        '''
+        if socketPath:
+            server = await asyncio.start_unix_server( self.HandleConnection, path=socketPath)
+            print( "Serving on", socketPath)
+        else:
+            server = await asyncio.start_server( self.HandleConnection, host, port)
+            print( "Serving on http://%s:%d" % (host, port))
+        sys.stdout.flush()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown( cancel_futures=True)
+            if socketPath and os.path.exists( socketPath):
+                os.remove( socketPath)
+
+
+def main( argv=None):
+    parser = argparse.ArgumentParser(
+        prog='mss2legend-service',
+        description="Serves legends of Map Symbol Specification files over HTTP.")
+    parser.add_argument( '--host', default='127.0.0.1',
+                         help="address to listen on (default: %(default)s)")
+    parser.add_argument( '--port', type=int, default=8765,
+                         help="port to listen on (default: %(default)s)")
+    parser.add_argument( '--socket', metavar='PATH',
+                         help="listen on this Unix socket instead of a port")
+    parser.add_argument( '-j', '--jobs', type=int, default=0, metavar='N',
+                         help="number of worker processes, 0 to render in the service process (default: 0)")
+    parser.add_argument( '--max-specs', type=int, default=16, metavar='N',
+                         help="number of compiled specs kept by each worker (default: %(default)s)")
+    parser.add_argument( '--cache-dir', default=DefaultCacheDir(),
+                         help="directory of the symbol cache (default: %(default)s)")
+    parser.add_argument( '--no-cache', action='store_true',
+                         help="draw all symbols without using the symbol cache")
+    args = parser.parse_args( argv)
+
+    service = RenderService( args.jobs, None if args.no_cache else args.cache_dir, args.max_specs)
+    try:
+        asyncio.run( service.Serve( args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit( main())
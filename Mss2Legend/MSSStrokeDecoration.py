@@ -6,71 +6,69 @@ Created on Sat Nov 22 07:57:07 2025
 """
 
 import math
+import numpy as np
 from  MSSPath import *
 from MSSDrawShapes import DrawShape
+from MSSGeometry import ArcLengthTable
 
 def CalcLineLengthFromDecoration( strokeDecoration, maxLen):
-    offset = float(strokeDecoration.attrib['offset'])
-    spacing = float(strokeDecoration.attrib['spacing'])
+    offset = strokeDecoration.offset
+    spacing = strokeDecoration.spacing
 
     count = math.floor((maxLen - offset*2) / spacing)
     return round(spacing*count + 2*offset, 3)
     
-def _DrawDecoration( drawer, decParts, layerId):
+def _DrawDecoration( drawer, strokeDecoration, layer):
     canvas = drawer.canvas
-    for part in decParts:
-        if ("fill" in part.attrib):
-            fillColor = part.attrib["fill"]
-            if (fillColor == layerId):
-                DrawShape( canvas, part)
-        if ("stroke" in part.attrib):
-            drawer.SetStrokeStyle( part)
-            strokeColor =  part.attrib["stroke"]
-            if (strokeColor == layerId):
-                DrawShape( canvas, part)
+    for part in strokeDecoration.parts:
+        if (part.fill is not None):
+            if (part.fill is layer):
+                DrawShape( canvas, part, layer)
+        if (part.stroke is not None):
+            if (part.stroke is layer):
+                drawer.SetStrokeStyle( part)
+                DrawShape( canvas, part, layer)
 
 
-def DrawRegularStrokeDecoration( drawer, xs, ys, layerId, lineLen, strokeDecoration ):
-    canvas = drawer.canvas
-    offset = float(strokeDecoration.attrib['offset'])
-    spacing = float(strokeDecoration.attrib['spacing'])
-    x0 = xs - (lineLen * 0.5) + offset
-    x1 = xs + (lineLen * 0.5)
-    canvas.saveState()
-    canvas.translate( x0, ys)
-    while (x0<x1):
-        _DrawDecoration( drawer, strokeDecoration, layerId)
-        x0 += spacing
-        canvas.translate( spacing,0)
-    canvas.restoreState()
+def CalcDecorationDistances( strokeDecoration, lineLen):
+    '''
+    Returns the distances along a line of length <lineLen> where the
+    decoration is placed, as a numpy array.
+        regular:     at offset + k*spacing, as long as it is on the line
+        dash-point:  three decorations evenly spread along the line
+        start-point: at the start of the line
+        end-point:   at the end of the line
+    '''
+    decorationType = strokeDecoration.type
+    if (decorationType == 'regular'):
+        offset = strokeDecoration.offset
+        spacing = strokeDecoration.spacing
+        count = max( math.ceil( (lineLen - offset) / spacing), 0)
+        distances = offset + spacing * np.arange( count + 1)
+        return distances[distances < lineLen]
+    if (decorationType == 'dash-point'):
+        spaceCount = 3  # will draw 3 elements
+        return lineLen / (spaceCount+1) * np.arange( 1, spaceCount+1)
+    if (decorationType == 'start-point'):
+        return np.zeros( 1)
+    if (decorationType == 'end-point'):
+        return np.full( 1, float( lineLen))
+    return np.empty( 0)
 
-def DrawDashPointStrokeDecoration( drawer, xs, ys, layerId, lineLen, strokeDecoration ):
+def DrawStrokeDecoration( drawer, line, layer, strokeDecoration):
+    '''
+    Draws the parts of <strokeDecoration> on <layer> along <line>, an
+    ArcLengthTable or a polyline as an (N, 2) array. Each decoration is
+    rotated to follow the direction of the line.
+    '''
+    if not isinstance( line, ArcLengthTable):
+        line = ArcLengthTable( line)
+    distances = CalcDecorationDistances( strokeDecoration, line.length)
+    if len(distances) == 0:
+        return
     canvas = drawer.canvas
-    spaceCount = 3  # will draw 3 elements
-    spacing = lineLen / (spaceCount+1)   
-    x0 = xs - lineLen / 2 + spacing
-    canvas.saveState()
-    canvas.translate( x0, ys)
-    _DrawDecoration( drawer, strokeDecoration, layerId)
-
-    for i in range(spaceCount):
-        _DrawDecoration( drawer, strokeDecoration, layerId)
-        canvas.translate( spacing,0)
-    canvas.restoreState()
-
-def DrawStartPointStrokeDecoration( drawer, xs, ys, layerId, lineLen, strokeDecoration ):
-    canvas = drawer.canvas
-    canvas.saveState()
-    canvas.translate( xs - lineLen/2, ys)
-    _DrawDecoration( drawer, strokeDecoration, layerId)
-    canvas.restoreState()
-
-def DrawEndPointStrokeDecoration( drawer, xs, ys, layerId, lineLen, strokeDecoration ):
-    canvas = drawer.canvas
-    canvas.saveState()
-    canvas.translate( xs + lineLen/2, ys)
-    _DrawDecoration( drawer, strokeDecoration, layerId)
-    canvas.restoreState()
-
-
-
+    for placement in line.Placements( distances).tolist():
+        canvas.saveState()
+        canvas.transform( *placement)
+        _DrawDecoration( drawer, strokeDecoration, layer)
+        canvas.restoreState()
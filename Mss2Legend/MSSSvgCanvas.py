@@ -0,0 +1,510 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   SVG canvas, the reportlab canvas methods writing SVG
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+SvgCanvas has the subset of the reportlab canvas methods used by the
+drawing code and the display list, and writes an SVG file. It does not
+depend on reportlab.
+
+The page uses PDF coordinates, y pointing up, with one unit per point.
+Colours are converted to RGB by a MSSColorConvert.ColorConverter, the
+naive conversion of MSSColor unless another converter is given.
+Overprint is not available in SVG and is ignored. Blend modes become the
+mix-blend-mode style of each element. Form XObjects become groups in
+<defs>, drawn with <use>, and inherit the fill and stroke colour from the
+<use> element just as forms inherit the graphics state in PDF.
+
+SvgCanvas keeps the document in memory until it is saved. SvgStreamCanvas
+writes it to a file or socket while it is drawn, for large legends and
+previews: only the forms being defined are kept in memory, and paths
+drawn again with the same data and paint, like stroke decorations, are
+written once in <defs> and then drawn with <use>. Both draw with the
+methods of SvgCanvasBase, and differ only in where the output goes.
+'''
+
+import re
+import math
+import collections
+from xml.sax.saxutils import escape, quoteattr
+from MSSPath import PathBuilder
+from MSSColor import BLEND_MODES, PdfBlendMode
+from MSSColorConvert import DefaultConverter
+
+
+_SVG_OP_FORMAT = ("M%.4f %.4f", "L%.4f %.4f", "C%.4f %.4f %.4f %.4f %.4f %.4f", "Z")
+_TRAILING_ZEROS_RE = re.compile( r'(\.\d*?[1-9])0+(?![0-9])|\.0+(?![0-9])')
+
+_LINE_CAPS = ('butt', 'round', 'square')
+_LINE_JOINS = ('miter', 'round', 'bevel')
+
+# The CSS blend mode of each PDF blend mode given to setBlendMode()
+_CSS_BLEND_MODES = { PdfBlendMode( blend): blend for blend in BLEND_MODES}
+
+# The colour of form content, inherited from the <use> element
+_INHERIT = None
+
+
+def _Num( x):
+    return _TRAILING_ZEROS_RE.sub( r'\1', "%.4f" % x)
+
+def _SvgHeader( width, height):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            'width="%spt" height="%spt" viewBox="0 0 %s %s">\n' % (_Num( width), _Num( height), _Num( width), _Num( height)))
+
+def SvgPathData( ir):
+    '''
+    Returns the SVG "d" attribute of the compiled path <ir>
+    '''
+    template = "".join( [_SVG_OP_FORMAT[op] for op in ir.ops])
+    return _TRAILING_ZEROS_RE.sub( r'\1', template % tuple( ir.coords))
+
+
+class _SvgState(object):
+    '''
+    The graphics state between saveState() and restoreState()
+    '''
+    __slots__ = ('fill', 'stroke', 'fillAlpha', 'strokeAlpha', 'lineWidth',
+                 'dash', 'dashPhase', 'lineCap', 'lineJoin', 'miterLimit',
+                 'blend', 'font', 'fontSize', 'groups')
+
+    def __init__( self, color='#000000'):
+        self.fill = color
+        self.stroke = color
+        self.fillAlpha = 1.0
+        self.strokeAlpha = 1.0
+        self.lineWidth = 1.0
+        self.dash = ()
+        self.dashPhase = 0
+        self.lineCap = 0
+        self.lineJoin = 0
+        self.miterLimit = 10.0
+        self.blend = None   # the CSS name, None for normal
+        self.font = 'Helvetica'
+        self.fontSize = 12
+        self.groups = 0     # number of <g> elements opened at this level
+
+    def Copy( self):
+        other = _SvgState()
+        for name in self.__slots__:
+            setattr( other, name, getattr( self, name))
+        other.groups = 0
+        return other
+
+
+class SvgCanvasBase(object):
+    '''
+    The drawing methods shared by SvgCanvas and SvgStreamCanvas, for
+    pages of <pagesize> points. The elements drawn are appended to <out>
+    and the definitions to <defs>, lists or objects with an append()
+    method. Colours are converted with <converter>, a ColorConverter.
+    '''
+
+    def __init__( self, pagesize, out, defs, converter=None):
+        self._pagesize = pagesize
+        self._converter = converter or DefaultConverter()
+        self._defs = defs
+        self._out = out
+        self._stack = [_SvgState()]
+        self._forms = []        # (name, bounds, out, stack) of forms being defined
+        self._clipCount = 0
+
+    @property
+    def _state( self):
+        return self._stack[-1]
+
+    #-----------------------------------------------------------------------
+    # Graphics state
+    #-----------------------------------------------------------------------
+
+    def saveState( self):
+        self._stack.append( self._state.Copy())
+
+    def restoreState( self):
+        state = self._stack.pop()
+        self._out.append( "</g>" * state.groups)
+
+    def transform( self, a, b, c, d, e, f):
+        self._out.append( '<g transform="matrix(%s)">' % " ".join( _Num( v) for v in (a, b, c, d, e, f)))
+        self._state.groups += 1
+
+    def translate( self, dx, dy):
+        self.transform( 1, 0, 0, 1, dx, dy)
+
+    def scale( self, x, y):
+        self.transform( x, 0, 0, y, 0, 0)
+
+    def rotate( self, theta):
+        theta *= math.pi / 180
+        c = math.cos( theta)
+        s = math.sin( theta)
+        self.transform( c, s, -s, c, 0, 0)
+
+    def setStrokeColorCMYK( self, c, m, y, k):
+        self._state.stroke = self._converter.Hex( c, m, y, k)
+
+    def setFillColorCMYK( self, c, m, y, k):
+        self._state.fill = self._converter.Hex( c, m, y, k)
+
+    def setStrokeOverprint( self, overprint):
+        pass
+
+    def setFillOverprint( self, overprint):
+        pass
+
+    def setStrokeAlpha( self, alpha):
+        self._state.strokeAlpha = alpha
+
+    def setFillAlpha( self, alpha):
+        self._state.fillAlpha = alpha
+
+    def setBlendMode( self, mode):
+        blend = _CSS_BLEND_MODES[mode]
+        self._state.blend = None if blend == 'normal' else blend
+
+    def setLineWidth( self, width):
+        self._state.lineWidth = width
+
+    def setDash( self, array=[], phase=0):
+        self._state.dash = tuple( array)
+        self._state.dashPhase = phase
+
+    def setLineCap( self, mode):
+        self._state.lineCap = mode
+
+    def setLineJoin( self, mode):
+        self._state.lineJoin = mode
+
+    def setMiterLimit( self, limit):
+        self._state.miterLimit = limit
+
+    def setFont( self, psfontname, size):
+        self._state.font = psfontname
+        self._state.fontSize = size
+
+    #-----------------------------------------------------------------------
+    # Painting
+    #-----------------------------------------------------------------------
+
+    def _PaintAttributes( self, stroke, fill):
+        state = self._state
+        attrs = []
+        if fill:
+            if state.fill is not _INHERIT:
+                attrs.append( 'fill="%s"' % state.fill)
+            if state.fillAlpha != 1:
+                attrs.append( 'fill-opacity="%s"' % _Num( state.fillAlpha))
+            attrs.append( 'fill-rule="evenodd"')
+        else:
+            attrs.append( 'fill="none"')
+        if stroke:
+            if state.stroke is not _INHERIT:
+                attrs.append( 'stroke="%s"' % state.stroke)
+            if state.strokeAlpha != 1:
+                attrs.append( 'stroke-opacity="%s"' % _Num( state.strokeAlpha))
+            attrs.append( 'stroke-width="%s"' % _Num( state.lineWidth))
+            if state.lineCap:
+                attrs.append( 'stroke-linecap="%s"' % _LINE_CAPS[int( state.lineCap)])
+            if state.lineJoin:
+                attrs.append( 'stroke-linejoin="%s"' % _LINE_JOINS[int( state.lineJoin)])
+            elif state.miterLimit != 4:
+                attrs.append( 'stroke-miterlimit="%s"' % _Num( state.miterLimit))
+            if state.dash:
+                attrs.append( 'stroke-dasharray="%s"' % ",".join( _Num( v) for v in state.dash))
+                if state.dashPhase:
+                    attrs.append( 'stroke-dashoffset="%s"' % _Num( state.dashPhase))
+        elif state.stroke is _INHERIT:
+            # form content would otherwise inherit the stroke of <use>
+            attrs.append( 'stroke="none"')
+        if state.blend:
+            attrs.append( 'style="mix-blend-mode:%s"' % state.blend)
+        return " ".join( attrs)
+
+    def beginPath( self):
+        return PathBuilder()
+
+    def drawPath( self, aPath, stroke=1, fill=0):
+        if not (stroke or fill):
+            return
+        self._out.append( '<path d="%s" %s/>' % (SvgPathData( aPath.Compile()), self._PaintAttributes( stroke, fill)))
+
+    def clipPath( self, aPath, stroke=1, fill=0):
+        self.drawPath( aPath, stroke, fill)
+        self._clipCount += 1
+        clipId = "clip%d" % self._clipCount
+        self._defs.append( '<clipPath id="%s"><path d="%s" clip-rule="evenodd"/></clipPath>'
+                           % (clipId, SvgPathData( aPath.Compile())))
+        self._out.append( '<g clip-path="url(#%s)">' % clipId)
+        self._state.groups += 1
+
+    def circle( self, x_cen, y_cen, r, stroke=1, fill=0):
+        if stroke or fill:
+            self._out.append( '<circle cx="%s" cy="%s" r="%s" %s/>'
+                              % (_Num( x_cen), _Num( y_cen), _Num( r), self._PaintAttributes( stroke, fill)))
+
+    def rect( self, x, y, width, height, stroke=1, fill=0):
+        if (width < 0):
+            x += width
+            width = -width
+        if (height < 0):
+            y += height
+            height = -height
+        if stroke or fill:
+            self._out.append( '<rect x="%s" y="%s" width="%s" height="%s" %s/>'
+                              % (_Num( x), _Num( y), _Num( width), _Num( height), self._PaintAttributes( stroke, fill)))
+
+    def drawString( self, x, y, text):
+        state = self._state
+        self._out.append( '<text transform="matrix(1 0 0 -1 %s %s)" font-family=%s font-size="%s" fill="%s">%s</text>'
+                          % (_Num( x), _Num( y), quoteattr( state.font), _Num( state.fontSize),
+                             state.fill or 'inherit', escape( text)))
+
+    #-----------------------------------------------------------------------
+    # Forms
+    #-----------------------------------------------------------------------
+
+    def beginForm( self, name, lowerx=0, lowery=0, upperx=None, uppery=None):
+        if upperx is None:
+            upperx = self._pagesize[0]
+        if uppery is None:
+            uppery = self._pagesize[1]
+        self._forms.append( (name, (lowerx, lowery, upperx, uppery), self._out, self._stack))
+        self._out = []
+        self._stack = [_SvgState( _INHERIT)]
+
+    def endForm( self):
+        name, (llx, lly, urx, ury), out, stack = self._forms.pop()
+        while len( self._stack) > 1:
+            self.restoreState()
+        body = "".join( self._out) + "</g>" * self._state.groups
+        self._defs.append( '<clipPath id="%s_bbox"><rect x="%s" y="%s" width="%s" height="%s"/></clipPath>'
+                           % (name, _Num( llx), _Num( lly), _Num( urx - llx), _Num( ury - lly)))
+        self._defs.append( '<g id="%s" clip-path="url(#%s_bbox)">%s</g>' % (name, name, body))
+        self._out = out
+        self._stack = stack
+
+    def doForm( self, name):
+        state = self._state
+        attrs = []
+        if state.fill is not _INHERIT:
+            attrs.append( 'fill="%s"' % state.fill)
+        if state.stroke is not _INHERIT:
+            attrs.append( 'stroke="%s"' % state.stroke)
+        if state.fillAlpha != 1:
+            attrs.append( 'fill-opacity="%s"' % _Num( state.fillAlpha))
+        if state.strokeAlpha != 1:
+            attrs.append( 'stroke-opacity="%s"' % _Num( state.strokeAlpha))
+        if state.blend:
+            attrs.append( 'style="mix-blend-mode:%s"' % state.blend)
+        self._out.append( '<use href="#%s" %s/>' % (name, " ".join( attrs)))
+
+
+class SvgCanvas(SvgCanvasBase):
+    '''
+    A canvas writing an SVG file of size <pagesize> points when saved,
+    converting the colours with <converter>, a ColorConverter.
+    '''
+
+    def __init__( self, filename, pagesize, converter=None):
+        super().__init__( pagesize, [], [], converter)
+        self.filename = filename
+        self._pages = []
+
+    #-----------------------------------------------------------------------
+    # Pages and output
+    #-----------------------------------------------------------------------
+
+    def showPage( self):
+        while len( self._stack) > 1:
+            self.restoreState()
+        self._out.append( "</g>" * self._state.groups)
+        self._pages.append( "".join( self._out))
+        self._out = []
+        self._stack = [_SvgState()]
+
+    def _PageFileName( self, pageNo):
+        if pageNo == 0:
+            return self.filename
+        base, dot, ext = self.filename.rpartition( '.')
+        if not dot:
+            return "%s-%d" % (self.filename, pageNo + 1)
+        return "%s-%d.%s" % (base, pageNo + 1, ext)
+
+    def Pages( self):
+        '''
+        Ends the current page and returns the SVG document of each page
+        as a string
+        '''
+        if self._out or not self._pages:
+            self.showPage()
+        width, height = self._pagesize
+        defs = "".join( self._defs)
+        documents = []
+        for body in self._pages:
+            documents.append(
+                _SvgHeader( width, height) +
+                '<defs>%s</defs>\n' % defs +
+                '<g transform="matrix(1 0 0 -1 0 %s)">%s</g>\n' % (_Num( height), body) +
+                '</svg>\n')
+        return documents
+
+    def save( self):
+        '''
+        Writes the SVG file. Any pages after the first are written to
+        files with the page number added to the name.
+        '''
+        for pageNo, document in enumerate( self.Pages()):
+            with open( self._PageFileName( pageNo), 'w', encoding='utf-8') as f:
+                f.write( document)
+
+
+class _StreamWriter(object):
+    '''
+    Collects the text appended to it and writes it to <stream> in chunks
+    of about <chunkSize> characters. The stream may be binary, like a
+    socket file, or text.
+    '''
+
+    def __init__( self, stream, chunkSize):
+        self.stream = stream
+        self.chunkSize = chunkSize
+        self.written = 0
+        self._binary = not hasattr( stream, 'encoding')
+        self._chunk = []
+        self._size = 0
+
+    def append( self, text):
+        if text:
+            self._chunk.append( text)
+            self._size += len( text)
+            if self._size >= self.chunkSize:
+                self.Flush( False)
+
+    def Flush( self, flushStream=True):
+        if self._chunk:
+            text = "".join( self._chunk)
+            self._chunk = []
+            self._size = 0
+            data = text.encode( 'utf-8') if self._binary else text
+            self.stream.write( data)
+            self.written += len( data)
+        if flushStream and hasattr( self.stream, 'flush'):
+            self.stream.flush()
+
+
+class _StreamDefs(object):
+    '''
+    Writes each definition appended to it at once, in a <defs> element
+    of its own. SVG allows <defs> anywhere, and <use> may refer to them
+    from anywhere in the document.
+    '''
+
+    def __init__( self, writer):
+        self.writer = writer
+
+    def append( self, text):
+        self.writer.append( '<defs>%s</defs>' % text)
+
+
+class SvgStreamCanvas(SvgCanvasBase):
+    '''
+    A canvas writing one SVG document to <stream> while it is drawn.
+    Begin() writes the start of the document, save() ends it; the
+    stream is not closed. The <pageCount> pages of the document are
+    placed below each other, a new one starting at each showPage().
+
+    Paths of more than <minSharedLength> characters of data are
+    remembered, up to the <maxShapes> most recently drawn. When one is
+    drawn again with the same paint, it is defined once and drawn with
+    <use> from then on.
+    '''
+
+    def __init__( self, stream, pagesize, chunkSize=16384, minSharedLength=48, maxShapes=4096, converter=None):
+        writer = _StreamWriter( stream, chunkSize)
+        super().__init__( pagesize, writer, _StreamDefs( writer), converter)
+        self._writer = writer
+        self._pageNo = 0
+        self._pageCount = None
+        self._shapes = collections.OrderedDict()    # (d, paint) -> id, None if drawn once
+        self._shapeCount = 0
+        self.minSharedLength = minSharedLength
+        self.maxShapes = maxShapes
+
+    def Begin( self, pageCount=1):
+        '''
+        Writes the start of the document and of the first page, and
+        sends it on at once
+        '''
+        self._pageCount = pageCount
+        width, height = self._pagesize
+        self._writer.append( _SvgHeader( width, height * pageCount))
+        self._BeginPage()
+        self._writer.Flush()
+
+    def _BeginPage( self):
+        self._writer.append( '<g transform="matrix(1 0 0 -1 0 %s)">' % _Num( self._pagesize[1] * (self._pageNo + 1)))
+
+    def ByteSize( self):
+        '''
+        Returns the number of bytes of the document so far
+        '''
+        return self._writer.written + self._writer._size
+
+    def drawPath( self, aPath, stroke=1, fill=0):
+        if not (stroke or fill):
+            return
+        d = SvgPathData( aPath.Compile())
+        paint = self._PaintAttributes( stroke, fill)
+        if len( d) < self.minSharedLength:
+            self._out.append( '<path d="%s" %s/>' % (d, paint))
+            return
+
+        key = (d, paint)
+        shapes = self._shapes
+        if key not in shapes:
+            shapes[key] = None
+            if len( shapes) > self.maxShapes:
+                shapes.popitem( last=False)
+            self._out.append( '<path d="%s" %s/>' % (d, paint))
+            return
+        shapes.move_to_end( key)
+        shapeId = shapes[key]
+        if shapeId is None:
+            self._shapeCount += 1
+            shapeId = shapes[key] = "s%d" % self._shapeCount
+            self._defs.append( '<path id="%s" d="%s" %s/>' % (shapeId, d, paint))
+        self._out.append( '<use href="#%s"/>' % shapeId)
+
+    def showPage( self):
+        while len( self._stack) > 1:
+            self.restoreState()
+        self._out.append( "</g>" * self._state.groups + "</g>")
+        self._stack = [_SvgState()]
+        self._pageNo += 1
+        self._BeginPage()
+        self._writer.Flush()
+
+    def save( self):
+        '''
+        Ends the document and flushes it to the stream
+        '''
+        if self._pageCount is None:
+            self.Begin()
+        while len( self._stack) > 1:
+            self.restoreState()
+        self._out.append( "</g>" * self._state.groups + "</g>\n</svg>\n")
+        self._writer.Flush()
@@ -0,0 +1,116 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Legend written as SVG while it is drawn, without reportlab
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+Draws a legend straight into an SvgStreamCanvas, for web previews. The
+document is sent to the file, pipe or socket while the symbols are drawn,
+so the first bytes go out as soon as the layout is done and the memory
+used does not grow with the size of the legend. All the pages are in one
+document, below each other:
+
+    python MSSSvgStream.py test-file.xml -o Legend.svg
+    python MSSSvgStream.py test-file.xml | gzip > Legend.svgz
+
+Nothing here imports reportlab.
+'''
+
+import sys
+import logging
+import argparse
+from MSSLegendDrawing import MSSLegendDrawer, mm
+from MSSSymbolModel import IterSpecs
+from MSSSvgCanvas import SvgStreamCanvas
+from MSSColorConvert import ConverterForSpec, LoadReferenceColors
+from MSSFragmentCache import FragmentCache, DefaultCacheDir
+from MSSError import MSSError, SpecStructureError
+
+
+log = logging.getLogger( __name__)
+
+# the size of an A4 page in points
+A4 = (210 * mm, 297 * mm)
+
+
+def StreamLegend( spec, stream, pagesize=A4, fragmentCache=None, profiler=None, converter=None):
+    '''
+    Draws the legend of the compiled <spec> as an SVG document written
+    to <stream>, a binary or text file, page by page as it is drawn. The
+    colours are converted by <converter>, by default the one given by
+    MSSColorConvert.ConverterForSpec().
+
+    Returns
+    -------
+    int
+        The number of bytes written
+    '''
+    theCanvas = SvgStreamCanvas( stream, pagesize, converter=converter or ConverterForSpec( spec))
+    drawer = MSSLegendDrawer( theCanvas, spec, fragmentCache, profiler=profiler)
+    theCanvas.Begin( drawer.PageCount())
+    theCanvas.scale( mm, mm)
+    drawer.DrawSymbols()
+    theCanvas.save()
+    log.info( "Wrote %d bytes of SVG", theCanvas.ByteSize())
+    return theCanvas.ByteSize()
+
+
+def main( argv=None):
+    parser = argparse.ArgumentParser(
+        prog='mss2svg',
+        description="Writes the legend of a Map Symbol Specification file as one SVG document.")
+    parser.add_argument( 'input', metavar='MSS', help="the MSS file")
+    parser.add_argument( '-o', '--output', default='-', help="output file (default: stdout)")
+    parser.add_argument( '--cache-dir', default=DefaultCacheDir(),
+                         help="directory of the symbol cache (default: %(default)s)")
+    parser.add_argument( '--no-cache', action='store_true',
+                         help="draw all symbols without using the symbol cache")
+    parser.add_argument( '--icc-profile', metavar='FILE',
+                         help="CMYK ICC profile for the colours (default: a local profile named by "
+                              "the ICC or ISO calibrations, else a naive conversion)")
+    parser.add_argument( '--reference-colors', metavar='JSON',
+                         help="sRGB colours of PMS, RAL and NCS calibration values")
+    parser.add_argument( '-v', '--verbose', action='store_true', help="log progress")
+    args = parser.parse_args( argv)
+
+    logging.basicConfig( format="%(levelname)s: %(message)s",
+                         level=logging.INFO if args.verbose else logging.WARNING)
+
+    fragmentCache = None if args.no_cache else FragmentCache( args.cache_dir)
+    try:
+        spec = next( IterSpecs( args.input), None)
+        if spec is None:
+            raise SpecStructureError( "Element <MapSymbolsSpec> not found", fileName=args.input)
+        references = LoadReferenceColors( args.reference_colors) if args.reference_colors else None
+        converter = ConverterForSpec( spec, args.icc_profile, references)
+        if args.output == '-':
+            StreamLegend( spec, sys.stdout.buffer, fragmentCache=fragmentCache, converter=converter)
+        else:
+            with open( args.output, 'wb') as f:
+                StreamLegend( spec, f, fragmentCache=fragmentCache, converter=converter)
+    except MSSError as e:
+        print( e.AddContext( fileName=args.input), file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # the reader went away, like head or a closed connection
+        return 1
+    except OSError as e:
+        print( "%s: %s" % (e.filename, e.strerror), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit( main())
@@ -0,0 +1,831 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Compiled, immutable model of an MSS file
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+The renderer never looks at the XML directly. CompileSpec() walks the
+<BaseColors>, <ColorLayers> and <Symbols> elements once, parses every number
+and resolves every colour layer reference, and returns a tree of small
+immutable objects. After compiling, the ElementTree can be dropped.
+
+IterSpecs() compiles while reading the file, one symbol at a time, without
+ever holding the whole tree. It also reads bundles of several specs.
+'''
+
+import bisect
+import hashlib
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from MSSPath import ParseStrokeDash, CompileSvgPath
+from MSSColor import ColorTable, BLEND_MODES
+from MSSError import MSSError, SpecSyntaxError, SpecStructureError, ColorError, SymbolError
+
+
+# Index of the stroke-linecap and stroke-linejoin values, as used by PDF.
+# 'pointed' is not a PDF line cap and is handled by the renderer.
+LINE_CAPS = {'butt': 0, 'but': 0, 'round': 1, 'square': 2, 'pointed': 3}
+LINE_JOINS = {'miter': 0, 'round': 1, 'bevel': 2}
+
+
+class _Frozen(object):
+    '''
+    Base class of all model objects. Attributes are set once by the
+    constructor and may not be changed afterwards.
+    '''
+    __slots__ = ()
+
+    def _Init( self, **values):
+        for name, value in values.items():
+            object.__setattr__( self, name, value)
+
+    def __setattr__( self, name, value):
+        raise AttributeError( "%s objects are immutable" % type(self).__name__)
+
+    def __delattr__( self, name):
+        raise AttributeError( "%s objects are immutable" % type(self).__name__)
+
+    # pickling, to send compiled specs to worker processes
+    def __getstate__( self):
+        return {name: getattr( self, name) for cls in type(self).__mro__
+                for name in getattr( cls, '__slots__', ()) if hasattr( self, name)}
+
+    def __setstate__( self, state):
+        self._Init( **state)
+
+    def __repr__( self):
+        return "<%s %s>" % (type(self).__name__, getattr( self, 'id', ''))
+
+
+class BaseColor(_Frozen):
+    '''
+    A <color> of the <BaseColors> section. cmyk is a tuple of four floats
+    in the range 0 to 1, calibrations a tuple of (standard, value) pairs.
+    '''
+    __slots__ = ('id', 'cmyk', 'calibrations')
+
+    def __init__( self, id, cmyk, calibrations=()):
+        self._Init( id=id, cmyk=cmyk, calibrations=calibrations)
+
+
+class ColorLayer(_Frozen):
+    '''
+    A <layer> of the <ColorLayers> section with its base color resolved.
+    index is the position of the layer in <ColorLayers>, the first layer
+    (index 0) is painted on top.
+    '''
+    __slots__ = ('id', 'name', 'color', 'tint', 'overprint', 'opacity', 'blend', 'index')
+
+    def __init__( self, id, name, color, tint=1.0, overprint=False, opacity=1.0, blend='normal', index=0):
+        self._Init( id=id, name=name, color=color, tint=tint, overprint=overprint,
+                    opacity=opacity, blend=blend, index=index)
+
+
+class StrokeStyle(_Frozen):
+    '''
+    The stroke-* attributes of a graphical element. Identical styles are
+    shared between elements by the compiler.
+    '''
+    __slots__ = ('width', 'lineCap', 'lineJoin', 'miterLimit', 'dashArray',
+                 'dashOffset', 'offset', 'capLength')
+
+    def __init__( self, width, lineCap=0, lineJoin=0, miterLimit=4.0, dashArray=(),
+                  dashOffset=0.0, offset=0.0, capLength=None):
+        self._Init( width=width, lineCap=lineCap, lineJoin=lineJoin, miterLimit=miterLimit,
+                    dashArray=dashArray, dashOffset=dashOffset, offset=offset,
+                    capLength=capLength)
+
+
+class PathPart(_Frozen):
+    '''
+    A <path> element. fill and stroke are ColorLayer objects or None,
+    d is None for the paths of line and area symbols.
+    '''
+    __slots__ = ('fill', 'stroke', 'style', 'd')
+    tag = 'path'
+
+    def __init__( self, fill, stroke, style, d):
+        self._Init( fill=fill, stroke=stroke, style=style, d=d)
+
+
+class CirclePart(_Frozen):
+    '''
+    A <circle> element.
+    '''
+    __slots__ = ('fill', 'stroke', 'style', 'cx', 'cy', 'r')
+    tag = 'circle'
+
+    def __init__( self, fill, stroke, style, cx, cy, r):
+        self._Init( fill=fill, stroke=stroke, style=style, cx=cx, cy=cy, r=r)
+
+
+class RectPart(_Frozen):
+    '''
+    A <rect> element, x and y being the lower left corner.
+    '''
+    __slots__ = ('fill', 'stroke', 'style', 'x', 'y', 'width', 'height')
+    tag = 'rect'
+
+    def __init__( self, fill, stroke, style, x, y, width, height):
+        self._Init( fill=fill, stroke=stroke, style=style, x=x, y=y,
+                    width=width, height=height)
+
+
+class Hatch(_Frozen):
+    '''
+    A <hatch> element of an area symbol.
+    '''
+    __slots__ = ('stroke', 'style', 'spacing', 'rotation', 'offset')
+    tag = 'hatch'
+    fill = None
+
+    def __init__( self, stroke, style, spacing, rotation=0.0, offset=0.0):
+        self._Init( stroke=stroke, style=style, spacing=spacing, rotation=rotation,
+                    offset=offset)
+
+
+class Pattern(_Frozen):
+    '''
+    A <pattern> element of an area symbol. parts holds the graphical elements
+    of one tile. key is the digest of the canonical XML of the pattern, equal
+    patterns have equal keys, also across specs.
+    '''
+    __slots__ = ('x', 'y', 'width', 'height', 'rotation', 'tiling', 'clip', 'parts', 'key')
+    tag = 'pattern'
+
+    def __init__( self, x, y, width, height, rotation, tiling, clip, parts, key):
+        self._Init( x=x, y=y, width=width, height=height, rotation=rotation,
+                    tiling=tiling, clip=clip, parts=parts, key=key)
+
+
+class StrokeDecoration(_Frozen):
+    '''
+    A <stroke-decoration> element of a line symbol. spacing and offset are
+    None when not specified.
+    '''
+    __slots__ = ('type', 'spacing', 'offset', 'parts')
+    tag = 'stroke-decoration'
+
+    def __init__( self, type, spacing, offset, parts):
+        self._Init( type=type, spacing=spacing, offset=offset, parts=parts)
+
+
+class Symbol(_Frozen):
+    '''
+    A <symbol> element. parts holds the graphical elements in document order.
+    digest is the digest of the canonical XML of the symbol element, see
+    CanonicalDigest().
+    '''
+    __slots__ = ('id', 'name', 'type', 'rotatable', 'outline', 'description', 'parts', 'digest')
+    tag = 'symbol'
+
+    def __init__( self, id, name, type, rotatable, outline, description, parts, digest=None):
+        self._Init( id=id, name=name, type=type, rotatable=rotatable, outline=outline,
+                    description=description, parts=parts, digest=digest)
+
+
+def SymbolIdKey( symbolId):
+    '''
+    Returns the sort key of a symbol id. Ids are compared number by number,
+    so "105.1" comes after "105" and before "105.2", and "1001" after "999".
+    '''
+    return tuple( (0, int( n), '') if n.isdigit() else (1, 0, n) for n in symbolId.split( '.'))
+
+
+class SymbolSpec(_Frozen):
+    '''
+    A compiled <MapSymbolsSpec>. The colorLayers are in document order, i.e.
+    top layer first. colors is the MSSColor.ColorTable of the layers.
+
+    The symbols are indexed by id (symbolsById), by the layers they paint
+    on (symbolsByLayer, layer id -> tuple of Symbol in document order) and
+    by sorted id (idKeys, the sorted SymbolIdKey of all ids, and idOrder,
+    the symbols in the same order), see Select().
+    '''
+    __slots__ = ('id', 'version', 'language', 'baseColors', 'colorLayers', 'symbols',
+                 'layersById', 'symbolsById', 'colors', 'symbolsByLayer', 'idKeys', 'idOrder',
+                 '_positions')
+
+    def __init__( self, id, version, language, baseColors, colorLayers, symbols, colors=None):
+        symbolsByLayer = {}
+        for symbol in symbols:
+            for layerId in dict.fromkeys( layer.id for part in symbol.parts for layer in GetPartLayers( part)):
+                symbolsByLayer.setdefault( layerId, []).append( symbol)
+        byKey = sorted( (SymbolIdKey( symbol.id), position) for position, symbol in enumerate( symbols))
+
+        self._Init( id=id, version=version, language=language, baseColors=baseColors,
+                    colorLayers=colorLayers, symbols=symbols,
+                    layersById={ layer.id: layer for layer in colorLayers},
+                    symbolsById={ symbol.id: symbol for symbol in symbols},
+                    colors=colors if colors is not None else ColorTable( colorLayers),
+                    symbolsByLayer={ layerId: tuple( s) for layerId, s in symbolsByLayer.items()},
+                    idKeys=[key for key, _ in byKey],
+                    idOrder=tuple( symbols[position] for _, position in byKey),
+                    _positions={ symbol.id: position for position, symbol in enumerate( symbols)})
+
+    def Subset( self, symbols):
+        '''
+        Returns a spec with the same colours and layers, holding only
+        <symbols>, a sequence of Symbol of this spec
+        '''
+        return SymbolSpec( self.id, self.version, self.language, self.baseColors,
+                           self.colorLayers, tuple( symbols), self.colors)
+
+    def Select( self, ids=None, first=None, last=None, types=None, layers=None):
+        '''
+        Returns the symbols matching all the given criteria, in document
+        order. Uses the indexes, so only the matching symbols are visited.
+
+        Parameters
+        ----------
+        ids : sequence of string, optional
+            The symbol ids
+        first, last : string, optional
+            The range of ids, both included, compared by SymbolIdKey()
+        types : sequence of string, optional
+            The symbol types, like 'point', 'line' and 'area'
+        layers : sequence of string, optional
+            Layer ids, the symbols painting on any of them
+
+        Raises
+        ------
+        MSSError
+            An unknown symbol id or layer id
+
+        '''
+        if ids is not None:
+            missing = [symbolId for symbolId in ids if symbolId not in self.symbolsById]
+            if missing:
+                raise MSSError( "Unknown symbol %s", ", ".join( missing))
+            candidates = [self.symbolsById[symbolId] for symbolId in dict.fromkeys( ids)]
+        elif (first is not None) or (last is not None):
+            start = 0 if first is None else bisect.bisect_left( self.idKeys, SymbolIdKey( first))
+            stop = len( self.idKeys) if last is None else bisect.bisect_right( self.idKeys, SymbolIdKey( last))
+            candidates = self.idOrder[start:stop]
+            first = last = None
+        elif layers is not None:
+            candidates = self._SymbolsOnLayers( layers)
+            layers = None
+        else:
+            candidates = self.symbols
+
+        if (first is not None) or (last is not None):
+            low = SymbolIdKey( first) if first is not None else None
+            high = SymbolIdKey( last) if last is not None else None
+            candidates = [s for s in candidates
+                          if ((low is None) or (SymbolIdKey( s.id) >= low)) and ((high is None) or (SymbolIdKey( s.id) <= high))]
+        if types is not None:
+            candidates = [s for s in candidates if s.type in types]
+        if layers is not None:
+            onLayers = set( self._SymbolsOnLayers( layers))
+            candidates = [s for s in candidates if s in onLayers]
+        return tuple( sorted( candidates, key=lambda s: self._positions[s.id]))
+
+    def _SymbolsOnLayers( self, layers):
+        unknown = [layerId for layerId in layers if layerId not in self.layersById]
+        if unknown:
+            raise MSSError( "Unknown layer %s", ", ".join( unknown))
+        symbols = {}
+        for layerId in layers:
+            symbols.update( dict.fromkeys( self.symbolsByLayer.get( layerId, ())))
+        return list( symbols)
+
+
+def GetPartLayers( part):
+    '''
+    Returns the layers <part> paints on, without duplicates and in the order
+    fill before stroke. For patterns and stroke decorations, these are
+    the layers of their graphical elements.
+    '''
+    if part.tag in ('pattern', 'stroke-decoration'):
+        candidates = []
+        for subPart in part.parts:
+            candidates.extend( (subPart.fill, subPart.stroke))
+    else:
+        candidates = (part.fill, part.stroke)
+
+    layers = []
+    for layer in candidates:
+        if (layer is not None) and (layer not in layers):
+            layers.append( layer)
+    return layers
+
+
+def CanonicalDigest( xmlElement):
+    '''
+    Returns the SHA-256 hex digest of the canonical XML (C14N 2.0) of
+    <xmlElement>, ignoring whitespace between elements. Formatting and
+    attribute order do not change the digest.
+    '''
+    text = ET.tostring( xmlElement, encoding='unicode').strip()
+    canonical = ET.canonicalize( text, strip_text=True)
+    return hashlib.sha256( canonical.encode( 'utf-8')).hexdigest()
+
+
+def _Float( xmlElement, name, default=None):
+    '''
+    Returns the attribute <name> of <xmlElement> as a float, or <default>
+    if the attribute is missing.
+    '''
+    value = xmlElement.attrib.get( name)
+    if value is None:
+        return default
+    try:
+        return float( value)
+    except ValueError:
+        raise SymbolError( "Attribute %s=\"%s\" of <%s> is not a number", (name, value, xmlElement.tag)) from None
+
+
+def _Required( xmlElement, name, errorClass=SymbolError):
+    '''
+    Returns the attribute <name> of <xmlElement>, which shall be present
+    '''
+    value = xmlElement.attrib.get( name)
+    if value is None:
+        raise errorClass( "<%s> has no %s attribute", (xmlElement.tag, name))
+    return value
+
+
+def _Positive( xmlElement, name):
+    '''
+    Returns the attribute <name> of <xmlElement>, which shall be present
+    and a number greater than 0
+    '''
+    value = _Float( xmlElement, name)
+    if value is None:
+        raise SymbolError( "<%s> has no %s attribute", (xmlElement.tag, name))
+    if value <= 0:
+        raise SymbolError( "Attribute %s=\"%s\" of <%s> shall be greater than 0",
+                           (name, xmlElement.attrib[name], xmlElement.tag))
+    return value
+
+
+def ParseSpecFile( source):
+    '''
+    Parses an MSS file like ET.parse(), and records the line number of
+    each element, so errors can tell where they are.
+
+    Parameters
+    ----------
+    source : string or file object
+        The file name, or a binary file object
+
+    Returns
+    -------
+    ElementTree, dict
+        The parsed tree, and a dict from element to its line number
+
+    '''
+    builder = ET.TreeBuilder()
+    lines = {}
+    parser = expat.ParserCreate()
+
+    def Start( tag, attrib):
+        lines[builder.start( tag, attrib)] = parser.CurrentLineNumber
+
+    parser.StartElementHandler = Start
+    parser.EndElementHandler = builder.end
+    parser.CharacterDataHandler = builder.data
+    parser.buffer_text = True
+
+    fileName = source if isinstance( source, str) else getattr( source, 'name', None)
+    try:
+        if isinstance( source, str):
+            with open( source, 'rb') as f:
+                parser.ParseFile( f)
+        else:
+            parser.ParseFile( source)
+        root = builder.close()
+    except expat.ExpatError as e:
+        raise SpecSyntaxError( expat.ErrorString( e.code), line=e.lineno, fileName=fileName) from None
+    return ET.ElementTree( root), lines
+
+
+def _AsMSSError( error, xmlElement):
+    '''
+    Returns <error> as an MSSError. KeyError and ValueError from parsing
+    <xmlElement> become a SymbolError.
+    '''
+    if isinstance( error, MSSError):
+        return error
+    return SymbolError( "Illegal value in <%s>: %s", (xmlElement.tag, error))
+
+
+class _SpecStream(object):
+    '''
+    The expat handlers of IterSpecs(). Builds the elements of one
+    <MapSymbolsSpec> at a time, and compiles each section and each symbol
+    as soon as it is closed, then drops its elements. Completed specs are
+    appended to <specs>.
+    '''
+
+    def __init__( self, parser, skipDescriptions, errors):
+        self.parser = parser
+        self.skipDescriptions = skipDescriptions
+        self.errors = errors
+        self.specs = []
+        self.builder = None     # TreeBuilder of the spec being read, None between specs
+        self.skipDepth = 0      # > 0 inside a skipped element
+
+    def Start( self, tag, attrib):
+        if self.skipDepth:
+            self.skipDepth += 1
+            return
+        if self.builder is None:
+            if tag != 'MapSymbolsSpec':
+                # the elements wrapping the specs of a bundle
+                return
+            self.builder = ET.TreeBuilder()
+            self.stack = []
+            self.lines = {}
+            self.compiler = _SpecCompiler( self.lines, self.errors)
+            self.sections = {}
+            self.symbols = []
+        elif self.skipDescriptions and (tag == 'description'):
+            self.skipDepth = 1
+            return
+        element = self.builder.start( tag, attrib)
+        self.lines[element] = self.parser.CurrentLineNumber
+        self.stack.append( element)
+
+    def End( self, tag):
+        if self.skipDepth:
+            self.skipDepth -= 1
+            return
+        if self.builder is None:
+            return
+        element = self.builder.end( tag)
+        self.stack.pop()
+        depth = len( self.stack)
+
+        if depth == 0:
+            self.EndSpec( element)
+        elif depth == 1:
+            if tag == 'BaseColors':
+                self.compiler.CompileBaseColors( element)
+            elif tag == 'ColorLayers':
+                self.compiler.CompileColorLayers( element)
+            self.sections[tag] = element
+            self.Drop( element)
+        elif (depth == 2) and (tag == 'symbol') and (self.stack[-1].tag == 'Symbols'):
+            symbol = self.compiler.CompileSymbolElement( element)
+            if symbol is not None:
+                self.symbols.append( symbol)
+            self.stack[-1].remove( element)
+            self.Drop( element)
+            self.lines.pop( element, None)
+
+    def Data( self, data):
+        if (self.builder is not None) and not self.skipDepth:
+            self.builder.data( data)
+
+    def Drop( self, element):
+        '''
+        Removes the children of a compiled <element>
+        '''
+        for child in element.iter():
+            if child is not element:
+                self.lines.pop( child, None)
+        element.clear()
+
+    def EndSpec( self, xmlRoot):
+        self.builder.close()
+        for section in ("BaseColors", "ColorLayers", "Symbols"):
+            if section not in self.sections:
+                raise SpecStructureError( "Element <%s> not found", section, line=self.lines.get( xmlRoot))
+        self.specs.append( SymbolSpec(
+            xmlRoot.attrib.get( 'id'), xmlRoot.attrib.get( 'version'), xmlRoot.attrib.get( 'language', 'en'),
+            tuple( self.compiler.baseColors.values()), tuple( self.compiler.layers.values()), tuple( self.symbols)))
+        self.builder = None
+        self.stack = self.lines = self.compiler = self.sections = self.symbols = None
+
+
+def IterSpecs( source, skipDescriptions=False, errors=None, chunkSize=64 * 1024):
+    '''
+    Reads an MSS file piece by piece and yields a compiled SymbolSpec for
+    each <MapSymbolsSpec> in it, as soon as it is read. A file may be a
+    single spec, or a bundle with several specs inside any root element.
+
+    Each <symbol> is compiled when it is closed, and its elements are
+    dropped, so the memory used is bounded by the largest symbol, not by
+    the size of the file.
+
+    Parameters
+    ----------
+    source : string or file object
+        The file name, or a binary file object
+    skipDescriptions : bool
+        Do not read the <description> of the symbols. Their description
+        is None, and they get another digest than when read in full.
+    errors : list, optional
+        Collect-all-errors mode, see CompileSpec()
+    chunkSize : int
+        The number of bytes read at a time
+
+    Raises
+    ------
+    MSSError
+        The first error in the file, unless <errors> is given
+
+    '''
+    parser = expat.ParserCreate()
+    stream = _SpecStream( parser, skipDescriptions, errors)
+    parser.StartElementHandler = stream.Start
+    parser.EndElementHandler = stream.End
+    parser.CharacterDataHandler = stream.Data
+    parser.buffer_text = True
+
+    fileName = source if isinstance( source, str) else getattr( source, 'name', None)
+    f = open( source, 'rb') if isinstance( source, str) else source
+    try:
+        while True:
+            data = f.read( chunkSize)
+            try:
+                parser.Parse( data, not data)
+            except expat.ExpatError as e:
+                raise SpecSyntaxError( expat.ErrorString( e.code), line=e.lineno, fileName=fileName) from None
+            except MSSError as e:
+                raise e.AddContext( fileName=fileName)
+            while stream.specs:
+                yield stream.specs.pop( 0)
+            if not data:
+                break
+    finally:
+        if f is not source:
+            f.close()
+
+
+class _SpecCompiler(object):
+    '''
+    Holds the state needed while compiling one spec: the resolved layers
+    and the shared stroke styles. Errors get the element path and, when
+    <sourceLines> is given, the line number added. If <errors> is a list,
+    errors are appended to it and the element in error is left out.
+    '''
+
+    def __init__( self, sourceLines=None, errors=None):
+        self.baseColors = {}
+        self.layers = {}
+        self.styles = {}
+        self.sourceLines = sourceLines if sourceLines is not None else {}
+        self.errors = errors
+
+    def Failed( self, error, xmlElement, path, symbolId=None):
+        '''
+        Adds the location of <xmlElement> to <error>, a MSSError, KeyError
+        or ValueError, and raises it, or records it in collect-all-errors
+        mode.
+        '''
+        error = _AsMSSError( error, xmlElement)
+        error.AddContext( symbolId=symbolId, path=path, line=self.sourceLines.get( xmlElement))
+        if self.errors is None:
+            raise error
+        self.errors.append( error)
+
+    def CompileBaseColors( self, xmlBaseColors):
+        for xmlColor in xmlBaseColors.findall( 'color'):
+            colorId = xmlColor.attrib.get( 'id')
+            try:
+                colorId = _Required( xmlColor, 'id', ColorError)
+                try:
+                    cmyk = tuple( float(x) for x in _Required( xmlColor, 'cmyk', ColorError).split(','))
+                except ValueError:
+                    raise ColorError( "Color %s: cmyk is not a list of numbers", colorId) from None
+                if len(cmyk) != 4:
+                    raise ColorError( "Color %s: cmyk shall have four values", colorId)
+            except MSSError as e:
+                self.Failed( e, xmlColor, "BaseColors/color[@id='%s']" % colorId)
+                continue
+            calibrations = tuple( (c.attrib.get('standard'), c.attrib.get('value'))
+                                  for c in xmlColor.findall( 'calibration'))
+            self.baseColors[colorId] = BaseColor( colorId, cmyk, calibrations)
+        return tuple( self.baseColors.values())
+
+    def CompileColorLayers( self, xmlColorLayers):
+        for xmlLayer in xmlColorLayers.findall( 'layer'):
+            layerId = xmlLayer.attrib.get( 'id')
+            try:
+                layerId = _Required( xmlLayer, 'id', ColorError)
+                colorId = _Required( xmlLayer, 'color', ColorError)
+                if colorId not in self.baseColors:
+                    raise ColorError( "Layer %s refers to unknown color %s", (layerId, colorId))
+                blend = xmlLayer.attrib.get( 'blend', 'normal')
+                if blend not in BLEND_MODES:
+                    raise ColorError( "Layer %s: unknown blend mode %s", (layerId, blend))
+                layer = ColorLayer(
+                    layerId,
+                    xmlLayer.attrib.get( 'name', layerId),
+                    self.baseColors[colorId],
+                    tint=_Float( xmlLayer, 'tint', 1.0),
+                    overprint=(xmlLayer.attrib.get( 'overprint') == 'yes'),
+                    opacity=_Float( xmlLayer, 'opacity', 1.0),
+                    blend=blend,
+                    index=len(self.layers))
+            except MSSError as e:
+                self.Failed( e, xmlLayer, "ColorLayers/layer[@id='%s']" % layerId)
+                continue
+            self.layers[layerId] = layer
+        return tuple( self.layers.values())
+
+    def CompileSymbols( self, xmlSymbols):
+        symbols = []
+        for xmlSymbol in xmlSymbols.findall( 'symbol'):
+            symbol = self.CompileSymbolElement( xmlSymbol)
+            if symbol is not None:
+                symbols.append( symbol)
+        return tuple( symbols)
+
+    def CompileSymbolElement( self, xmlSymbol):
+        '''
+        Compiles one <symbol>. Returns None if it is in error in
+        collect-all-errors mode.
+        '''
+        symbolId = xmlSymbol.attrib.get( 'id')
+        path = "Symbols/symbol[@id='%s']" % symbolId
+        try:
+            return self.CompileSymbol( xmlSymbol, path)
+        except (MSSError, KeyError, ValueError) as e:
+            self.Failed( e, xmlSymbol, path, symbolId)
+        return None
+
+    def CompileSymbol( self, xmlSymbol, path):
+        symbolId = _Required( xmlSymbol, 'id')
+        description = None
+        xmlDescription = xmlSymbol.find( 'description')
+        if xmlDescription is not None:
+            description = "".join( xmlDescription.itertext()).strip()
+
+        return Symbol(
+            symbolId,
+            xmlSymbol.attrib.get( 'name', ''),
+            _Required( xmlSymbol, 'type'),
+            xmlSymbol.attrib.get( 'rotatable') == 'yes',
+            xmlSymbol.attrib.get( 'outline'),
+            description,
+            self.CompileParts( xmlSymbol, symbolId, path),
+            CanonicalDigest( xmlSymbol))
+
+    def CompileParts( self, xmlParent, symbolId, path):
+        '''
+        Compiles the children of <xmlParent>. A part in error is raised at
+        once, with its location, so the symbol is not compiled further.
+        '''
+        parts = []
+        counts = {}
+        for xmlPart in xmlParent:
+            counts[xmlPart.tag] = counts.get( xmlPart.tag, 0) + 1
+            partPath = "%s/%s[%d]" % (path, xmlPart.tag, counts[xmlPart.tag])
+            try:
+                part = self.CompilePart( xmlPart, symbolId, partPath)
+            except (MSSError, KeyError, ValueError) as e:
+                raise _AsMSSError( e, xmlPart).AddContext( path=partPath, line=self.sourceLines.get( xmlPart))
+            if part is not None:
+                parts.append( part)
+        return tuple( parts)
+
+    def CompilePart( self, xmlPart, symbolId, path):
+        tag = xmlPart.tag
+        if tag == 'path':
+            d = xmlPart.attrib.get( 'd')
+            if d is not None:
+                # fails early on bad path data, and warms the path cache
+                CompileSvgPath( d)
+            return PathPart( self.Layer( xmlPart, 'fill'), self.Layer( xmlPart, 'stroke'),
+                             self.Style( xmlPart), d)
+        if tag == 'circle':
+            return CirclePart( self.Layer( xmlPart, 'fill'), self.Layer( xmlPart, 'stroke'),
+                               self.Style( xmlPart),
+                               _Float( xmlPart, 'cx', 0.0), _Float( xmlPart, 'cy', 0.0), _Float( xmlPart, 'r', 0.0))
+        if tag == 'rect':
+            return RectPart( self.Layer( xmlPart, 'fill'), self.Layer( xmlPart, 'stroke'),
+                             self.Style( xmlPart),
+                             _Float( xmlPart, 'x', 0.0), _Float( xmlPart, 'y', 0.0),
+                             _Float( xmlPart, 'width', 0.0), _Float( xmlPart, 'height', 0.0))
+        if tag in ('hatch', 'hatch-pattern'):
+            return Hatch( self.Layer( xmlPart, 'stroke'), self.Style( xmlPart),
+                          _Positive( xmlPart, 'spacing'),
+                          rotation=_Float( xmlPart, 'rotation', 0.0),
+                          offset=_Float( xmlPart, 'offset', 0.0))
+        if tag == 'pattern':
+            return Pattern( _Float( xmlPart, 'x', 0.0), _Float( xmlPart, 'y', 0.0),
+                            _Positive( xmlPart, 'width'), _Positive( xmlPart, 'height'),
+                            _Float( xmlPart, 'rotation', 0.0),
+                            xmlPart.attrib.get( 'tiling', 'regular'),
+                            xmlPart.attrib.get( 'clip', 'yes'),
+                            self.CompileParts( xmlPart, symbolId, path),
+                            CanonicalDigest( xmlPart))
+        if tag == 'stroke-decoration':
+            kind = xmlPart.attrib.get( 'type', 'regular')
+            if kind == 'regular':
+                spacing = _Positive( xmlPart, 'spacing')
+                offset = _Float( xmlPart, 'offset')
+                if offset is None:
+                    raise SymbolError( "<%s> has no %s attribute", (tag, 'offset'))
+            else:
+                spacing = _Float( xmlPart, 'spacing')
+                offset = _Float( xmlPart, 'offset')
+            return StrokeDecoration( kind, spacing, offset, self.CompileParts( xmlPart, symbolId, path))
+        # <description>, <text> and unknown elements are not drawn
+        return None
+
+    def Layer( self, xmlPart, attribute):
+        '''
+        Resolves the fill or stroke attribute of <xmlPart> into a ColorLayer
+        '''
+        layerId = xmlPart.attrib.get( attribute)
+        if layerId is None:
+            return None
+        layer = self.layers.get( layerId)
+        if layer is None:
+            raise SymbolError( "%s refers to unknown layer %s", (attribute, layerId))
+        return layer
+
+    def Style( self, xmlPart):
+        '''
+        Returns the shared StrokeStyle of <xmlPart>, or None if it is not stroked.
+        '''
+        attrib = xmlPart.attrib
+        if 'stroke' not in attrib:
+            return None
+        if 'stroke-width' not in attrib:
+            raise SymbolError( "stroked <%s> has no stroke-width", xmlPart.tag)
+
+        lineCap = attrib.get( 'stroke-linecap', 'butt')
+        lineJoin = attrib.get( 'stroke-linejoin', 'miter')
+        if lineCap not in LINE_CAPS:
+            raise SymbolError( "illegal stroke-linecap \"%s\"", lineCap)
+        if lineJoin not in LINE_JOINS:
+            raise SymbolError( "illegal stroke-linejoin \"%s\"", lineJoin)
+
+        try:
+            dashArray, dashOffset = ParseStrokeDash( xmlPart)
+        except ValueError:
+            raise SymbolError( "illegal stroke-dasharray or stroke-dashoffset") from None
+        key = (_Float( xmlPart, 'stroke-width'),
+               LINE_CAPS[lineCap],
+               LINE_JOINS[lineJoin],
+               _Float( xmlPart, 'stroke-miterlimit', 4.0),
+               tuple( dashArray),
+               dashOffset,
+               _Float( xmlPart, 'stroke-offset', 0.0),
+               _Float( xmlPart, 'stroke-caplength'))
+        style = self.styles.get( key)
+        if style is None:
+            style = StrokeStyle( *key)
+            self.styles[key] = style
+        return style
+
+
+def CompileSpec( xmlRoot, sourceLines=None, errors=None):
+    '''
+    Compiles a <MapSymbolsSpec> element into a SymbolSpec.
+
+    Parameters
+    ----------
+    xmlRoot : xml.etree.ElementTree "MapSymbolsSpec" element
+        The root element of an MSS file.
+    sourceLines : dict, optional
+        The line number of each element, see ParseSpecFile()
+    errors : list, optional
+        Collect-all-errors mode: every error found is appended to the
+        list, and the colors, layers and symbols in error are left out
+        of the spec, instead of raising the first error.
+
+    Raises
+    ------
+    MSSError
+        The first error in the spec, unless <errors> is given. A missing
+        section is always raised.
+
+    Returns
+    -------
+    SymbolSpec
+        The compiled spec. It holds no references to the XML elements.
+
+    '''
+    if (xmlRoot.tag != "MapSymbolsSpec"):
+        raise SpecStructureError( "Element <MapSymbolsSpec> not found")
+
+    for section in ("BaseColors", "ColorLayers", "Symbols"):
+        if xmlRoot.find( section) is None:
+            raise SpecStructureError( "Element <%s> not found", section, line=(sourceLines or {}).get( xmlRoot))
+
+    compiler = _SpecCompiler( sourceLines, errors)
+    baseColors = compiler.CompileBaseColors( xmlRoot.find( "BaseColors"))
+    colorLayers = compiler.CompileColorLayers( xmlRoot.find( "ColorLayers"))
+    symbols = compiler.CompileSymbols( xmlRoot.find( "Symbols"))
+
+    return SymbolSpec( xmlRoot.attrib.get( 'id'), xmlRoot.attrib.get( 'version'),
+                       xmlRoot.attrib.get( 'language', 'en'), baseColors, colorLayers, symbols)
@@ -0,0 +1,230 @@
+#---------------------------------------------------------------------------
+#  MMS2Legend:   Generator of synthetic MSS files for benchmarks
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#---------------------------------------------------------------------------
+
+'''
+Writes valid MSS files of any size, with a mix of point, line and area
+symbols like a real map symbol set. The same parameters and seed always
+give the same file:
+
+    python MSSSyntheticSpec.py --symbols 2000 --layers 12 -o big.xml
+'''
+
+import sys
+import math
+import random
+import argparse
+from xml.sax.saxutils import quoteattr
+
+
+class SyntheticSpecParams(object):
+    '''
+    The parameters of GenerateSpec().
+
+    symbols             number of symbols, a third each of point, line and area
+    layers              number of colour layers
+    pathComplexity      number of vertices of the paths of point symbols and
+                        decorations
+    patternDensity      fraction of area symbols filled with a pattern
+    patternTile         size of the pattern tiles in mm, smaller gives more tiles
+    hatchDensity        fraction of area symbols with a hatch
+    hatchSpacing        spacing of the hatch lines in mm
+    decorationDensity   fraction of line symbols with stroke decorations
+    decorationSpacing   spacing of regular stroke decorations in mm
+    seed                seed of the random choices
+    '''
+    __slots__ = ('symbols', 'layers', 'pathComplexity', 'patternDensity', 'patternTile',
+                 'hatchDensity', 'hatchSpacing', 'decorationDensity', 'decorationSpacing', 'seed')
+
+    def __init__( self, symbols=300, layers=8, pathComplexity=8, patternDensity=0.2, patternTile=0.8,
+                  hatchDensity=0.2, hatchSpacing=0.3, decorationDensity=0.3, decorationSpacing=1.0, seed=1):
+        self.symbols = symbols
+        self.layers = layers
+        self.pathComplexity = pathComplexity
+        self.patternDensity = patternDensity
+        self.patternTile = patternTile
+        self.hatchDensity = hatchDensity
+        self.hatchSpacing = hatchSpacing
+        self.decorationDensity = decorationDensity
+        self.decorationSpacing = decorationSpacing
+        self.seed = seed
+
+    def AsDict( self):
+        return { name: getattr( self, name) for name in self.__slots__}
+
+
+def _Num( value):
+    return ("%.3f" % value).rstrip( '0').rstrip( '.')
+
+
+def _StarPath( rnd, vertices, radius):
+    '''
+    Returns the "d" of a closed star shaped path, half of the segments curves
+    '''
+    points = []
+    for i in range( vertices):
+        angle = 2 * math.pi * i / vertices
+        r = radius * rnd.uniform( 0.5, 1.0)
+        points.append( (r * math.cos( angle), r * math.sin( angle)))
+    d = ["M %s %s" % (_Num( points[0][0]), _Num( points[0][1]))]
+    for i in range( 1, vertices):
+        x, y = points[i]
+        if i % 2:
+            px, py = points[i - 1]
+            d.append( "C %s %s %s %s %s %s" % (_Num( px * 1.2), _Num( py * 1.2), _Num( x * 1.2), _Num( y * 1.2),
+                                               _Num( x), _Num( y)))
+        else:
+            d.append( "L %s %s" % (_Num( x), _Num( y)))
+    d.append( "Z")
+    return " ".join( d)
+
+
+def _Attributes( **attributes):
+    return "".join( ' %s=%s' % (name.replace( '_', '-'), quoteattr( str( value)))
+                    for name, value in attributes.items() if value is not None)
+
+
+def _PointSymbol( rnd, params, symbolId, layers):
+    lines = ['        <symbol type="point" id="%s" name="Point %s">' % (symbolId, symbolId)]
+    for _ in range( rnd.randint( 1, 3)):
+        if rnd.random() < 0.4:
+            lines.append( '            <circle%s/>' % _Attributes(
+                fill=rnd.choice( layers), cx=_Num( rnd.uniform( -0.3, 0.3)), cy=_Num( rnd.uniform( -0.3, 0.3)),
+                r=_Num( rnd.uniform( 0.1, 0.5))))
+        else:
+            stroked = rnd.random() < 0.5
+            lines.append( '            <path%s/>' % _Attributes(
+                fill=None if stroked else rnd.choice( layers),
+                stroke=rnd.choice( layers) if stroked else None,
+                stroke_width=_Num( rnd.uniform( 0.08, 0.2)) if stroked else None,
+                d=_StarPath( rnd, params.pathComplexity, rnd.uniform( 0.3, 1.2))))
+    lines.append( '        </symbol>')
+    return lines
+
+
+def _LineSymbol( rnd, params, symbolId, layers):
+    lines = ['        <symbol type="line" id="%s" name="Line %s">' % (symbolId, symbolId)]
+    layer = rnd.choice( layers)
+    decorated = rnd.random() < params.decorationDensity
+    dashed = (not decorated) and (rnd.random() < 0.4)
+    lines.append( '            <path%s/>' % _Attributes(
+        stroke=layer, stroke_width=_Num( rnd.uniform( 0.1, 0.35)),
+        stroke_dasharray="%s,%s" % (_Num( rnd.uniform( 1.0, 3.0)), _Num( rnd.uniform( 0.2, 0.5))) if dashed else None))
+    if decorated:
+        kind = rnd.choice( ('regular', 'regular', 'dash-point', 'start-point', 'end-point'))
+        spacing = params.decorationSpacing * rnd.uniform( 0.75, 1.25)
+        lines.append( '            <stroke-decoration%s>' % _Attributes(
+            type=kind,
+            spacing=_Num( spacing) if kind == 'regular' else None,
+            offset=_Num( spacing / 2) if kind == 'regular' else None))
+        if rnd.random() < 0.5:
+            lines.append( '                <circle%s/>' % _Attributes( fill=layer, cx="0", cy="0",
+                                                                     r=_Num( rnd.uniform( 0.1, 0.25))))
+        else:
+            lines.append( '                <path%s/>' % _Attributes(
+                fill=layer, d=_StarPath( rnd, params.pathComplexity, rnd.uniform( 0.15, 0.4))))
+        lines.append( '            </stroke-decoration>')
+    lines.append( '        </symbol>')
+    return lines
+
+
+def _AreaSymbol( rnd, params, symbolId, layers):
+    lines = ['        <symbol type="area" id="%s" name="Area %s">' % (symbolId, symbolId)]
+    if rnd.random() < 0.7:
+        lines.append( '            <path%s/>' % _Attributes( fill=rnd.choice( layers)))
+    if rnd.random() < params.hatchDensity:
+        lines.append( '            <hatch%s/>' % _Attributes(
+            stroke=rnd.choice( layers), stroke_width=_Num( params.hatchSpacing / 3),
+            spacing=_Num( params.hatchSpacing), rotation=_Num( rnd.choice( (0, 30, 45, 90))),
+            stroke_dasharray="%s,%s" % (_Num( params.hatchSpacing * 3), _Num( params.hatchSpacing)) if rnd.random() < 0.3 else None))
+    if rnd.random() < params.patternDensity:
+        tile = params.patternTile
+        lines.append( '            <pattern%s>' % _Attributes(
+            x="0", y="0", width=_Num( tile), height=_Num( tile), rotation=_Num( rnd.choice( (0, 45))),
+            tiling=rnd.choice( ('regular', 'brick'))))
+        lines.append( '                <circle%s/>' % _Attributes(
+            fill=rnd.choice( layers), cx=_Num( tile / 2), cy=_Num( tile / 2), r=_Num( tile / 4)))
+        lines.append( '            </pattern>')
+    if rnd.random() < 0.5:
+        lines.append( '            <path%s/>' % _Attributes(
+            stroke=rnd.choice( layers), stroke_width=_Num( rnd.uniform( 0.08, 0.2))))
+    if len( lines) == 1:
+        lines.append( '            <path%s/>' % _Attributes( fill=rnd.choice( layers)))
+    lines.append( '        </symbol>')
+    return lines
+
+
+def GenerateSpec( params=None):
+    '''
+    Returns the XML text of a synthetic MSS file described by <params>, a
+    SyntheticSpecParams.
+    '''
+    params = params or SyntheticSpecParams()
+    rnd = random.Random( params.seed)
+
+    colorCount = max( 1, (params.layers + 1) // 2)
+    lines = ['<?xml version="1.0" encoding="utf-8"?>',
+             '<MapSymbolsSpec id="SYNTHETIC-%d" version="1" language="en">' % params.seed,
+             '    <BaseColors>']
+    for i in range( colorCount):
+        cmyk = ",".join( _Num( rnd.choice( (0, 0, 0.25, 0.5, 1))) for _ in range( 4))
+        lines.append( '        <color id="C%d" cmyk="%s"/>' % (i, cmyk))
+    lines.append( '    </BaseColors>')
+
+    lines.append( '    <ColorLayers>')
+    layers = []
+    for i in range( params.layers):
+        layerId = "L%d" % i
+        layers.append( layerId)
+        lines.append( '        <layer%s/>' % _Attributes(
+            id=layerId, color="C%d" % (i % colorCount),
+            tint=_Num( rnd.choice( (1, 1, 0.5, 0.3))),
+            overprint="yes" if rnd.random() < 0.2 else None))
+    lines.append( '    </ColorLayers>')
+
+    lines.append( '    <Symbols>')
+    makers = (_PointSymbol, _LineSymbol, _AreaSymbol)
+    for i in range( params.symbols):
+        symbolId = "%d.%d" % (100 + i // 10, i % 10)
+        lines.extend( makers[i % 3]( rnd, params, symbolId, layers))
+    lines.append( '    </Symbols>')
+    lines.append( '</MapSymbolsSpec>')
+    return "\n".join( lines) + "\n"
+
+
+def main( argv=None):
+    defaults = SyntheticSpecParams()
+    parser = argparse.ArgumentParser(
+        prog='mss-synthetic', description="Writes a synthetic Map Symbol Specification file.")
+    parser.add_argument( '-o', '--output', default='-', help="output file (default: stdout)")
+    for name in SyntheticSpecParams.__slots__:
+        value = getattr( defaults, name)
+        parser.add_argument( '--' + name, type=type( value), default=value,
+                             help="default: %(default)s")
+    args = parser.parse_args( argv)
+
+    params = SyntheticSpecParams( **{ name: getattr( args, name) for name in SyntheticSpecParams.__slots__})
+    text = GenerateSpec( params)
+    if args.output == '-':
+        sys.stdout.write( text)
+    else:
+        with open( args.output, 'w', encoding='utf-8') as f:
+            f.write( text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit( main())
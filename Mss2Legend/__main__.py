@@ -1,5 +1,6 @@
+import sys
 import mss2legend
 
 if __name__ == "__main__":
-    mss2legend.main()
-    
\ No newline at end of file
+    sys.exit( mss2legend.main())
+    
@@ -1,48 +1,427 @@
+import io
+import os
 import sys
-import xml.etree.ElementTree as ET
+import glob
+import time
+import logging
+import argparse
+import concurrent.futures
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from MSSLegendDrawing import *
-from MSSError import BailOut
-
-
-
-def main():
-    xmlFileName = "test-file.xml"
-    
-    xmlDom = ET.parse( xmlFileName)
-    
-    # check whether we have the correct element of the root of hte XML file
-    xmlRoot = xmlDom.getroot()
-    if (xmlRoot.tag != "MapSymbolsSpec"):
-        BailOut("Element <MapSymbolsSpec> not found")
-                
-    xmlBaseColors = xmlRoot.find("BaseColors")
-    if (xmlBaseColors == None):
-        BailOut("Element <BaseColors> not found")
-        
-    xmlColorLayers = xmlRoot.find("ColorLayers")
-    if (xmlColorLayers == None):
-        BailOut("Element <ColorLayers> not found")
-
-    xmlSymbols = xmlRoot.find("Symbols")
-    if (xmlSymbols == None):
-        BailOut("Element <Symbols> not found")
-
-    # pageSize is A4 in points
-    pdfFileName = "Legend.pdf"
-
-    theCanvas = canvas.Canvas( pdfFileName, pagesize=A4)
-    theCanvas.scale(mm, mm)
-    
-    legendDrawer = MSSLegendDrawer( theCanvas, xmlBaseColors, xmlColorLayers, xmlSymbols)
-    legendDrawer.DrawSymbols()
-    
-    theCanvas.showPage()
-
-    
-    theCanvas.save();
-    
-    print( "Done! Result printed to", pdfFileName)
-    
+from MSSSymbolModel import IterSpecs
+from MSSDisplayList import DisplayList, OptimizeDisplayList
+from MSSSvgCanvas import SvgCanvas
+from MSSRasterCanvas import RasterCanvas
+from MSSColorConvert import ConverterForSpec, LoadReferenceColors
+from MSSFragmentCache import FragmentCache, DefaultCacheDir
+from MSSError import MSSError, SpecErrors, SpecStructureError, PageError
+from MSSProfile import Profiler
+
+
+log = logging.getLogger( __name__)
+
+
+def RenderPage( spec, pageNo, pagesize=A4, fragmentCache=None, profiler=None):
+    '''
+    Draws page <pageNo> of the legend of the compiled <spec> into a
+    DisplayList of its own, recording the drawing in <profiler> if given
+    '''
+    displayList = DisplayList( pagesize)
+    displayList.scale( mm, mm)
+
+    legendDrawer = MSSLegendDrawer( displayList, spec, fragmentCache, profiler=profiler)
+    legendDrawer.DrawPage( pageNo)
+    displayList.showPage()
+    return displayList
+
+
+# the state of a page worker process, see _InitPageWorker()
+_pageWorker = {}
+
+def _InitPageWorker( spec, pagesize, cacheDir):
+    '''
+    Receives the compiled spec once per worker process
+    '''
+    _pageWorker['spec'] = spec
+    _pageWorker['pagesize'] = pagesize
+    _pageWorker['cache'] = FragmentCache( cacheDir) if cacheDir else None
+
+def _RenderPageJob( pageNo):
+    '''
+    Renders one page in a worker process, returns it serialized
+    '''
+    displayList = RenderPage( _pageWorker['spec'], pageNo,
+                              _pageWorker['pagesize'], _pageWorker['cache'])
+    return displayList.ToBytes()
+
+
+def MergePages( pages, pagesize=A4):
+    '''
+    Concatenates the page display lists <pages> into one. Pattern forms
+    drawn on several pages are kept once, on the first page using them;
+    fonts and graphics states are shared by the canvas the result is
+    replayed to.
+    '''
+    displayList = DisplayList( pagesize)
+    definedForms = set()
+    for page in pages:
+        page.Replay( displayList, definedForms)
+    return displayList
+
+
+def RenderLegend( spec, pagesize=A4, fragmentCache=None, jobs=1, profiler=None):
+    '''
+    Draws the legend of the compiled <spec> into a DisplayList, which can
+    then be written to any format with WriteLegend(). Symbols found in the
+    optional <fragmentCache> are not drawn again.
+
+    The layout is split into pages first. With <jobs> > 1 the pages are
+    drawn by that many worker processes, then merged in order. With a
+    <profiler> the pages are drawn by this process, so all are recorded.
+    '''
+    pageCount = MSSLegendDrawer( DisplayList( pagesize), spec).PageCount()
+    jobs = min( jobs, pageCount)
+
+    if (jobs <= 1) or (profiler is not None):
+        pages = [RenderPage( spec, pageNo, pagesize, fragmentCache, profiler) for pageNo in range( pageCount)]
+        if fragmentCache is not None:
+            log.info( "Symbol cache: %d hits, %d misses", fragmentCache.hits, fragmentCache.misses)
+    else:
+        cacheDir = fragmentCache.directory if fragmentCache is not None else None
+        with concurrent.futures.ProcessPoolExecutor( max_workers=jobs, initializer=_InitPageWorker,
+                                                     initargs=(spec, pagesize, cacheDir)) as executor:
+            pages = [DisplayList.FromBytes( data) for data in executor.map( _RenderPageJob, range( pageCount))]
+    log.info( "Drew %d pages", pageCount)
+
+    displayList = MergePages( pages, pagesize)
+    displayList, removed = OptimizeDisplayList( displayList)
+    log.info( "Optimized drawing, removed %d redundant operators", removed)
+    return displayList
+
+def WriteLegend( displayList, fileName, converter=None):
+    '''
+    Replays <displayList> into a PDF, SVG or PNG file, chosen by the extension of <fileName>.
+    The PDF is invariant: the same display list always gives the same bytes.
+    SVG and PNG colours are converted to RGB by <converter>, a ColorConverter.
+    '''
+    if fileName.lower().endswith( '.svg'):
+        theCanvas = SvgCanvas( fileName, displayList._pagesize, converter)
+    elif fileName.lower().endswith( '.png'):
+        theCanvas = RasterCanvas( fileName, displayList._pagesize, converter=converter)
+    else:
+        theCanvas = canvas.Canvas( fileName, pagesize=displayList._pagesize, invariant=1)
+    displayList.Replay( theCanvas)
+    theCanvas.save()
+
+
+def IterLoadSpecs( xmlFileName, allErrors=False, skipDescriptions=False):
+    '''
+    Reads the MSS file <xmlFileName> and yields each spec in it, compiled,
+    as soon as it is read. See MSSSymbolModel.IterSpecs().
+
+    Raises
+    ------
+    MSSError
+        The first error in the file. With <allErrors>, each spec is
+        checked in full, including the layout of the legend, and all the
+        errors found in it are raised together as SpecErrors.
+    '''
+    count = 0
+    errors = [] if allErrors else None
+    for spec in IterSpecs( xmlFileName, skipDescriptions, errors):
+        count += 1
+        if allErrors:
+            MSSLegendDrawer( DisplayList( A4), spec, errors=errors).GetSlots()
+            if errors:
+                raise SpecErrors( errors, xmlFileName)
+        yield spec
+    if count == 0:
+        raise SpecStructureError( "Element <MapSymbolsSpec> not found", fileName=xmlFileName)
+
+
+def LoadSpec( xmlFileName, allErrors=False, skipDescriptions=False):
+    '''
+    Reads and compiles the first spec of the MSS file <xmlFileName>, see
+    IterLoadSpecs()
+    '''
+    return next( IterLoadSpecs( xmlFileName, allErrors, skipDescriptions))
+
+
+def LegendBytes( displayList, fileFormat='pdf', pageNo=0, converter=None):
+    '''
+    Replays <displayList> into a PDF, SVG or PNG document in memory and
+    returns it as bytes. SVG and PNG have one document per page, <pageNo>
+    selects which, and their colours are converted by <converter>.
+    '''
+    if fileFormat == 'svg':
+        theCanvas = SvgCanvas( None, displayList._pagesize, converter)
+        displayList.Replay( theCanvas)
+        return theCanvas.Pages()[pageNo].encode( 'utf-8')
+    if fileFormat == 'png':
+        theCanvas = RasterCanvas( None, displayList._pagesize, converter=converter)
+        displayList.Replay( theCanvas)
+        return theCanvas.Pages()[pageNo]
+    if fileFormat != 'pdf':
+        raise ValueError( "Unknown format %s" % fileFormat)
+    buffer = io.BytesIO()
+    theCanvas = canvas.Canvas( buffer, pagesize=displayList._pagesize, invariant=1)
+    displayList.Replay( theCanvas)
+    theCanvas.save()
+    return buffer.getvalue()
+
+
+def RenderSymbol( spec, symbolId, fileFormat='pdf', fragmentCache=None, padding=2.0):
+    '''
+    Renders the graphical legend element of one symbol, without its name,
+    on a page just large enough for it, and returns the document as bytes.
+    This is the fast path for thumbnails: the symbol is found by its id,
+    and no other symbol is visited.
+
+    Parameters
+    ----------
+    spec : SymbolSpec
+    symbolId : string
+    fileFormat : string
+        'pdf', 'svg' or 'png'
+    fragmentCache : FragmentCache, optional
+    padding : float
+        The space around the legend element, in mm
+
+    Raises
+    ------
+    MSSError
+        Unknown symbol id
+    '''
+    symbol = spec.Select( ids=[symbolId])[0]
+    width = MSSLegendDrawer.legend_width + 2 * padding
+    height = MSSLegendDrawer.legend_height + 2 * padding
+    displayList = DisplayList( (width * mm, height * mm))
+    displayList.scale( mm, mm)
+
+    legendDrawer = MSSLegendDrawer( displayList, spec, fragmentCache)
+    legendDrawer.DrawSymbol( symbol, width / 2, height / 2)
+    displayList.showPage()
+
+    displayList, _ = OptimizeDisplayList( displayList)
+    converter = ConverterForSpec( spec) if fileFormat in ('svg', 'png') else None
+    return LegendBytes( displayList, fileFormat, converter=converter)
+
+
+def RenderSymbols( spec, ids=None, first=None, last=None, types=None, layers=None,
+                   fileFormat='pdf', fragmentCache=None, pageNo=0):
+    '''
+    Renders the legend of the symbols selected by SymbolSpec.Select() and
+    returns the document as bytes. With SVG and PNG, <pageNo> selects the page,
+    and the colours are converted by MSSColorConvert.ConverterForSpec().
+
+    Raises
+    ------
+    PageError
+        There is no page <pageNo> in the SVG or PNG legend
+    MSSError
+        Unknown symbol id or layer id
+    '''
+    subset = spec.Subset( spec.Select( ids, first, last, types, layers))
+    if fileFormat != 'pdf':
+        pageCount = MSSLegendDrawer( DisplayList( A4), subset).PageCount()
+        if not 0 <= pageNo < pageCount:
+            raise PageError( "No page %d, the pages are 0 to %d", (pageNo, pageCount - 1))
+    displayList = RenderLegend( subset, fragmentCache=fragmentCache)
+    converter = ConverterForSpec( spec) if fileFormat in ('svg', 'png') else None
+    return LegendBytes( displayList, fileFormat, pageNo, converter)
+
+
+def BundleOutputName( outFileName, specNo):
+    '''
+    Returns the output file name of spec number <specNo>, counting from 0,
+    of a bundle: <outFileName> for the first spec, with "-spec2", "-spec3"
+    and so on added before the extension for the others.
+    '''
+    if specNo == 0:
+        return outFileName
+    base, ext = os.path.splitext( outFileName)
+    return "%s-spec%d%s" % (base, specNo + 1, ext)
+
+
+def RenderFile( xmlFileName, outFileName, cacheDir=None, pageJobs=1, allErrors=False, skipDescriptions=False,
+                profileName=None, iccProfile=None, referenceColors=None):
+    '''
+    Renders the legend of the MSS file <xmlFileName> into <outFileName>,
+    using the fragment cache in <cacheDir> unless it is None, and
+    <pageJobs> processes to draw the pages. The specs of a bundle are
+    rendered one by one while the file is read, into the files named by
+    BundleOutputName(). See IterLoadSpecs() for <allErrors> and
+    <skipDescriptions>.
+
+    With <profileName>, the drawing is profiled and the profile written to
+    that file, see MSSProfile.Profiler.Save(), or printed if it is "-".
+
+    SVG and PNG colours are converted with the CMYK ICC profile file
+    <iccProfile>, and the reference colours of the calibrations in the
+    JSON file <referenceColors>, see MSSColorConvert.ConverterForSpec().
+    '''
+    fragmentCache = FragmentCache( cacheDir) if cacheDir else None
+    profiler = Profiler() if profileName else None
+    references = LoadReferenceColors( referenceColors) if referenceColors else None
+    for specNo, spec in enumerate( IterLoadSpecs( xmlFileName, allErrors, skipDescriptions)):
+        displayList = RenderLegend( spec, fragmentCache=fragmentCache, jobs=pageJobs, profiler=profiler)
+        fileName = BundleOutputName( outFileName, specNo)
+        converter = None
+        if not fileName.lower().endswith( '.pdf'):
+            converter = ConverterForSpec( spec, iccProfile, references)
+        WriteLegend( displayList, fileName, converter)
+    if profileName == '-':
+        print( profiler.Report())
+    elif profiler is not None:
+        profiler.Save( profileName)
+
+
+def _RenderJob( job):
+    '''
+    Runs RenderFile() for one (xmlFileName, outFileName, cacheDir, pageJobs,
+    allErrors, skipDescriptions, profileName, iccProfile, referenceColors)
+    job in a worker process. All errors are returned instead of raised, so
+    one bad file does not stop the batch.
+
+    Returns
+    -------
+    (xmlFileName, outFileName, error, seconds)
+        error is None on success, else the error message
+
+    '''
+    xmlFileName, outFileName = job[:2]
+    start = time.perf_counter()
+    error = None
+    try:
+        RenderFile( *job)
+    except MSSError as e:
+        error = str( e.AddContext( fileName=xmlFileName))
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    return xmlFileName, outFileName, error, time.perf_counter() - start
+
+
+def _RunJobs( jobs, workers):
+    '''
+    Runs _RenderJob() for all <jobs> on <workers> processes and yields
+    the results as the jobs finish. A job whose worker process died, or
+    that could not be sent to a worker, is reported as failed with the
+    exception raised by its future.
+    '''
+    if workers == 1:
+        yield from map( _RenderJob, jobs)
+        return
+    with concurrent.futures.ProcessPoolExecutor( max_workers=workers) as executor:
+        futures = {executor.submit( _RenderJob, job): job for job in jobs}
+        for future in concurrent.futures.as_completed( futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                job = futures[future]
+                result = (job[0], job[1], "%s: %s" % (type(e).__name__, e), 0.0)
+            yield result
+
+
+def ExpandInputs( patterns):
+    '''
+    Expands file names and glob patterns into a list of files, in the
+    order given and without duplicates. Names that match nothing are kept,
+    so they are reported as failing.
+    '''
+    result = []
+    for pattern in patterns:
+        names = sorted( glob.glob( pattern, recursive=True)) if glob.has_magic( pattern) else []
+        if not names:
+            names = [pattern]
+        for name in names:
+            if name not in result:
+                result.append( name)
+    return result
+
+
+def OutputName( template, xmlFileName, index):
+    '''
+    Expands the output file name <template> for one input file.
+    The placeholders are {dir}, {name} and {stem} of the input file, and
+    {index}, the number of the input file counting from 1.
+    '''
+    directory, name = os.path.split( xmlFileName)
+    stem = os.path.splitext( name)[0]
+    return template.format( dir=directory or '.', name=name, stem=stem, index=index)
+
+
+def main( argv=None):
+    parser = argparse.ArgumentParser(
+        prog='mss2legend',
+        description="Draws a legend of all the symbols of Map Symbol Specification files.")
+    parser.add_argument( 'inputs', nargs='*', metavar='MSS',
+                         help="MSS files or glob patterns (default: test-file.xml)")
+    parser.add_argument( '-o', '--output', metavar='TEMPLATE',
+                         help="output file name, the extension .pdf, .svg or .png gives the format. "
+                              "May use {dir}, {name}, {stem} and {index} of the input file "
+                              "(default: Legend.pdf for one input, else {dir}/{stem}.pdf)")
+    parser.add_argument( '-j', '--jobs', type=int, default=1, metavar='N',
+                         help="number of files rendered in parallel, 0 for one per CPU (default: 1)")
+    parser.add_argument( '--page-jobs', type=int, default=1, metavar='N',
+                         help="number of pages of each file drawn in parallel, 0 for one per CPU (default: 1)")
+    parser.add_argument( '--cache-dir', default=DefaultCacheDir(),
+                         help="directory of the symbol cache (default: %(default)s)")
+    parser.add_argument( '--no-cache', action='store_true',
+                         help="draw all symbols without using the symbol cache")
+    parser.add_argument( '--all-errors', action='store_true',
+                         help="check the whole file and report all errors, not only the first")
+    parser.add_argument( '--skip-descriptions', action='store_true',
+                         help="do not read the descriptions of the symbols")
+    parser.add_argument( '--profile', metavar='TEMPLATE',
+                         help="profile the drawing of each symbol and layer, and write a Chrome trace "
+                              "if the name ends with .json, else a report; - prints the report. "
+                              "May use the placeholders of --output")
+    parser.add_argument( '--icc-profile', metavar='FILE',
+                         help="CMYK ICC profile for the colours of SVG and PNG legends "
+                              "(default: a local profile named by the ICC or ISO calibrations, "
+                              "else a naive conversion)")
+    parser.add_argument( '--reference-colors', metavar='JSON',
+                         help="sRGB colours of PMS, RAL and NCS calibration values, "
+                              "as {standard: {value: \"#rrggbb\"}}, used for SVG and PNG legends")
+    parser.add_argument( '-v', '--verbose', action='count', default=0,
+                         help="log progress, twice to log every layer and symbol")
+    args = parser.parse_args( argv)
+
+    logging.basicConfig( format="%(levelname)s: %(message)s",
+                         level=(logging.WARNING, logging.INFO, logging.DEBUG)[min( args.verbose, 2)])
+
+    inputs = ExpandInputs( args.inputs or ["test-file.xml"])
+    if not inputs:
+        parser.error( "no input files")
+    template = args.output
+    if template is None:
+        template = "Legend.pdf" if len(inputs) == 1 else "{dir}/{stem}.pdf"
+    outputs = [OutputName( template, name, i + 1) for i, name in enumerate( inputs)]
+    if len( set( outputs)) != len( outputs):
+        parser.error( "the output template gives the same file name for several inputs")
+
+    cacheDir = None if args.no_cache else args.cache_dir
+    pageJobs = args.page_jobs if args.page_jobs > 0 else (os.cpu_count() or 1)
+    profiles = [None] * len( inputs)
+    if args.profile:
+        profiles = [OutputName( args.profile, name, i + 1) for i, name in enumerate( inputs)]
+    jobs = [(name, out, cacheDir, pageJobs, args.all_errors, args.skip_descriptions, profile,
+             args.icc_profile, args.reference_colors)
+            for name, out, profile in zip( inputs, outputs, profiles)]
+    workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    workers = min( workers, len(jobs))
+
+    failures = 0
+    for done, (xmlFileName, outFileName, error, seconds) in enumerate( _RunJobs( jobs, workers), 1):
+        if error is None:
+            print( "[%d/%d] %s -> %s (%.2f s)" % (done, len(jobs), xmlFileName, outFileName, seconds))
+        else:
+            failures += 1
+            print( "[%d/%d] FAILED %s" % (done, len(jobs), xmlFileName))
+            for line in error.splitlines():
+                print( "    " + line)
+
+    print( "Done!", len(jobs) - failures, "of", len(jobs), "legends written")
+    return 1 if failures else 0
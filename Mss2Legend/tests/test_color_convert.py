@@ -0,0 +1,43 @@
+import pytest
+import MSSColorConvert
+from MSSColorConvert import ConverterForSpec, DefaultConverter
+from MSSSymbolModel import BaseColor, ColorLayer
+from MSSColor import ColorTable
+from MSSError import ColorError
+
+
+class _Spec(object):
+    def __init__( self, calibrations):
+        color = BaseColor( 'BROWN', (0.25, 0.75, 1.0, 0.0), calibrations)
+        self.baseColors = (color,)
+        self.colorLayers = (ColorLayer( 'brown', 'Brown', color, tint=0.5),)
+        self.colors = ColorTable( self.colorLayers)
+
+
+@pytest.fixture
+def badProfile( tmp_path, monkeypatch):
+    fileName = tmp_path / 'Coated Test.icc'
+    fileName.write_bytes( b'not a profile')
+    monkeypatch.setattr( MSSColorConvert, 'PROFILE_DIRS', (str( tmp_path),))
+    return str( fileName)
+
+
+def test_naive_without_calibrations():
+    assert ConverterForSpec( _Spec( ())) is DefaultConverter()
+    assert DefaultConverter().Hex( 0.25, 0.75, 1.0, 0.0) == '#bf4000'
+
+
+def test_unusable_found_profile_falls_back( badProfile):
+    spec = _Spec( (('ICC', 'Coated Test'),))
+    assert MSSColorConvert.FindProfile( spec) == badProfile
+    assert ConverterForSpec( spec) is DefaultConverter()
+
+    references = { 'PMS': { 'PANTONE 7608 CP': (0.6, 0.2, 0.0)}}
+    spec = _Spec( (('ICC', 'Coated Test'), ('PMS', 'PANTONE 7608 CP')))
+    converter = ConverterForSpec( spec, referenceColors=references)
+    assert converter.Hex( *spec.colors['brown'].cmyk) == '#cc9980'
+
+
+def test_unusable_given_profile_fails( badProfile):
+    with pytest.raises( ColorError):
+        ConverterForSpec( _Spec( ()), profile=badProfile)
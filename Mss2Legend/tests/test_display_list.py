@@ -0,0 +1,59 @@
+import os
+import numpy as np
+import pytest
+import mss2legend
+from MSSSymbolModel import IterSpecs
+from MSSLegendDrawing import MSSLegendDrawer
+from MSSDisplayList import DisplayList, OptimizeDisplayList
+from MSSRasterCanvas import RasterCanvas
+from MSSSyntheticSpec import SyntheticSpecParams, GenerateSpec
+
+
+TEST_FILE = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__))), 'test-file.xml')
+
+
+def _Pages( displayList):
+    theCanvas = RasterCanvas( None, displayList._pagesize, dpi=72)
+    pages = []
+    showPage = theCanvas.showPage
+    def Grab():
+        pages.append( theCanvas.PageCmyk().copy())
+        showPage()
+    theCanvas.showPage = Grab
+    displayList.Replay( theCanvas)
+    return pages
+
+
+def _Merged( spec):
+    pageCount = MSSLegendDrawer( DisplayList( mss2legend.A4), spec).PageCount()
+    return mss2legend.MergePages( [mss2legend.RenderPage( spec, pageNo) for pageNo in range( pageCount)])
+
+
+@pytest.fixture( params=['test-file', 'synthetic'])
+def spec( request, tmp_path):
+    fileName = TEST_FILE
+    if request.param == 'synthetic':
+        fileName = str( tmp_path / 'synthetic.xml')
+        with open( fileName, 'w', encoding='utf-8') as f:
+            f.write( GenerateSpec( SyntheticSpecParams( symbols=90, decorationDensity=0.5, hatchDensity=0.5)))
+    return next( IterSpecs( fileName))
+
+
+def test_optimizer_keeps_the_drawing( spec):
+    merged = _Merged( spec)
+    optimized, removed = OptimizeDisplayList( merged)
+    assert removed > 0
+    assert len( optimized) == len( merged) - removed
+
+    before = _Pages( merged)
+    after = _Pages( optimized)
+    assert len( before) == len( after)
+    for a, b in zip( before, after):
+        assert a.any()
+        np.testing.assert_allclose( a, b, atol=1e-5)
+
+
+def test_optimizer_shrinks_the_pdf( spec):
+    merged = _Merged( spec)
+    optimized, _ = OptimizeDisplayList( merged)
+    assert len( mss2legend.LegendBytes( optimized)) < len( mss2legend.LegendBytes( merged))
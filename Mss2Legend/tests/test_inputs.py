@@ -0,0 +1,10 @@
+import mss2legend
+
+
+def test_expand_inputs_keeps_unmatched( tmp_path):
+    (tmp_path / 'a.xml').write_text( '')
+    (tmp_path / 'b.xml').write_text( '')
+    pattern = str( tmp_path / '*.xml')
+    missing = str( tmp_path / 'nomatch*.xml')
+    assert mss2legend.ExpandInputs( [pattern, missing, pattern]) == \
+        [str( tmp_path / 'a.xml'), str( tmp_path / 'b.xml'), missing]
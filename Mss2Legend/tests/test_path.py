@@ -0,0 +1,54 @@
+import pytest
+from MSSPath import CompileSvgPath, PATH_MOVETO, PATH_LINETO, PATH_CURVETO, PATH_CLOSE
+from MSSError import PathDataError
+
+
+def test_numbers_without_separators():
+    ir = CompileSvgPath( 'M1.5.5L2e1-3')
+    assert bytes( ir.ops) == bytes( (PATH_MOVETO, PATH_LINETO))
+    assert list( ir.coords) == [1.5, 0.5, 20.0, -3.0]
+
+
+def test_relative_and_implicit_lineto():
+    ir = CompileSvgPath( 'm 1 1 2 0 v 2 h -2 z')
+    assert bytes( ir.ops) == bytes( (PATH_MOVETO, PATH_LINETO, PATH_LINETO, PATH_LINETO, PATH_CLOSE))
+    assert list( ir.coords) == [1, 1, 3, 1, 3, 3, 1, 3]
+
+
+def test_curve():
+    ir = CompileSvgPath( 'M0 0c1 0 2 1 2 2')
+    assert bytes( ir.ops) == bytes( (PATH_MOVETO, PATH_CURVETO))
+    assert list( ir.coords) == [0, 0, 1, 0, 2, 1, 2, 2]
+
+
+@pytest.mark.parametrize( 'd', [
+    'M0 0 A 1 1 0 0 1 2 2',     # arcs are not supported
+    'M0 0 Q 1 1 2 2',
+    'M0 0 L 1',                 # odd number of coordinates
+    'M0 0 C 1 1 2 2 3',
+    'M0 0 L',
+    '1 2 M 0 0 L 1 1',          # coordinates before the first command
+    '1 2',
+])
+def test_bad_path_data( d):
+    with pytest.raises( PathDataError):
+        CompileSvgPath( d)
+
+
+def test_replay_without_code_append():
+    from reportlab.pdfgen.pathobject import PDFPathObject
+
+    class PublicPath:
+        # A reportlab path without the internal _code_append()
+        def __init__( self):
+            self._path = PDFPathObject()
+            for name in ('moveTo', 'lineTo', 'curveTo', 'close', 'getCode'):
+                setattr( self, name, getattr( self._path, name))
+
+    ir = CompileSvgPath( 'M0 0' + 'l1 0c0 1 1 1 1 0' * 20 + 'z')
+    bulk, public = PDFPathObject(), PublicPath()
+    ir.Replay( bulk)
+    ir.Replay( public)
+    def Tokens( code):
+        return [t if t.isalpha() else float( t) for t in code.split()]
+    assert Tokens( public.getCode()) == Tokens( bulk.getCode())
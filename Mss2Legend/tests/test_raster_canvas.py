@@ -0,0 +1,36 @@
+import numpy as np
+from MSSRasterCanvas import RasterCanvas
+
+
+def test_forms_are_recorded_not_drawn():
+    theCanvas = RasterCanvas( None, (100, 100), dpi=72)
+    theCanvas.setFillColorCMYK( 0, 0, 0, 1)
+    theCanvas.beginForm( 'outer', 0, 0, 100, 100)
+    theCanvas.rect( 0, 0, 10, 10, stroke=0, fill=1)
+    theCanvas.beginForm( 'inner', 0, 0, 100, 100)
+    theCanvas.circle( 50, 50, 5, stroke=0, fill=1)
+    theCanvas.endForm()
+    theCanvas.rect( 20, 0, 10, 10, stroke=0, fill=1)
+    theCanvas.endForm()
+    assert not theCanvas.PageCmyk().any()
+
+    theCanvas.doForm( 'outer')
+    page = theCanvas.PageCmyk()
+    assert page[95, 5, 3] == 1      # the rectangles of the outer form
+    assert page[95, 25, 3] == 1
+    assert page[50, 50, 3] == 0     # the inner form is only defined
+
+    theCanvas.doForm( 'inner')
+    assert theCanvas.PageCmyk()[50, 50, 3] == 1
+
+
+def test_form_defined_across_pages():
+    theCanvas = RasterCanvas( None, (100, 100), dpi=72)
+    theCanvas.beginForm( 'tile', 0, 0, 100, 100)
+    theCanvas.setFillColorCMYK( 1, 0, 0, 0)
+    theCanvas.rect( 0, 0, 100, 100, stroke=0, fill=1)
+    theCanvas.endForm()
+    theCanvas.showPage()
+    theCanvas.doForm( 'tile')
+    assert np.all( theCanvas.PageCmyk()[..., 0] == 1)
+    assert len( theCanvas.Pages()) == 2
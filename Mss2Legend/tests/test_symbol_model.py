@@ -0,0 +1,43 @@
+import pytest
+from MSSSymbolModel import IterSpecs
+from MSSError import SymbolError
+
+
+SPEC = '''<?xml version="1.0" encoding="utf-8"?>
+<MapSymbolsSpec id="T" version="1" language="en">
+    <BaseColors><color id="K" cmyk="0,0,0,1"/></BaseColors>
+    <ColorLayers><layer id="k" color="K"/></ColorLayers>
+    <Symbols>
+        <symbol type="%s" id="1" name="One">%s</symbol>
+    </Symbols>
+</MapSymbolsSpec>
+'''
+
+
+def _Compile( tmp_path, kind, parts, errors=None):
+    fileName = tmp_path / 'spec.xml'
+    fileName.write_text( SPEC % (kind, parts))
+    return list( IterSpecs( str( fileName), errors=errors))
+
+
+@pytest.mark.parametrize( 'kind, parts, message', [
+    ('line', '<path stroke="k" stroke-width="0.1"/><stroke-decoration type="regular" offset="1">'
+             '<circle fill="k" r="0.2"/></stroke-decoration>', 'no spacing'),
+    ('line', '<path stroke="k" stroke-width="0.1"/><stroke-decoration type="regular" spacing="0" offset="1">'
+             '<circle fill="k" r="0.2"/></stroke-decoration>', 'greater than 0'),
+    ('area', '<hatch stroke="k" stroke-width="0.1"/>', 'no spacing'),
+    ('area', '<hatch stroke="k" stroke-width="0.1" spacing="-1"/>', 'greater than 0'),
+    ('area', '<pattern x="0" y="0" width="1"><circle fill="k" r="0.2"/></pattern>', 'no height'),
+    ('area', '<pattern x="0" y="0" width="0" height="1"><circle fill="k" r="0.2"/></pattern>', 'greater than 0'),
+])
+def test_missing_spacing_is_a_symbol_error( tmp_path, kind, parts, message):
+    with pytest.raises( SymbolError) as info:
+        _Compile( tmp_path, kind, parts)
+    assert message in str( info.value)
+    assert info.value.symbolId == '1'
+
+
+def test_point_decorations_need_no_spacing( tmp_path):
+    spec, = _Compile( tmp_path, 'line', '<path stroke="k" stroke-width="0.1"/><stroke-decoration type="end-point">'
+                                        '<circle fill="k" r="0.2"/></stroke-decoration>')
+    assert spec.symbols[0].parts[1].spacing is None